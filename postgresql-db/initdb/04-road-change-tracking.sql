@@ -0,0 +1,15 @@
+-- Track when each road last changed. The API compares COUNT(*) and MAX(updated_at)
+-- against its on-disk road graph snapshot to decide whether the snapshot is stale.
+ALTER TABLE roads ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_roads_updated_at ON roads;
+CREATE TRIGGER trg_roads_updated_at
+    BEFORE UPDATE ON roads
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
@@ -0,0 +1,4 @@
+-- Store the road segments (road ids and lengths, in travel order) computed when a route is
+-- planned, so route history can describe the route without searching the road graph again.
+-- Rows saved before this column existed are filled in by the API the first time they are read.
+ALTER TABLE routes ADD COLUMN IF NOT EXISTS road_segments JSONB;
@@ -0,0 +1,14 @@
+-- Temporary traffic penalties and closures per road. Every API worker polls the unexpired rows
+-- and scales route costs by them without rebuilding its road graph; a closed road is not routed
+-- over at all. Rows stop applying at expires_at and can be deleted at any time.
+CREATE TABLE IF NOT EXISTS road_overlays (
+    road_id UUID PRIMARY KEY REFERENCES roads(id) ON DELETE CASCADE,
+    factor DOUBLE PRECISION NOT NULL DEFAULT 1 CHECK (factor >= 1),
+    closed BOOLEAN NOT NULL DEFAULT false,
+    reason TEXT,
+    expires_at TIMESTAMP NOT NULL,
+    created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_road_overlays_expires ON road_overlays (expires_at);
@@ -0,0 +1,6 @@
+-- Keep each user's own start and end points with their history row. A routes row now holds only
+-- the road part of a route, between the points where the user's points meet the road network,
+-- and is shared by every user whose points snap there. Rows saved before these columns existed
+-- keep the whole route, user points included, in the routes row.
+ALTER TABLE user_route_history ADD COLUMN IF NOT EXISTS start_loc GEOGRAPHY(POINT, 4326);
+ALTER TABLE user_route_history ADD COLUMN IF NOT EXISTS end_loc GEOGRAPHY(POINT, 4326);
@@ -1,17 +1,36 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context, Response, stream_with_context
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from geopy.distance import great_circle
+import numpy as np
 import os
+import sys
 import uuid
 import math
+import heapq
 import json
 from dotenv import load_dotenv
 import datetime
+import threading
+import time
 from functools import wraps
+from array import array
 import re
+import mmap
+import struct
+import copy
+import fcntl
+import tempfile
+import atexit
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from collections import OrderedDict
 
 # Load environment variables
 load_dotenv()
@@ -31,20 +50,199 @@ CORS(app,
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
 jwt = JWTManager(app)
 
+# Database connection pool
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT_S = float(os.environ.get('DB_POOL_TIMEOUT_S', '10'))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_PING_AFTER_S = float(os.environ.get('DB_POOL_PING_AFTER_S', '30'))
+
+class ConnectionPool:
+    """Thread-safe pool of database connections for one process.
+
+    ThreadedConnectionPool raises as soon as it is exhausted, so checkouts are gated by a
+    semaphore and wait up to timeout_s instead. Connections that were closed, or that fail a
+    ping after sitting idle, are discarded and replaced. Counters for /health show saturation.
+    """
+    def __init__(self, minconn, maxconn, timeout_s=DB_POOL_TIMEOUT_S, ping_after_s=DB_POOL_PING_AFTER_S):
+        self.maxconn = maxconn
+        self.timeout_s = timeout_s
+        self.ping_after_s = ping_after_s
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn,
+            host=os.environ.get('DB_HOST'),
+            database=os.environ.get('DB_NAME'),
+            user=os.environ.get('DB_USER'),
+            password=os.environ.get('DB_PASSWORD'),
+            port=os.environ.get('DB_PORT')
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.discarded = 0
+
+    def acquire(self):
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waits += 1
+            if not self._slots.acquire(timeout=self.timeout_s):
+                with self._lock:
+                    self.timeouts += 1
+                raise psycopg2.pool.PoolError(
+                    f"No database connection free after {self.timeout_s}s ({self.maxconn} in use)"
+                )
+        try:
+            conn = self._healthy_connection()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.checkouts += 1
+            self.wait_seconds += time.monotonic() - started
+        return conn
+
+    def _healthy_connection(self):
+        # A dead connection is replaced by a fresh one, so this settles within two attempts
+        for _ in range(2):
+            conn = self._pool.getconn()
+            idle_s = time.monotonic() - self._last_used.get(id(conn), time.monotonic())
+            if not conn.closed and (idle_s < self.ping_after_s or self._ping(conn)):
+                return conn
+            self._discard(conn)
+        return self._pool.getconn()
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+        with self._lock:
+            self.discarded += 1
+
+    def release(self, conn):
+        """Return a connection, rolling back whatever the borrower left uncommitted"""
+        try:
+            if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max": self.maxconn,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "saturation": self.in_use / self.maxconn,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "avg_wait_ms": self.wait_seconds / self.checkouts * 1000 if self.checkouts else 0.0,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded
+            }
+
+class PooledConnection:
+    """A pooled connection whose close() hands it back to the pool instead of disconnecting"""
+    def __init__(self, conn, on_close):
+        self._conn = conn
+        self._on_close = on_close
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close(self._conn)
+
+_db_pool = None
+_db_pool_pid = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    """The pool of this process, created on first use; forked workers never share connections"""
+    global _db_pool, _db_pool_pid
+    if _db_pool_pid != os.getpid():
+        with _db_pool_lock:
+            if _db_pool_pid != os.getpid():
+                # Connections inherited from a parent process are left alone, not closed
+                _db_pool = ConnectionPool(DB_POOL_MIN, DB_POOL_MAX)
+                _db_pool_pid = os.getpid()
+    return _db_pool
+
+def _close_request_connection(conn):
+    g.db_depth -= 1
+    # Closing discards uncommitted work as a real close would, except for nested users
+    if g.db_depth == 0 and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+
 # Database connection function
 def get_db_connection():
-    return psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT')
-    )
+    """A pooled connection; within a request every call shares one connection until teardown"""
+    pool = get_db_pool()
+    if not has_request_context():
+        return PooledConnection(pool.acquire(), pool.release)
+
+    if 'db_conn' not in g:
+        g.db_conn = pool.acquire()
+        g.db_depth = 0
+    g.db_depth += 1
+    return PooledConnection(g.db_conn, _close_request_connection)
+
+@app.teardown_request
+def release_db_connection(exc):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_db_pool().release(conn)
 
 # Helper functions
+EARTH_RADIUS_M = 6371009.0
+
 def calculate_distance(point1, point2):
     return great_circle((point1[1], point1[0]), (point2[1], point2[0])).meters
 
+def haversine_distance(point1, point2):
+    """Great-circle distance in meters on geopy's mean earth radius, cheap enough for search loops"""
+    lon1, lat1 = math.radians(point1[0]), math.radians(point1[1])
+    lon2, lat2 = math.radians(point2[0]), math.radians(point2[1])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+def haversine_distances(point, lon, lat):
+    """haversine_distance from point to every (lon[i], lat[i]) at once, as a NumPy array"""
+    lon1, lat1 = math.radians(point[0]), math.radians(point[1])
+    lon2, lat2 = np.radians(lon), np.radians(lat)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
 def extract_coordinates_from_wkt(wkt_string):
     """Extract coordinates from a WKT point string"""
     if not wkt_string:
@@ -67,217 +265,2826 @@ def safe_extract_coordinates(item, prefix):
         return (float(item[lon_key]), float(item[lat_key]))
     return None
 
+# Seconds an admin flag read from the database is trusted before it is checked again
+ADMIN_CACHE_TTL_S = float(os.environ.get('ADMIN_CACHE_TTL_S', '60'))
+
+class AdminCache:
+    """Per-process TTL cache of users.is_admin, so admin calls rarely touch the database.
+
+    A token's is_admin claim is the flag as read at login, so it counts as a reading taken at the
+    token's iat; whichever of the claim and this worker's own reading is newer is trusted for
+    ttl_s seconds (wall clock, like iat).
+    """
+    def __init__(self, ttl_s=ADMIN_CACHE_TTL_S):
+        self.ttl_s = ttl_s
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, claim=None, issued_at=None):
+        """The newest known flag, or None when unknown or older than ttl_s"""
+        entry = self._entries.get(user_id)
+        if claim is not None and issued_at is not None and (entry is None or issued_at > entry[1]):
+            entry = (bool(claim), issued_at)
+        if entry is None or entry[1] + self.ttl_s < time.time():
+            return None
+        return entry[0]
+
+    def set(self, user_id, is_admin):
+        with self._lock:
+            self._entries[user_id] = (bool(is_admin), time.time())
+
+admin_cache = AdminCache()
+
 def admin_required(fn):
-    """Decorator to require admin privileges"""
+    """Decorator to require admin privileges
+
+    The token's is_admin claim is trusted for ADMIN_CACHE_TTL_S after login, after which
+    users.is_admin is read again at most once per that window per user, so granting or revoking it
+    takes effect within the window; a grant made through this worker, or seen by a fresh login,
+    takes effect at once.
+    """
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
         user_id = get_jwt_identity()
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute("SELECT is_admin FROM users WHERE id = %s;", (user_id,))
-            user = cur.fetchone()
-            if not user or not user[0]:
-                return jsonify({"is_success": False, "msg": "Admin access required"}), 403
-        finally:
-            cur.close()
-            conn.close()
+        claims = get_jwt()
+        is_admin = admin_cache.get(user_id, claims.get('is_admin'), claims.get('iat'))
+        if is_admin is None:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT is_admin FROM users WHERE id = %s;", (user_id,))
+                user = cur.fetchone()
+                is_admin = bool(user and user[0])
+                admin_cache.set(user_id, is_admin)
+            finally:
+                cur.close()
+                conn.close()
+        if not is_admin:
+            return jsonify({"is_success": False, "msg": "Admin access required"}), 403
         return fn(*args, **kwargs)
     return wrapper
 
-# Graph class for route planning
-class RoadGraph:
-    def __init__(self):
-        self.nodes = {}
-        self.edges = {}
-        self.build_graph()
-        
-    def build_graph(self):
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+# Road network settings
+GRAPH_SNAP_TOLERANCE_M = float(os.environ.get('GRAPH_SNAP_TOLERANCE_M', '1.0'))
+METERS_PER_DEGREE_LAT = 111320.0
+# Cell size of the grid used to find the nodes nearest to a route endpoint
+GRAPH_INDEX_CELL_M = float(os.environ.get('GRAPH_INDEX_CELL_M', '200'))
+# Seconds before a worker reloads locations edited through another worker; 0 keeps them until restart
+LOCATION_INDEX_TTL_S = float(os.environ.get('LOCATION_INDEX_TTL_S', '60'))
+# Locations within this distance of a route are listed in its step_locations
+STEP_LOCATION_RADIUS_M = float(os.environ.get('STEP_LOCATION_RADIUS_M', '500'))
 
-        def get_or_create_node(coord, node_map, threshold=0.001): 
-            for existing in node_map:
-                if calculate_distance(coord, existing) < threshold:
-                    return existing
-            return coord
+# Contraction hierarchies: shortcut-based preprocessing that makes shortest-route queries much faster
+GRAPH_CH_ENABLED = os.environ.get('GRAPH_CH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+CH_WITNESS_SETTLE_LIMIT = int(os.environ.get('CH_WITNESS_SETTLE_LIMIT', '60'))
 
-        self.nodes = {}
-        self.edges = {}
+# Binary snapshot of the built graph, memory-mapped by new workers instead of rebuilding
+GRAPH_SNAPSHOT_PATH = os.environ.get(
+    'GRAPH_SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'road_graph.snapshot')
+)
+SNAPSHOT_MAGIC = b'MRGS'
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_PREAMBLE = struct.Struct('<4sII')
 
-        cur.execute("SELECT id, ST_AsText(geom) AS wkt, length_m, is_oneway FROM roads;")
-        roads = cur.fetchall()
+# Share one copy of the graph between gunicorn workers and pick up rebuilds from any of them
+GRAPH_SHARED_MEMORY = os.environ.get('GRAPH_SHARED_MEMORY', 'false').lower() in ('1', 'true', 'yes')
+GRAPH_SHARED_MEMORY_NAME = os.environ.get('GRAPH_SHARED_MEMORY_NAME', 'maubin_road_graph')
+GRAPH_SHARED_MEMORY_DIR = os.environ.get(
+    'GRAPH_SHARED_MEMORY_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+)
 
-        for road in roads:
-            road_id = road['id']
-            wkt = road['wkt']
-            segment_lengths = road['length_m']  
-            is_oneway = road['is_oneway']
-
-            coords_str = wkt.replace('LINESTRING(', '').replace(')', '')
-            coords_list = [tuple(map(float, c.split())) for c in coords_str.split(',')]
-
-            snapped_coords = []
-            for coord in coords_list:
-                snapped = get_or_create_node(coord, self.nodes)
-                if snapped not in self.nodes:
-                    self.nodes[snapped] = []
-                snapped_coords.append(snapped)
-
-            for i in range(len(snapped_coords) - 1):
-                start_node = snapped_coords[i]
-                end_node = snapped_coords[i + 1]
-
-                segment_length = segment_lengths[i] if segment_lengths and i < len(segment_lengths) else calculate_distance(start_node, end_node)
-
-                self.nodes[start_node].append(end_node)
-                self.edges[(start_node, end_node)] = {
-                    'id': road_id,
-                    'length': segment_length,
-                    'geometry': [start_node, end_node]
-                }
+# Speed assumed for roads without a road_type, the legs to and from the road network and matrix
+# and isochrone times
+AVERAGE_SPEED_MPS = 5.0
+# Most points accepted on each side of POST /routes/matrix
+MATRIX_MAX_POINTS = int(os.environ.get('MATRIX_MAX_POINTS', '200'))
 
-                if not is_oneway:
-                    self.nodes[end_node].append(start_node)
-                    self.edges[(end_node, start_node)] = {
-                        'id': road_id,
-                        'length': segment_length,
-                        'geometry': [end_node, start_node]
-                    }
-
-        app.logger.info(f"Road graph built with {len(self.nodes)} nodes and {len(self.edges)} edges")
-        cur.close()
-        conn.close()
+# POST /routes/batch: most pairs per request, search processes and pairs sent to a process at once
+BATCH_MAX_PAIRS = int(os.environ.get('BATCH_MAX_PAIRS', '1000'))
+BATCH_PROCESSES = int(os.environ.get('BATCH_PROCESSES', str(min(4, os.cpu_count() or 1))))
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', '16'))
 
-    def find_nearest_node(self, point):
-        max_distance = 500  
-        nearest_node = None
-        min_distance = float('inf')
-        
-        for node in self.nodes.keys():
-            distance = calculate_distance(point, node)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_node = node
-                
-        if min_distance > max_distance:
-            app.logger.warning(f"No nearby node found within {max_distance}m for point {point}")
+# Largest budget GET /isochrone searches, in meters, and how tightly its hulls wrap (1 = convex)
+ISOCHRONE_MAX_DISTANCE_M = float(os.environ.get('ISOCHRONE_MAX_DISTANCE_M', '20000'))
+ISOCHRONE_CONCAVITY = float(os.environ.get('ISOCHRONE_CONCAVITY', '0.8'))
+
+# Cached route searches per worker; 0 disables the cache
+ROUTE_CACHE_SIZE = int(os.environ.get('ROUTE_CACHE_SIZE', '1024'))
+ROUTE_CACHE_TTL_S = float(os.environ.get('ROUTE_CACHE_TTL_S', '600'))
+
+# Seconds between each worker's checks of the road_overlays table for traffic penalties and closures
+ROAD_OVERLAY_POLL_S = float(os.environ.get('ROAD_OVERLAY_POLL_S', '5'))
+# Longest wait between polls while the road_overlays table does not exist yet
+ROAD_OVERLAY_MISSING_POLL_S = 300.0
+
+# Planned routes are saved by a background writer in batches; a full queue falls back to writing inline
+ROUTE_WRITE_QUEUE_SIZE = int(os.environ.get('ROUTE_WRITE_QUEUE_SIZE', '1000'))
+ROUTE_WRITE_BATCH_SIZE = int(os.environ.get('ROUTE_WRITE_BATCH_SIZE', '200'))
+ROUTE_WRITE_INTERVAL_S = float(os.environ.get('ROUTE_WRITE_INTERVAL_S', '0.5'))
+
+# Values accepted in the `algorithm` field of POST /routes
+ROUTE_ALGORITHMS = ('dijkstra', 'astar', 'bidirectional', 'ch')
+
+# Travel speeds (m/s) by road_type behind estimated times and the fastest profile
+ROAD_SPEEDS_MPS = {
+    'highway': 16.7,
+    'local': 11.1,
+    'residential': 8.3,
+    'service': 5.6,
+    'pedestrian': 1.4,
+}
+WALKING_SPEED_MPS = 1.4
+# avoid_highway counts every meter of highway as this many meters
+HIGHWAY_AVOID_FACTOR = 5.0
+
+class NodeSnapper:
+    """Spatial hash that merges road vertices closer than a tolerance into one numbered node"""
+    def __init__(self, tolerance_m=GRAPH_SNAP_TOLERANCE_M):
+        self.tolerance_m = tolerance_m
+        # Cells are at least one tolerance wide, so every match lies in a neighbouring cell
+        self.cell_deg = max(tolerance_m, 0.001) / METERS_PER_DEGREE_LAT
+        self.cells = {}
+        self.lon = array('d')
+        self.lat = array('d')
+
+    @classmethod
+    def from_coordinates(cls, lon, lat, tolerance_m=GRAPH_SNAP_TOLERANCE_M):
+        """Rebuild the grid over existing nodes, keeping their ids"""
+        snapper = cls(tolerance_m)
+        snapper.lon = array('d', lon)
+        snapper.lat = array('d', lat)
+        for node in range(len(snapper.lon)):
+            snapper.cells.setdefault(snapper._cell((snapper.lon[node], snapper.lat[node])), []).append(node)
+        return snapper
+
+    def _cell(self, coord):
+        return (math.floor(coord[0] / self.cell_deg), math.floor(coord[1] / self.cell_deg))
+
+    def snap(self, coord):
+        """Return the id of the node within tolerance of coord, creating a new node if there is none"""
+        cx, cy = self._cell(coord)
+        # A degree of longitude shrinks with latitude, so widen the search in x accordingly
+        cos_lat = max(math.cos(math.radians(coord[1])), 0.01)
+        span_x = math.ceil(1 / cos_lat)
+
+        nearest = None
+        min_distance = self.tolerance_m
+        for dx in range(-span_x, span_x + 1):
+            for dy in (-1, 0, 1):
+                for node in self.cells.get((cx + dx, cy + dy), ()):
+                    distance = calculate_distance(coord, (self.lon[node], self.lat[node]))
+                    if distance <= min_distance:
+                        min_distance = distance
+                        nearest = node
+
+        if nearest is not None:
+            return nearest
+
+        node = len(self.lon)
+        self.lon.append(coord[0])
+        self.lat.append(coord[1])
+        self.cells.setdefault((cx, cy), []).append(node)
+        return node
+
+def build_csr(count, keys):
+    """Counting sort of item indices by key; returns (offsets, order) so items of key k are
+    order[offsets[k]:offsets[k + 1]]"""
+    offsets = array('i', bytes(4 * (count + 1)))
+    for key in keys:
+        offsets[key + 1] += 1
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+
+    position = array('i', offsets[:-1])
+    order = array('i', bytes(4 * len(keys)))
+    for item, key in enumerate(keys):
+        order[position[key]] = item
+        position[key] += 1
+    return offsets, order
+
+def array_nbytes(values):
+    return values.itemsize * len(values)
+
+class GridIndex:
+    """Uniform grid of items (nodes or edges) keyed by the cells they cover, searched in rings.
+
+    Coordinates are projected with the smallest cos(latitude) of the indexed points, so projected
+    distances never exceed true ones and a ring search can stop once the k-th candidate is closer
+    than any unvisited ring. Subclasses rank the candidates.
+    """
+    # Allowance for the curvature the flat projection ignores
+    RING_MARGIN = 0.999
+
+    def __init__(self, max_lat, cell_m=GRAPH_INDEX_CELL_M):
+        self.cell_m = cell_m
+        self.y_scale = EARTH_RADIUS_M * math.pi / 180
+        self.x_scale = self.y_scale * max(math.cos(math.radians(max_lat)), 0.01)
+        self.items = np.empty(0, dtype=np.int64)
+        self.cells = {}
+        self.bounds = None
+
+    def _cells(self, lon, lat):
+        return (np.floor(np.asarray(lon) * self.x_scale / self.cell_m).astype(np.int64),
+                np.floor(np.asarray(lat) * self.y_scale / self.cell_m).astype(np.int64))
+
+    def _fill(self, cx, cy, items):
+        """Store items sorted by cell so the items of one cell are a contiguous slice"""
+        order = np.lexsort((cy, cx))
+        self.items = items[order]
+        cx, cy = cx[order], cy[order]
+        if not len(items):
+            return
+        starts = np.flatnonzero(np.r_[True, (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])])
+        ends = np.r_[starts[1:], len(items)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            self.cells[(int(cx[start]), int(cy[start]))] = (start, end)
+        self.bounds = (int(cx.min()), int(cy.min()), int(cx.max()), int(cy.max()))
+
+    def _candidates(self, cells):
+        slices = [self.items[span[0]:span[1]] for span in map(self.cells.get, cells) if span is not None]
+        return np.unique(np.concatenate(slices)) if slices else self.items[:0]
+
+    def _search(self, point, k, max_distance):
+        """Ring search around point; returns (items, distances) of up to k items, nearest first"""
+        found_items, found_distances = self.items[:0], np.empty(0)
+        if self.bounds is None:
+            return found_items, found_distances
+
+        px = math.floor(point[0] * self.x_scale / self.cell_m)
+        py = math.floor(point[1] * self.y_scale / self.cell_m)
+        min_x, min_y, max_x, max_y = self.bounds
+        last_ring = max(px - min_x, max_x - px, py - min_y, max_y - py, 0)
+
+        seen = set()
+        for ring in range(last_ring + 1):
+            if ring == 0:
+                cells = [(px, py)]
+            else:
+                cells = [(px + dx, py + dy) for dx in range(-ring, ring + 1) for dy in (-ring, ring)]
+                cells += [(px + dx, py + dy) for dx in (-ring, ring) for dy in range(-ring + 1, ring)]
+            candidates = self._candidates(cells)
+            if len(candidates) and seen:
+                # Edges spanning several cells show up in more than one ring
+                candidates = candidates[[item not in seen for item in candidates.tolist()]]
+            if len(candidates):
+                seen.update(candidates.tolist())
+                found_items = np.concatenate((found_items, candidates))
+                found_distances = np.concatenate((found_distances, self.distances(point, candidates)))
+                if len(found_items) > k:
+                    keep = np.argpartition(found_distances, k - 1)[:k]
+                    found_items, found_distances = found_items[keep], found_distances[keep]
+
+            # Every item outside the rings searched so far is at least this far away
+            covered = ring * self.cell_m * self.RING_MARGIN
+            if len(found_items) == k and found_distances.max() <= covered:
+                break
+            if covered > max_distance:
+                break
+
+        order = np.argsort(found_distances, kind='stable')
+        order = order[found_distances[order] <= max_distance]
+        return found_items[order], found_distances[order]
+
+    def distances(self, point, items):
+        raise NotImplementedError
+
+class NodeIndex(GridIndex):
+    """Grid over a set of nodes for k-nearest and radius queries ranked by haversine distance"""
+    def __init__(self, lon, lat, nodes, cell_m=GRAPH_INDEX_CELL_M):
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        nodes = np.asarray(nodes, dtype=np.int64)
+        super().__init__(float(np.abs(self.lat[nodes]).max()) if len(nodes) else 0.0, cell_m)
+        cx, cy = self._cells(self.lon[nodes], self.lat[nodes])
+        self._fill(cx, cy, nodes)
+
+    def distances(self, point, nodes):
+        return haversine_distances(point, self.lon[nodes], self.lat[nodes])
+
+    def nearest(self, point, k=1, max_distance=float('inf')):
+        """Up to k (node, meters) pairs closest to point and within max_distance, nearest first"""
+        nodes, distances = self._search(point, k, max_distance)
+        return list(zip(nodes.tolist(), distances.tolist()))
+
+    def within(self, point, radius_m):
+        """All (node, meters) pairs within radius_m of point, nearest first"""
+        if self.bounds is None:
+            return []
+        x = point[0] * self.x_scale
+        y = point[1] * self.y_scale
+        x0, x1 = math.floor((x - radius_m) / self.cell_m), math.floor((x + radius_m) / self.cell_m)
+        y0, y1 = math.floor((y - radius_m) / self.cell_m), math.floor((y + radius_m) / self.cell_m)
+        nodes = self._candidates([(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)])
+        distances = self.distances(point, nodes)
+        order = np.argsort(distances, kind='stable')
+        order = order[distances[order] <= radius_m]
+        return list(zip(nodes[order].tolist(), distances[order].tolist()))
+
+class EdgeIndex(GridIndex):
+    """Grid over edge bounding boxes; finds the edge nearest to a point and where it projects.
+
+    Distances to a segment are measured in an equirectangular projection centred on the query
+    point, which is exact to well under a meter at city scale.
+    """
+    def __init__(self, lon, lat, sources, targets, cell_m=GRAPH_INDEX_CELL_M):
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        super().__init__(float(np.abs(self.lat).max()) if len(self.lat) else 0.0, cell_m)
+
+        ax, ay = self._cells(self.lon[self.sources], self.lat[self.sources])
+        bx, by = self._cells(self.lon[self.targets], self.lat[self.targets])
+        x0, x1 = np.minimum(ax, bx), np.maximum(ax, bx)
+        y0, y1 = np.minimum(ay, by), np.maximum(ay, by)
+        # Expand each edge into every cell of its bounding box
+        heights = y1 - y0 + 1
+        counts = (x1 - x0 + 1) * heights
+        edges = np.repeat(np.arange(len(self.sources), dtype=np.int64), counts)
+        within = np.arange(len(edges)) - np.repeat(np.cumsum(counts) - counts, counts)
+        heights = np.repeat(heights, counts)
+        self._fill(np.repeat(x0, counts) + within // heights, np.repeat(y0, counts) + within % heights, edges)
+
+    def _project(self, point, edges):
+        """Returns (fractions along the edges, feet as local x/y meters) for point on each edge"""
+        x_scale = self.y_scale * math.cos(math.radians(point[1]))
+        ax = (self.lon[self.sources[edges]] - point[0]) * x_scale
+        ay = (self.lat[self.sources[edges]] - point[1]) * self.y_scale
+        dx = (self.lon[self.targets[edges]] - point[0]) * x_scale - ax
+        dy = (self.lat[self.targets[edges]] - point[1]) * self.y_scale - ay
+        length2 = dx * dx + dy * dy
+        fractions = np.clip(-(ax * dx + ay * dy) / np.where(length2 > 0, length2, 1), 0, 1)
+        return fractions, (ax + fractions * dx, ay + fractions * dy), x_scale
+
+    def distances(self, point, edges):
+        _, (fx, fy), _ = self._project(point, edges)
+        return np.hypot(fx, fy)
+
+    def nearest(self, point, max_distance=float('inf'), usable=None):
+        """Returns (edge slot, fraction along it, (lon, lat) of the projected point, meters) or None.
+
+        With a usable mask over edge slots, the nearest edge the mask allows.
+        """
+        k = 1 if usable is None else 8
+        while True:
+            edges, _ = self._search(point, k, max_distance)
+            found = len(edges)
+            if usable is not None:
+                edges = edges[usable[edges]]
+            # Fewer than k edges came back, so none further away is within max_distance
+            if len(edges) or found < k:
+                break
+            k *= 4
+        if not len(edges):
             return None
+        fractions, (fx, fy), x_scale = self._project(point, edges[:1])
+        foot = (point[0] + float(fx[0]) / x_scale, point[1] + float(fy[0]) / self.y_scale)
+        return int(edges[0]), float(fractions[0]), foot, haversine_distance(point, foot)
 
-        app.logger.info(f"Found nearest node at {min_distance:.2f}m for point {point}")
-        return nearest_node
-    
-    def dijkstra(self, start, end):        
-        start_node = self.find_nearest_node(start)
-        end_node = self.find_nearest_node(end)
-        
-        if start_node is None or end_node is None:
-            app.logger.warning(f"Couldn't find nearest node: start={start}, end={end}")
-            return None, 0, []
-        
-        # Dijkstra algorithm implementation
-        distances = {node: float('inf') for node in self.nodes}
-        previous_nodes = {node: None for node in self.nodes}
-        distances[start_node] = 0
-        
-        unvisited = set(self.nodes.keys())
-        
-        while unvisited:
-            current = min(unvisited, key=lambda node: distances[node], default=None)
-            if current is None or distances[current] == float('inf'):
+def search_terminals(value):
+    """Normalise a search start or end, a node or {node: distance}, to a dict"""
+    return value if isinstance(value, dict) else {value: 0}
+
+def bidirectional_init(start, end):
+    """Initial (distances, links, heaps, best_distance, meeting_node) of a two-sided search"""
+    origins, destinations = search_terminals(start), search_terminals(end)
+    distances = (dict(origins), dict(destinations))
+    # Forward search links each node to the edge it was reached by, backward search to the edge leaving it
+    links = (dict.fromkeys(origins, -1), dict.fromkeys(destinations, -1))
+    heaps = ([(distance, node) for node, distance in origins.items()],
+             [(distance, node) for node, distance in destinations.items()])
+    for heap in heaps:
+        heapq.heapify(heap)
+
+    best_distance, meeting_node = float('inf'), None
+    for node in origins.keys() & destinations.keys():
+        if origins[node] + destinations[node] < best_distance:
+            best_distance, meeting_node = origins[node] + destinations[node], node
+    return distances, links, heaps, best_distance, meeting_node
+
+class RouteProfile:
+    """How one value of `optimization` weighs edges.
+
+    cost is 'distance' (meters) or 'time' (seconds at the profile's speeds). Speeds come from
+    road_type, falling back to default_speed, and factors scale the cost of some road types;
+    a road type in excluded is never used. leg_speed times the straight legs between the user's
+    points and the road network.
+    """
+    def __init__(self, name, cost, speeds, default_speed, leg_speed, factors=None, excluded=()):
+        self.name = name
+        self.cost = cost
+        self.speeds = speeds
+        self.default_speed = default_speed
+        self.leg_speed = leg_speed
+        self.factors = factors or {}
+        self.excluded = set(excluded)
+
+    def top_speed(self):
+        """Fastest speed anything in the profile travels at, meters per second"""
+        return max([self.default_speed, self.leg_speed] + list(self.speeds.values()))
+
+    def settings(self):
+        """Everything edge_weights depends on besides the graph, as stored in snapshot headers"""
+        return [self.cost, sorted([road_type, speed] for road_type, speed in self.speeds.items()),
+                self.default_speed, sorted([road_type, factor] for road_type, factor in self.factors.items()),
+                sorted(self.excluded)]
+
+    def edge_weights(self, graph):
+        """(costs, travel times, least cost per meter) for every edge slot of a graph"""
+        lengths = np.asarray(graph.weights, dtype=np.float64)
+        road_types = [info[2] for info in graph.road_info]
+        speeds = np.array([self.speeds.get(road_type, self.default_speed) for road_type in road_types], dtype=np.float64)
+        factors = np.array([self.factors.get(road_type, 1.0) for road_type in road_types], dtype=np.float64)
+        excluded = np.array([road_type in self.excluded for road_type in road_types], dtype=bool)
+        edge_roads = np.asarray(graph.edge_roads, dtype=np.int64)
+
+        times = lengths / speeds[edge_roads] if len(road_types) else np.zeros(0)
+        if self.cost == 'distance' and not self.factors and not self.excluded:
+            # Plain length: share the graph's own array
+            costs = graph.weights
+        else:
+            values = (times if self.cost == 'time' else lengths) * factors[edge_roads] if len(road_types) else np.zeros(0)
+            values[excluded[edge_roads]] = np.inf
+            costs = array('d', values.tobytes())
+
+        # Scales straight-line meters into a lower bound of the cost, for the A* heuristic
+        usable = ~excluded
+        if self.cost == 'time':
+            cost_per_meter = 1 / speeds[usable].max() if usable.any() else 0.0
+        else:
+            cost_per_meter = min(1.0, factors[usable].min()) if usable.any() else 1.0
+        return costs, array('d', times.tobytes()), float(cost_per_meter)
+
+# Cost profiles accepted in the `optimization` field of POST /routes
+ROUTE_PROFILES = {profile.name: profile for profile in (
+    RouteProfile('shortest', 'distance', ROAD_SPEEDS_MPS, AVERAGE_SPEED_MPS, AVERAGE_SPEED_MPS),
+    RouteProfile('fastest', 'time', ROAD_SPEEDS_MPS, AVERAGE_SPEED_MPS, AVERAGE_SPEED_MPS),
+    RouteProfile('pedestrian', 'time', {}, WALKING_SPEED_MPS, WALKING_SPEED_MPS, excluded=('highway',)),
+    RouteProfile('avoid_highway', 'distance', ROAD_SPEEDS_MPS, AVERAGE_SPEED_MPS, AVERAGE_SPEED_MPS,
+                 factors={'highway': HIGHWAY_AVOID_FACTOR}),
+)}
+
+class CompactGraph:
+    """Immutable integer-indexed road graph.
+
+    Nodes are numbered 0..node_count-1 with coordinates in the lon/lat arrays. Outgoing edges of
+    node u are the slots offsets[u]..offsets[u + 1] of targets/weights/edge_roads, where edge_roads
+    indexes the interned road_ids table. The reverse CSR lists, per node, the forward edge slots
+    that end there. road_info holds (burmese_name, english_name, road_type, is_oneway) per road
+    in the same order as road_ids, so route descriptions need no database lookups.
+    """
+    ARRAY_NAMES = ('lon', 'lat', 'offsets', 'sources', 'targets', 'weights', 'edge_roads',
+                   'reverse_offsets', 'reverse_edges')
+
+    def __init__(self, lon, lat, offsets, sources, targets, weights, edge_roads,
+                 reverse_offsets, reverse_edges, road_ids, version=0, road_info=None):
+        self.version = version
+        self.lon = lon
+        self.lat = lat
+        self.offsets = offsets
+        self.sources = sources
+        self.targets = targets
+        self.weights = weights
+        self.edge_roads = edge_roads
+        self.reverse_offsets = reverse_offsets
+        self.reverse_edges = reverse_edges
+        self.road_ids = road_ids
+        self.road_info = road_info if road_info is not None else [(None, None, None, False)] * len(road_ids)
+        self._road_positions = None
+        self.node_count = len(lon)
+        self.edge_count = len(targets)
+        self._edge_index = None
+        self._profile_weights = {}
+        self._usable_edges = {}
+        # State of the roads table the graph was built from, the same in every worker; None if unknown
+        self.fingerprint = None
+        # Set on views made by with_road_factors: the plain graph and the overlay they apply
+        self.base = None
+        self.road_factors = None
+        self.road_overlay = None
+        self.overlay_version = 0
+
+    @classmethod
+    def from_edges(cls, lon, lat, sources, targets, weights, edge_roads, road_ids, version=0, road_info=None):
+        """Sort an unordered edge list into CSR form"""
+        offsets, order = build_csr(len(lon), sources)
+        sorted_targets = array('i', (targets[e] for e in order))
+        reverse_offsets, reverse_edges = build_csr(len(lon), sorted_targets)
+        return cls(
+            lon, lat, offsets,
+            array('i', (sources[e] for e in order)),
+            sorted_targets,
+            array('d', (weights[e] for e in order)),
+            array('i', (edge_roads[e] for e in order)),
+            reverse_offsets, reverse_edges, road_ids, version, road_info
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls.from_edges(array('d'), array('d'), array('i'), array('i'), array('d'), array('i'), [])
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    def coord(self, node):
+        return (self.lon[node], self.lat[node])
+
+    def road_index(self, road_id):
+        """Position of a road in road_ids, or None if it is not part of this graph"""
+        if self._road_positions is None:
+            self._road_positions = {road_id: i for i, road_id in enumerate(self.road_ids)}
+        return self._road_positions.get(road_id)
+
+    def road_metadata(self, road_id):
+        """Names, type and direction of a road in this graph, or None if it is not part of it"""
+        position = self.road_index(road_id)
+        if position is None:
+            return None
+        burmese_name, english_name, road_type, is_oneway = self.road_info[position]
+        return {
+            "burmese_name": burmese_name,
+            "english_name": english_name,
+            "road_type": road_type,
+            "is_oneway": is_oneway
+        }
+
+    def memory_footprint(self):
+        """Approximate bytes held by the graph arrays and the road id table"""
+        array_bytes = sum(array_nbytes(values) for values in self.arrays().values())
+        road_table_bytes = sys.getsizeof(self.road_ids) + sum(sys.getsizeof(road_id) for road_id in self.road_ids)
+        return {
+            "nodes": self.node_count,
+            "edges": self.edge_count,
+            "array_bytes": array_bytes,
+            "road_table_bytes": road_table_bytes,
+            "total_bytes": array_bytes + road_table_bytes
+        }
+
+    def edge_index(self):
+        """Grid over the edges, built on first use and kept for the life of the graph"""
+        if self._edge_index is None:
+            self._edge_index = EdgeIndex(self.lon, self.lat, self.sources, self.targets)
+        return self._edge_index
+
+    def profile_weights(self, profile='shortest'):
+        """(costs, travel times, least cost per meter) of a route profile, computed once per graph"""
+        weights = self._profile_weights.get(profile)
+        if weights is None:
+            if self.base is None:
+                weights = ROUTE_PROFILES[profile].edge_weights(self)
+            else:
+                weights = self.base.profile_weights(profile)
+            if self.road_factors is not None:
+                # Factors are at least 1, so the A* bound per meter still holds
+                costs, times, cost_per_meter = weights
+                factors = self.road_factors[np.asarray(self.edge_roads, dtype=np.int64)]
+                weights = (array('d', (np.asarray(costs) * factors).tobytes()),
+                           array('d', (np.asarray(times) * factors).tobytes()), cost_per_meter)
+            self._profile_weights[profile] = weights
+        return weights
+
+    def with_road_factors(self, road_factors, overlay_version):
+        """View of this graph whose profile costs are multiplied per road, inf closing a road.
+
+        road_factors maps road ids to factors; roads missing from the graph are ignored. The view
+        shares every array and index with this graph, only the profile weights are its own.
+        """
+        view = copy.copy(self)
+        factors = np.ones(len(self.road_ids), dtype=np.float64)
+        for road_id, factor in road_factors.items():
+            position = self.road_index(road_id)
+            if position is not None:
+                factors[position] = factor
+        view.base = self
+        view.road_factors = factors
+        view.road_overlay = dict(road_factors)
+        view.overlay_version = overlay_version
+        view._profile_weights = {}
+        view._usable_edges = {}
+        view.prepare_profiles()
+        return view
+
+    def usable_edges(self, profile='shortest'):
+        """Mask of the edge slots a profile can travel, or None when it can travel all of them"""
+        if profile not in self._usable_edges:
+            usable = np.isfinite(np.asarray(self.profile_weights(profile)[0]))
+            self._usable_edges[profile] = None if usable.all() else usable
+        return self._usable_edges[profile]
+
+    def cost_key(self):
+        """Names the roads table state and road overlay behind this graph's costs identically in
+        every worker, or None when the roads table has no fingerprint"""
+        if self.fingerprint is None:
+            return None
+        if not self.road_overlay:
+            return self.fingerprint
+        return f"{self.fingerprint}/{json.dumps(sorted(self.road_overlay.items()), separators=(',', ':'))}"
+
+    def prepare_profiles(self):
+        """Compute every profile's weights up front so no request pays for them"""
+        for profile in ROUTE_PROFILES:
+            self.profile_weights(profile)
+            self.usable_edges(profile)
+
+    def profile_sections(self):
+        """Every profile's weights as ({name: header entry}, {section name: array}) for a snapshot.
+
+        Arrays with the same contents, such as the travel times most profiles share, are stored
+        once; a cost array that is the graph's own weights is not stored at all.
+        """
+        profiles, sections, names = {}, {}, {}
+        for name, profile in ROUTE_PROFILES.items():
+            entry = {"settings": profile.settings()}
+            costs, times, entry["cost_per_meter"] = self.profile_weights(name)
+            for kind, values in (("costs", costs), ("times", times)):
+                if values is self.weights:
+                    entry[kind] = "weights"
+                    continue
+                key = bytes(memoryview(values).cast('B'))
+                if key not in names:
+                    names[key] = f"profile_{name}_{kind}"
+                    sections[names[key]] = values
+                entry[kind] = names[key]
+            profiles[name] = entry
+        return profiles, sections
+
+    def load_profiles(self, profiles, sections):
+        """Take profile weights from snapshot sections written by profile_sections; profiles whose
+        settings changed since are left for prepare_profiles to compute"""
+        for name, profile in ROUTE_PROFILES.items():
+            entry = profiles.get(name)
+            if entry is None or entry["settings"] != json.loads(json.dumps(profile.settings())):
+                continue
+            costs, times = (self.weights if entry[kind] == "weights" else sections[entry[kind]]
+                            for kind in ("costs", "times"))
+            self._profile_weights[name] = (costs, times, entry["cost_per_meter"])
+
+    def reverse_edge(self, edge):
+        """Slot of the opposite direction of a two-way road segment, or None for one-way roads"""
+        source, target = self.sources[edge], self.targets[edge]
+        for slot in range(self.offsets[target], self.offsets[target + 1]):
+            if self.targets[slot] == source and self.edge_roads[slot] == self.edge_roads[edge]:
+                return slot
+        return None
+
+    def snap_to_road(self, point, max_distance=500, profile='shortest'):
+        """Project point onto the nearest edge the profile can travel, passing closed or excluded
+        roads; returns (edge, fraction, (lon, lat), meters) or None"""
+        snap = self.edge_index().nearest(point, max_distance, self.usable_edges(profile))
+        if snap is None:
+            app.logger.warning(f"No road found within {max_distance}m for point {point}")
+            return None
+        app.logger.info(f"Snapped point {point} to a road {snap[3]:.2f}m away")
+        return snap
+
+    def shortest_path(self, start, end, algorithm='dijkstra', stats=None, goal=None, profile='shortest'):
+        """Heap-based Dijkstra or A*, returns (cost, edge slots) or (inf, None).
+
+        start and end are nodes or {node: distance} dicts, the cost of leaving from or arriving at
+        each node; this is how a point in the middle of an edge is routed. A* orders the frontier by
+        distance plus the straight-line distance to goal (the end node's position by default), which
+        never overestimates the remaining road length. Edge costs come from the route profile. If a
+        stats dict is given, the number of settled nodes is stored under 'nodes_expanded'.
+        """
+        if algorithm == 'bidirectional':
+            return self.bidirectional_path(start, end, stats, profile)
+
+        origins, destinations = search_terminals(start), search_terminals(end)
+        weights, _, cost_per_meter = self.profile_weights(profile)
+        offsets, targets = self.offsets, self.targets
+        lon, lat = self.lon, self.lat
+        if goal is None and len(destinations) == 1:
+            goal = self.coord(next(iter(destinations)))
+        if algorithm == 'astar' and goal is not None:
+            heuristic = lambda node: haversine_distance((lon[node], lat[node]), goal) * cost_per_meter
+        else:
+            heuristic = lambda node: 0
+
+        distances = dict(origins)
+        previous_edges = dict.fromkeys(origins, -1)
+        settled = set()
+        heap = [(distance + heuristic(node), distance, node) for node, distance in origins.items()]
+        heapq.heapify(heap)
+        best_distance, end_node = float('inf'), None
+
+        while heap:
+            estimate, distance, current = heapq.heappop(heap)
+            if estimate >= best_distance:
                 break
-            unvisited.remove(current)
-            
-            if current == end_node:
+            # Lazy deletion: skip entries superseded by a shorter distance
+            if current in settled:
+                continue
+            settled.add(current)
+
+            if current in destinations and distance + destinations[current] < best_distance:
+                best_distance, end_node = distance + destinations[current], current
+
+            for edge in range(offsets[current], offsets[current + 1]):
+                neighbor = targets[edge]
+                if neighbor in settled:
+                    continue
+
+                new_distance = distance + weights[edge]
+                if new_distance < distances.get(neighbor, float('inf')):
+                    distances[neighbor] = new_distance
+                    previous_edges[neighbor] = edge
+                    heapq.heappush(heap, (new_distance + heuristic(neighbor), new_distance, neighbor))
+
+        if stats is not None:
+            stats['nodes_expanded'] = len(settled)
+
+        if end_node is None:
+            return float('inf'), None
+
+        # Reconstruct path
+        path = []
+        edge = previous_edges[end_node]
+        while edge != -1:
+            path.append(edge)
+            edge = previous_edges[self.sources[edge]]
+        path.reverse()
+
+        return best_distance, path
+
+    def distances_to(self, start, targets=None, max_distance=float('inf'), weights=None, previous=None):
+        """One-to-many Dijkstra from start (a node or {node: distance}) that stops once every node in
+        targets is settled or the frontier passes max_distance. Returns {target node: distance};
+        without targets, every node within max_distance is returned. Edges cost weights, by default
+        the shortest profile's (lengths, scaled by the road overlay on an overlay view). A previous
+        dict receives the edge slot each reached node was last reached by, -1 for start nodes."""
+        offsets, edge_targets = self.offsets, self.targets
+        weights = self.profile_weights()[0] if weights is None else weights
+        previous = {} if previous is None else previous
+        remaining = set(targets) if targets is not None else None
+        found = {}
+        distances = dict(search_terminals(start))
+        previous.update(dict.fromkeys(distances, -1))
+        settled = set()
+        heap = [(distance, node) for node, distance in distances.items()]
+        heapq.heapify(heap)
+
+        while heap and (remaining is None or remaining):
+            distance, current = heapq.heappop(heap)
+            if distance > max_distance:
+                break
+            if current in settled:
+                continue
+            settled.add(current)
+            if remaining is None:
+                found[current] = distance
+            elif current in remaining:
+                remaining.discard(current)
+                found[current] = distance
+
+            for edge in range(offsets[current], offsets[current + 1]):
+                neighbor = edge_targets[edge]
+                if neighbor in settled:
+                    continue
+                new_distance = distance + weights[edge]
+                if new_distance < distances.get(neighbor, float('inf')):
+                    distances[neighbor] = new_distance
+                    previous[neighbor] = edge
+                    heapq.heappush(heap, (new_distance, neighbor))
+
+        return found
+
+    def bidirectional_path(self, start, end, stats=None, profile='shortest'):
+        """Bidirectional Dijkstra: a forward search from start over outgoing edges and a backward
+        search from end over incoming edges, stopped once no shorter meeting point can exist."""
+        offsets, targets, sources = self.offsets, self.targets, self.sources
+        weights = self.profile_weights(profile)[0]
+        reverse_offsets, reverse_edges = self.reverse_offsets, self.reverse_edges
+
+        distances, links, heaps, best_distance, meeting_node = bidirectional_init(start, end)
+        settled = (set(), set())
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best_distance:
+                break
+
+            # Advance whichever side has the closer frontier
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            other = 1 - side
+            distance, current = heapq.heappop(heaps[side])
+            if current in settled[side]:
+                continue
+            settled[side].add(current)
+
+            if side == 0:
+                slots = range(offsets[current], offsets[current + 1])
+            else:
+                slots = (reverse_edges[slot] for slot in range(reverse_offsets[current], reverse_offsets[current + 1]))
+
+            for edge in slots:
+                neighbor = targets[edge] if side == 0 else sources[edge]
+                if neighbor in settled[side]:
+                    continue
+
+                new_distance = distance + weights[edge]
+                if new_distance < distances[side].get(neighbor, float('inf')):
+                    distances[side][neighbor] = new_distance
+                    links[side][neighbor] = edge
+                    heapq.heappush(heaps[side], (new_distance, neighbor))
+
+                    if neighbor in distances[other] and new_distance + distances[other][neighbor] < best_distance:
+                        best_distance = new_distance + distances[other][neighbor]
+                        meeting_node = neighbor
+
+        if stats is not None:
+            stats['nodes_expanded'] = len(settled[0]) + len(settled[1])
+
+        if meeting_node is None:
+            return float('inf'), None
+
+        path = []
+        edge = links[0][meeting_node]
+        while edge != -1:
+            path.append(edge)
+            edge = links[0][sources[edge]]
+        path.reverse()
+
+        edge = links[1][meeting_node]
+        while edge != -1:
+            path.append(edge)
+            edge = links[1][targets[edge]]
+
+        return best_distance, path
+
+class ContractionHierarchy:
+    """Node ranks and shortcut edges for one CompactGraph.
+
+    Nodes are contracted in edge-difference order; contracting a node adds a shortcut between each
+    pair of its neighbours unless a bounded witness search finds a path that is no longer. Queries
+    run a bidirectional search that only follows edges towards higher-ranked nodes.
+
+    Hierarchy edges live in flat arrays: a shortcut records the two hierarchy edges it replaces,
+    an original edge records its slot in the graph (base_edges, -1 for shortcuts).
+    """
+    ARRAY_NAMES = ('rank', 'sources', 'targets', 'weights', 'base_edges', 'first_children',
+                   'second_children', 'up_offsets', 'up_edges', 'down_offsets', 'down_edges')
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.version = graph.version
+        self.shortcut_count = 0
+        self._contract()
+
+    @classmethod
+    def from_arrays(cls, graph, arrays, shortcut_count):
+        """Reattach a hierarchy saved for this exact graph"""
+        hierarchy = cls.__new__(cls)
+        hierarchy.graph = graph
+        hierarchy.version = graph.version
+        hierarchy.shortcut_count = shortcut_count
+        for name in cls.ARRAY_NAMES:
+            setattr(hierarchy, name, arrays[name])
+        return hierarchy
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    def _contract(self):
+        graph = self.graph
+        node_count = graph.node_count
+        ch_sources, ch_targets, ch_weights = array('i'), array('i'), array('d')
+        base_edges, first_children, second_children = array('i'), array('i'), array('i')
+
+        def add_edge(source, target, weight, base_edge=-1, first=-1, second=-1):
+            ch_sources.append(source)
+            ch_targets.append(target)
+            ch_weights.append(weight)
+            base_edges.append(base_edge)
+            first_children.append(first)
+            second_children.append(second)
+            return len(ch_weights) - 1
+
+        # Remaining graph: node -> {neighbour: hierarchy edge}
+        out_edges = [{} for _ in range(node_count)]
+        in_edges = [{} for _ in range(node_count)]
+        for edge in range(graph.edge_count):
+            source, target = graph.sources[edge], graph.targets[edge]
+            existing = out_edges[source].get(target)
+            if source != target and (existing is None or graph.weights[edge] < ch_weights[existing]):
+                ch_edge = add_edge(source, target, graph.weights[edge], base_edge=edge)
+                out_edges[source][target] = ch_edge
+                in_edges[target][source] = ch_edge
+
+        contracted_neighbors = array('i', bytes(4 * node_count))
+
+        def witness_distances(source, skipped, limit):
+            distances = {source: 0}
+            heap = [(0, source)]
+            settled = 0
+            while heap and settled < CH_WITNESS_SETTLE_LIMIT:
+                distance, current = heapq.heappop(heap)
+                if distance > distances[current]:
+                    continue
+                if distance > limit:
+                    break
+                settled += 1
+                for neighbor, ch_edge in out_edges[current].items():
+                    if neighbor == skipped:
+                        continue
+                    new_distance = distance + ch_weights[ch_edge]
+                    if new_distance < distances.get(neighbor, float('inf')):
+                        distances[neighbor] = new_distance
+                        heapq.heappush(heap, (new_distance, neighbor))
+            return distances
+
+        def required_shortcuts(node):
+            shortcuts = []
+            for source, in_edge in in_edges[node].items():
+                targets = [(target, in_edge, out_edge, ch_weights[in_edge] + ch_weights[out_edge])
+                           for target, out_edge in out_edges[node].items() if target != source]
+                if not targets:
+                    continue
+                distances = witness_distances(source, node, max(target[3] for target in targets))
+                for target, _, out_edge, weight in targets:
+                    if distances.get(target, float('inf')) > weight:
+                        shortcuts.append((source, target, in_edge, out_edge, weight))
+            return shortcuts
+
+        def priority(node, shortcuts):
+            return len(shortcuts) - len(in_edges[node]) - len(out_edges[node]) + contracted_neighbors[node]
+
+        queue = [(priority(node, required_shortcuts(node)), node) for node in range(node_count)]
+        heapq.heapify(queue)
+
+        rank = array('i', bytes(4 * node_count))
+        next_rank = 0
+        while queue:
+            _, node = heapq.heappop(queue)
+            # Lazy update: re-evaluate and requeue if the node is no longer the cheapest to contract
+            shortcuts = required_shortcuts(node)
+            current_priority = priority(node, shortcuts)
+            if queue and current_priority > queue[0][0]:
+                heapq.heappush(queue, (current_priority, node))
+                continue
+
+            for source, target, in_edge, out_edge, weight in shortcuts:
+                existing = out_edges[source].get(target)
+                if existing is None or weight < ch_weights[existing]:
+                    ch_edge = add_edge(source, target, weight, first=in_edge, second=out_edge)
+                    out_edges[source][target] = ch_edge
+                    in_edges[target][source] = ch_edge
+                    self.shortcut_count += 1
+
+            rank[node] = next_rank
+            next_rank += 1
+            for target in out_edges[node]:
+                del in_edges[target][node]
+                contracted_neighbors[target] += 1
+            for source in in_edges[node]:
+                del out_edges[source][node]
+                contracted_neighbors[source] += 1
+            out_edges[node] = {}
+            in_edges[node] = {}
+
+        # Upward CSR: every surviving edge points from the lower- to the higher-ranked endpoint
+        upward, downward = [], []
+        for ch_edge in range(len(ch_weights)):
+            source, target = ch_sources[ch_edge], ch_targets[ch_edge]
+            (upward if rank[source] < rank[target] else downward).append(ch_edge)
+        up_offsets, up_order = build_csr(node_count, [ch_sources[ch_edge] for ch_edge in upward])
+        down_offsets, down_order = build_csr(node_count, [ch_targets[ch_edge] for ch_edge in downward])
+
+        self.rank = rank
+        self.sources, self.targets, self.weights = ch_sources, ch_targets, ch_weights
+        self.base_edges, self.first_children, self.second_children = base_edges, first_children, second_children
+        # Forward search follows up_edges from a node; backward search follows down_edges into it
+        self.up_offsets = up_offsets
+        self.up_edges = array('i', (upward[slot] for slot in up_order))
+        self.down_offsets = down_offsets
+        self.down_edges = array('i', (downward[slot] for slot in down_order))
+
+    def memory_footprint(self):
+        total_bytes = sum(array_nbytes(values) for values in self.arrays().values())
+        return {"shortcuts": self.shortcut_count, "total_bytes": total_bytes}
+
+    def unpack(self, ch_edges):
+        """Expand hierarchy edges into the graph edge slots they stand for"""
+        path = []
+        for ch_edge in ch_edges:
+            stack = [ch_edge]
+            while stack:
+                current = stack.pop()
+                if self.base_edges[current] != -1:
+                    path.append(self.base_edges[current])
+                else:
+                    stack.append(self.second_children[current])
+                    stack.append(self.first_children[current])
+        return path
+
+    def shortest_path(self, start, end, stats=None):
+        """Upward bidirectional query between nodes or {node: distance} dicts, returns
+        (distance, edge slots) or (inf, None)"""
+        sources, targets, weights = self.sources, self.targets, self.weights
+        offsets = (self.up_offsets, self.down_offsets)
+        adjacency = (self.up_edges, self.down_edges)
+
+        distances, links, heaps, best_distance, meeting_node = bidirectional_init(start, end)
+        settled = (set(), set())
+
+        while True:
+            # Each side may stop on its own once its frontier cannot improve the best meeting
+            sides = [side for side in (0, 1) if heaps[side] and heaps[side][0][0] < best_distance]
+            if not sides:
+                break
+            side = min(sides, key=lambda side: heaps[side][0][0])
+            other = 1 - side
+
+            distance, current = heapq.heappop(heaps[side])
+            if current in settled[side]:
+                continue
+            settled[side].add(current)
+
+            if current in distances[other] and distance + distances[other][current] < best_distance:
+                best_distance = distance + distances[other][current]
+                meeting_node = current
+
+            for slot in range(offsets[side][current], offsets[side][current + 1]):
+                ch_edge = adjacency[side][slot]
+                neighbor = targets[ch_edge] if side == 0 else sources[ch_edge]
+                new_distance = distance + weights[ch_edge]
+                if new_distance < distances[side].get(neighbor, float('inf')):
+                    distances[side][neighbor] = new_distance
+                    links[side][neighbor] = ch_edge
+                    heapq.heappush(heaps[side], (new_distance, neighbor))
+
+        if stats is not None:
+            stats['nodes_expanded'] = len(settled[0]) + len(settled[1])
+
+        if meeting_node is None:
+            return float('inf'), None
+
+        ch_path = []
+        ch_edge = links[0][meeting_node]
+        while ch_edge != -1:
+            ch_path.append(ch_edge)
+            ch_edge = links[0][sources[ch_edge]]
+        ch_path.reverse()
+
+        ch_edge = links[1][meeting_node]
+        while ch_edge != -1:
+            ch_path.append(ch_edge)
+            ch_edge = links[1][targets[ch_edge]]
+
+        return best_distance, self.unpack(ch_path)
+
+def _align8(offset):
+    return (offset + 7) & ~7
+
+def _snapshot_chunks(header, sections):
+    """Lay out named arrays after a JSON header, each 8-byte aligned; returns (size, [(offset, bytes)])"""
+    layout = {}
+    offset = 0
+    for name, values in sections.items():
+        typecode = getattr(values, 'typecode', None) or values.format
+        layout[name] = [typecode, offset, len(values)]
+        offset = _align8(offset + array_nbytes(values))
+
+    header_bytes = json.dumps(dict(header, sections=layout, byteorder=sys.byteorder)).encode('utf-8')
+    data_start = _align8(SNAPSHOT_PREAMBLE.size + len(header_bytes))
+
+    chunks = [
+        (0, SNAPSHOT_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(header_bytes))),
+        (SNAPSHOT_PREAMBLE.size, header_bytes)
+    ]
+    for name, values in sections.items():
+        chunks.append((data_start + layout[name][1], memoryview(values).cast('B')))
+    return data_start + offset, chunks
+
+def write_snapshot(path, header, sections):
+    """Write a snapshot file and atomically replace path with it"""
+    size, chunks = _snapshot_chunks(header, sections)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for offset, data in chunks:
+            f.seek(offset)
+            f.write(data)
+        f.truncate(size)
+    os.replace(tmp_path, path)
+
+def parse_snapshot(buffer):
+    """Returns (header, {name: memoryview}) over buffer without copying, or None if incompatible"""
+    if len(buffer) < SNAPSHOT_PREAMBLE.size:
+        return None
+    magic, format_version, header_length = SNAPSHOT_PREAMBLE.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC or format_version != SNAPSHOT_FORMAT_VERSION:
+        return None
+
+    header_end = SNAPSHOT_PREAMBLE.size + header_length
+    header = json.loads(bytes(buffer[SNAPSHOT_PREAMBLE.size:header_end]).decode('utf-8'))
+    if header.get('byteorder') != sys.byteorder:
+        return None
+
+    data_start = _align8(header_end)
+    view = memoryview(buffer)
+    sections = {}
+    for name, (typecode, offset, count) in header['sections'].items():
+        start = data_start + offset
+        # The views keep the mapping alive; nothing is copied until a page is touched
+        sections[name] = view[start:start + count * array(typecode).itemsize].cast(typecode)
+    return header, sections
+
+def read_snapshot(path):
+    """Memory-map a snapshot file; returns (header, {name: memoryview}) or None if missing or incompatible"""
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    return parse_snapshot(mapped)
+
+class SharedGraphStore:
+    """Graph snapshots in a shared directory (tmpfs by default), one file per generation.
+
+    Workers map the files, so each generation has one copy in memory per host. An 8-byte control
+    file holds the current generation number; publishing writes the next file, bumps the counter
+    and unlinks the previous file, whose pages stay valid for workers that still map it. Updates
+    across workers are serialised with an flock on the control file, which each process opens
+    itself on first use: workers forked from a preloaded app would otherwise share one open file
+    description, and with it one flock.
+    """
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self._open_lock = threading.Lock()
+        self._pid = None
+        self._thread_lock = None
+        self._lock_depth = 0
+        self._control_file = None
+        self._control = None
+
+    def _open(self):
+        """The control file and its mapping in this process, opened on first use"""
+        if self._pid != os.getpid():
+            with self._open_lock:
+                if self._pid != os.getpid():
+                    # Files inherited from a parent process are left alone, not closed
+                    control_file = open(os.path.join(self.directory, f"{self.name}.ctl"), 'a+b')
+                    fcntl.flock(control_file, fcntl.LOCK_EX)
+                    try:
+                        if os.fstat(control_file.fileno()).st_size < 8:
+                            control_file.truncate(8)
+                    finally:
+                        fcntl.flock(control_file, fcntl.LOCK_UN)
+                    self._control = mmap.mmap(control_file.fileno(), 8)
+                    self._control_file = control_file
+                    self._thread_lock = threading.RLock()
+                    self._lock_depth = 0
+                    self._pid = os.getpid()
+        return self._control_file
+
+    def path(self, generation):
+        return os.path.join(self.directory, f"{self.name}.{generation}")
+
+    @contextmanager
+    def locked(self):
+        """Exclusive across processes, re-entrant within one"""
+        control_file = self._open()
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                fcntl.flock(control_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(control_file, fcntl.LOCK_UN)
+
+    def generation(self):
+        self._open()
+        return struct.unpack_from('<Q', self._control, 0)[0]
+
+    def publish(self, header, sections):
+        """Store a snapshot as the next generation and return its number"""
+        with self.locked():
+            previous = self.generation()
+            generation = previous + 1
+            write_snapshot(self.path(generation), header, sections)
+            struct.pack_into('<Q', self._control, 0, generation)
+            if previous:
+                try:
+                    os.unlink(self.path(previous))
+                except FileNotFoundError:
+                    pass
+        return generation
+
+    def attach(self):
+        """Map the current generation; returns (generation, header, sections) or None"""
+        for _ in range(3):
+            generation = self.generation()
+            if generation == 0:
+                return None
+            snapshot = read_snapshot(self.path(generation))
+            if snapshot is not None:
+                return (generation,) + snapshot
+            # Superseded between reading the counter and opening the file
+        return None
+
+class RouteCache:
+    """Bounded LRU of route searches with a TTL, keyed on where both points entered the network,
+    to the meter.
+
+    Keys end with the graph and road overlay versions so a result can never outlive the costs it
+    was found with; RoadGraph also clears the cache whenever it swaps in a new graph.
+    """
+    def __init__(self, max_size=ROUTE_CACHE_SIZE, ttl_s=ROUTE_CACHE_TTL_S):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """(True, value) on a hit, (False, None) on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_s)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def retag(self, old_tag, new_tag, keep):
+        """Move the entries whose key ends with old_tag to new_tag if keep(key, value) holds; every
+        other entry is dropped"""
+        with self._lock:
+            entries = OrderedDict()
+            for key, entry in self._entries.items():
+                if key[-len(old_tag):] == old_tag and keep(key, entry[0]):
+                    entries[key[:-len(old_tag)] + new_tag] = entry
+            self._entries = entries
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+# Graph class for route planning
+class RoadGraph:
+    def __init__(self, snap_tolerance_m=GRAPH_SNAP_TOLERANCE_M):
+        self.graph = CompactGraph.empty()
+        self.snap_tolerance_m = snap_tolerance_m
+        # Mutable source of the compact graph: the snapper's nodes and one record per road
+        self.snapper = NodeSnapper(snap_tolerance_m)
+        self.roads = {}
+        # Bumped on every rebuild so derived structures can tell they are stale
+        self.version = 0
+        self.hierarchy = None
+        self._lock = threading.Lock()
+        # Serialises rebuilds and road deltas against each other
+        self._update_lock = threading.RLock()
+        self._hierarchy_thread = None
+        # Row count and last change of the roads table the current graph reflects
+        self.fingerprint = None
+        self.shared = SharedGraphStore(GRAPH_SHARED_MEMORY_DIR, GRAPH_SHARED_MEMORY_NAME) if GRAPH_SHARED_MEMORY else None
+        # Shared generation the current graph was mapped from or published as, 0 for a private graph
+        self.shared_generation = 0
+        # False while serving a graph another worker published; only the publisher builds its hierarchy
+        self._owns_graph = True
+        self.route_cache = RouteCache()
+        # Live traffic penalties and closures as {road_id: factor}, inf for closed; searches run on
+        # a view of the graph with these applied, cached in _routing
+        self.overlay = {}
+        self.overlay_version = 0
+        self._routing = None
+        self._overlay_checked = None
+        # Grows up to ROAD_OVERLAY_MISSING_POLL_S while the road_overlays table is missing
+        self._overlay_interval = ROAD_OVERLAY_POLL_S
+        self._overlays_missing = False
+        self._overlay_lock = threading.Lock()
+        self.load_graph()
+
+    def load_graph(self):
+        """Attach to the shared graph or map the on-disk snapshot if either matches the roads table,
+        otherwise build from the database"""
+        # Holding the shared lock makes workers that boot together wait for one build
+        with self._exclusive():
+            conn = get_db_connection()
+            cur = conn.cursor()
+            try:
+                fingerprint = self._read_fingerprint(cur)
+            finally:
+                cur.close()
+                conn.close()
+
+            if fingerprint is not None:
+                if self.shared_generation and self.fingerprint == fingerprint:
+                    return
+                if GRAPH_SNAPSHOT_PATH and self.load_snapshot(GRAPH_SNAPSHOT_PATH, fingerprint):
+                    self._share()
+                    return
+
+            self.build_graph()
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialise graph updates within this process and, with shared memory, across workers.
+
+        Under the shared lock the newest generation is attached first, so a delta is never applied
+        on top of a graph another worker has already replaced.
+        """
+        with self._update_lock:
+            if self.shared is None:
+                yield
+                return
+            with self.shared.locked():
+                self.sync_shared()
+                yield
+
+    def sync_shared(self):
+        """Switch to the newest shared generation if another worker published one"""
+        if self.shared is None or self.shared.generation() == self.shared_generation:
+            return
+        # A worker in the middle of its own update syncs under the shared lock anyway
+        if not self._update_lock.acquire(blocking=False):
+            return
+        try:
+            attached = self.shared.attach()
+            if attached is None or attached[0] == self.shared_generation:
+                return
+            generation, header, sections = attached
+            graph = self._install_snapshot(header, sections, owned=False)
+            self.shared_generation = generation
+            app.logger.info(
+                f"Road graph shared generation {generation} attached as version {graph.version}"
+            )
+        finally:
+            self._update_lock.release()
+
+    def _share(self, only_if_current=False):
+        """Publish the current graph as the next shared generation.
+
+        With only_if_current the graph is skipped if another worker published since, which is how
+        a finished hierarchy is shared without overwriting a newer graph.
+        """
+        if self.shared is None:
+            return
+        # Taken before the shared lock; updates hold the two locks in the opposite order
+        payload = self._snapshot_payload()
+        if payload is None:
+            return
+        with self.shared.locked():
+            if only_if_current and self.shared.generation() != self.shared_generation:
+                return
+            try:
+                self.shared_generation = self.shared.publish(*payload)
+            except OSError as e:
+                app.logger.warning(f"Could not share road graph in {self.shared.directory}: {str(e)}")
+
+    def build_graph(self):
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+        try:
+            # Read the fingerprint first: a concurrent edit can only make the snapshot look stale
+            fingerprint = self._read_fingerprint(cur)
+            cur.execute(
+                "SELECT id, ST_AsText(geom) AS wkt, length_m, is_oneway, burmese_name, english_name, road_type "
+                "FROM roads;"
+            )
+            roads = cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+        with self._exclusive():
+            self.snapper = NodeSnapper(self.snap_tolerance_m)
+            self.roads = {str(road['id']): self._road_record(road) for road in roads}
+            self._publish(fingerprint)
+
+    def _read_fingerprint(self, cur):
+        """Identify the state of the roads table by row count and latest updated_at"""
+        try:
+            cur.execute("SELECT COUNT(*), MAX(updated_at) FROM roads;")
+            road_count, updated_at = cur.fetchone()
+        except psycopg2.Error as e:
+            # Databases without the roads.updated_at migration cannot validate snapshots
+            cur.connection.rollback()
+            app.logger.warning(f"Road graph snapshots disabled: {str(e)}")
+            return None
+        return f"{road_count}:{updated_at.isoformat() if updated_at else ''}"
+
+    def _road_record(self, road):
+        """Snap a roads row into its node sequence, per-segment lengths, direction and names"""
+        wkt = road['wkt']
+        segment_lengths = road['length_m']
+
+        coords_str = wkt.replace('LINESTRING(', '').replace(')', '')
+        coords_list = [tuple(map(float, c.split())) for c in coords_str.split(',')]
+
+        snapped_nodes = [self.snapper.snap(coord) for coord in coords_list]
+
+        nodes = array('i', snapped_nodes[:1])
+        lengths = array('d')
+        for i in range(len(snapped_nodes) - 1):
+            # Vertices merged by the snapper would otherwise become self-loops
+            if snapped_nodes[i] == snapped_nodes[i + 1]:
+                continue
+
+            if segment_lengths and i < len(segment_lengths):
+                segment_length = segment_lengths[i]
+            else:
+                segment_length = calculate_distance(coords_list[i], coords_list[i + 1])
+
+            nodes.append(snapped_nodes[i + 1])
+            lengths.append(segment_length)
+
+        return (nodes, lengths, bool(road['is_oneway']),
+                (road['burmese_name'], road['english_name'], road['road_type']))
+
+    def _ensure_snapper(self):
+        # Graphs mapped from a snapshot rebuild the snapping grid only when a road delta needs it
+        if self.snapper is None:
+            self.snapper = NodeSnapper.from_coordinates(self.graph.lon, self.graph.lat, self.snap_tolerance_m)
+
+    def _publish(self, fingerprint=None):
+        """Compile the road records into a new CompactGraph and swap it in"""
+        self._ensure_snapper()
+        sources, targets = array('i'), array('i')
+        weights, edge_roads = array('d'), array('i')
+        # Road UUIDs are interned once; edges refer to them by index
+        road_ids, road_info = [], []
+
+        for road_id, (nodes, lengths, is_oneway, names) in self.roads.items():
+            road_index = len(road_ids)
+            road_ids.append(road_id)
+            road_info.append(names + (is_oneway,))
+
+            for i, segment_length in enumerate(lengths):
+                sources.append(nodes[i])
+                targets.append(nodes[i + 1])
+                weights.append(segment_length)
+                edge_roads.append(road_index)
+
+                if not is_oneway:
+                    sources.append(nodes[i + 1])
+                    targets.append(nodes[i])
+                    weights.append(segment_length)
+                    edge_roads.append(road_index)
+
+        # Copy the coordinates: the snapper keeps growing as roads are added
+        graph = CompactGraph.from_edges(array('d', self.snapper.lon), array('d', self.snapper.lat),
+                                        sources, targets, weights, edge_roads, road_ids,
+                                        road_info=road_info)
+        graph.edge_index()
+        graph.prepare_profiles()
+
+        # Publish the finished graph in one step so requests never see a half-built one
+        graph.fingerprint = fingerprint
+        with self._lock:
+            self.version += 1
+            graph.version = self.version
+            self.graph = graph
+            self.fingerprint = fingerprint
+        self._owns_graph = True
+        self.route_cache.clear()
+        self.routing_graph()
+
+        footprint = graph.memory_footprint()
+        app.logger.info(
+            f"Road graph version {graph.version} published with {graph.node_count} nodes and "
+            f"{graph.edge_count} edges ({footprint['total_bytes'] / 1024:.0f} KiB)"
+        )
+        self.save_snapshot()
+        self._share()
+        self.schedule_hierarchy_build()
+
+    def save_snapshot(self, path=GRAPH_SNAPSHOT_PATH):
+        """Write the graph, its road records and a current hierarchy for later workers to map"""
+        if not path:
+            return
+        payload = self._snapshot_payload()
+        if payload is None:
+            return
+        try:
+            write_snapshot(path, *payload)
+        except OSError as e:
+            app.logger.warning(f"Could not write road graph snapshot to {path}: {str(e)}")
+
+    def _snapshot_payload(self):
+        """Returns (header, sections) describing the current graph, or None if its fingerprint is unknown"""
+        with self._update_lock:
+            graph, fingerprint = self.graph, self.fingerprint
+            roads = list(self.roads.items())
+            hierarchy = self.hierarchy if self.hierarchy is not None and self.hierarchy.graph is graph else None
+        if fingerprint is None:
+            return None
+
+        # Road records are stored CSR-style in the same order as graph.road_ids
+        road_offsets = array('i', [0])
+        road_nodes, road_lengths, road_oneway = array('i'), array('d'), array('b')
+        for _, (nodes, lengths, is_oneway, _) in roads:
+            road_nodes.extend(nodes)
+            road_lengths.extend(lengths)
+            road_oneway.append(is_oneway)
+            road_offsets.append(len(road_nodes))
+
+        sections = graph.arrays()
+        sections.update(road_offsets=road_offsets, road_nodes=road_nodes,
+                        road_lengths=road_lengths, road_oneway=road_oneway)
+        # Mapped with the graph, so workers share the profile weights as well
+        profiles, profile_sections = graph.profile_sections()
+        sections.update(profile_sections)
+        header = {
+            "fingerprint": fingerprint,
+            "snap_tolerance_m": self.snap_tolerance_m,
+            "road_ids": [road_id for road_id, _ in roads],
+            "road_names": [list(record[3]) for _, record in roads],
+            "shortcut_count": hierarchy.shortcut_count if hierarchy else None,
+            "profiles": profiles
+        }
+        if hierarchy:
+            sections.update({f"ch_{name}": values for name, values in hierarchy.arrays().items()})
+        return header, sections
+
+    def load_snapshot(self, path, fingerprint):
+        """Install the graph from a snapshot taken at fingerprint; returns False if it is missing or stale"""
+        started = time.monotonic()
+        snapshot = read_snapshot(path)
+        if snapshot is None:
+            return False
+        header, sections = snapshot
+        if header['fingerprint'] != fingerprint or header['snap_tolerance_m'] != self.snap_tolerance_m:
+            app.logger.info(f"Road graph snapshot {path} is stale, rebuilding")
+            return False
+
+        graph = self._install_snapshot(header, sections)
+        app.logger.info(
+            f"Road graph mapped from {path} with {graph.node_count} nodes and {graph.edge_count} edges "
+            f"in {(time.monotonic() - started) * 1000:.1f}ms"
+        )
+        return True
+
+    def _install_snapshot(self, header, sections, owned=True):
+        """Swap in the graph, road records and hierarchy held by a parsed snapshot"""
+        road_ids = header['road_ids']
+        road_offsets, road_nodes = sections['road_offsets'], sections['road_nodes']
+        road_lengths, road_oneway = sections['road_lengths'], sections['road_oneway']
+        roads, road_info = {}, []
+        for i, road_id in enumerate(road_ids):
+            start, end = road_offsets[i], road_offsets[i + 1]
+            names = tuple(header['road_names'][i])
+            # A road with n nodes has n - 1 lengths, so lengths are offset by the road index
+            roads[road_id] = (road_nodes[start:end], road_lengths[start - i:end - i - 1],
+                              bool(road_oneway[i]), names)
+            road_info.append(names + (bool(road_oneway[i]),))
+
+        graph = CompactGraph(*(sections[name] for name in CompactGraph.ARRAY_NAMES), road_ids,
+                             road_info=road_info)
+        graph.fingerprint = header['fingerprint']
+        graph.edge_index()
+        graph.load_profiles(header.get('profiles', {}), sections)
+        graph.prepare_profiles()
+        hierarchy = None
+        if header.get('shortcut_count') is not None:
+            hierarchy_arrays = {name: sections[f"ch_{name}"] for name in ContractionHierarchy.ARRAY_NAMES}
+            hierarchy = ContractionHierarchy.from_arrays(graph, hierarchy_arrays, header['shortcut_count'])
+
+        with self._update_lock:
+            self.snapper = None
+            self.roads = roads
+            with self._lock:
+                self.version += 1
+                graph.version = self.version
+                if hierarchy is not None:
+                    hierarchy.version = graph.version
+                self.graph = graph
+                self.hierarchy = hierarchy
+                self.fingerprint = header['fingerprint']
+            self._owns_graph = owned
+        self.route_cache.clear()
+        self.routing_graph()
+
+        if hierarchy is None and owned:
+            self.schedule_hierarchy_build()
+        return graph
+
+    def refresh_road(self, road_id):
+        """Re-read one road after an admin create/update and apply it as a delta.
+
+        Only that road is snapped; edges tagged with its id are replaced, so geometry, length_m and
+        is_oneway changes all take effect. A road that no longer exists is removed.
+        """
+        road_id = str(road_id)
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        try:
+            fingerprint = self._read_fingerprint(cur)
+            cur.execute(
+                "SELECT id, ST_AsText(geom) AS wkt, length_m, is_oneway, burmese_name, english_name, road_type "
+                "FROM roads WHERE id = %s;",
+                (road_id,)
+            )
+            road = cur.fetchone()
+        finally:
+            cur.close()
+            conn.close()
+
+        with self._exclusive():
+            if road is None:
+                if self.roads.pop(road_id, None) is not None:
+                    self._publish(fingerprint)
+                return
+
+            self._ensure_snapper()
+            self.roads[road_id] = self._road_record(road)
+            self._publish(fingerprint)
+
+    def remove_road(self, road_id):
+        """Drop every edge tagged with road_id after it was deleted from the roads table"""
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            fingerprint = self._read_fingerprint(cur)
+        finally:
+            cur.close()
+            conn.close()
+
+        with self._exclusive():
+            if self.roads.pop(str(road_id), None) is not None:
+                self._publish(fingerprint)
+
+    def memory_footprint(self):
+        footprint = self.graph.memory_footprint()
+        hierarchy = self.hierarchy
+        if hierarchy is not None:
+            footprint['hierarchy'] = hierarchy.memory_footprint()
+        return footprint
+
+    def hierarchy_status(self):
+        if not GRAPH_CH_ENABLED:
+            return 'disabled'
+        if self.hierarchy is not None and self.hierarchy.graph is self.graph:
+            return 'ready'
+        return 'stale'
+
+    def build_hierarchy(self):
+        """Contract the current graph and install the resulting hierarchy"""
+        graph = self.graph
+
+        started = time.monotonic()
+        hierarchy = ContractionHierarchy(graph)
+        app.logger.info(
+            f"Contraction hierarchy for graph version {graph.version} built with "
+            f"{hierarchy.shortcut_count} shortcuts in {time.monotonic() - started:.1f}s"
+        )
+
+        with self._lock:
+            installed = hierarchy.graph is self.graph
+            if installed:
+                self.hierarchy = hierarchy
+        if installed:
+            # Let other and later workers map the hierarchy instead of contracting again
+            self.save_snapshot()
+            self._share(only_if_current=True)
+        return hierarchy
+
+    def schedule_hierarchy_build(self):
+        """Rebuild the contraction hierarchy in the background; queries fall back to plain search meanwhile"""
+        if not GRAPH_CH_ENABLED:
+            return
+        with self._lock:
+            if self._hierarchy_thread is not None:
+                # The running build re-checks the graph when it finishes
+                return
+            self._hierarchy_thread = threading.Thread(target=self._run_hierarchy_builds, daemon=True)
+            self._hierarchy_thread.start()
+
+    def _run_hierarchy_builds(self):
+        try:
+            while True:
+                hierarchy = self.build_hierarchy()
+                with self._lock:
+                    # A graph attached from another worker is contracted by that worker
+                    if hierarchy.graph is self.graph or not self._owns_graph:
+                        self._hierarchy_thread = None
+                        return
+        except Exception as e:
+            app.logger.error(f"Contraction hierarchy build failed: {str(e)}")
+            with self._lock:
+                self._hierarchy_thread = None
+
+    def after_fork(self):
+        """Fresh locks and route cache for a forked child, which has only the thread that forked it:
+        a lock another thread (route writer, hierarchy build, overlay poll) held at that moment would
+        never be released"""
+        self._lock = threading.Lock()
+        self._update_lock = threading.RLock()
+        self._overlay_lock = threading.Lock()
+        self.route_cache = RouteCache()
+
+    def routing_graph(self):
+        """The graph searches run on: the current graph, or a view of it with the road overlay applied"""
+        with self._lock:
+            graph, overlay, version, routing = self.graph, self.overlay, self.overlay_version, self._routing
+        if not overlay:
+            return graph
+        if routing is not None and routing.base is graph and routing.overlay_version == version:
+            return routing
+        routing = graph.with_road_factors(overlay, version)
+        with self._lock:
+            if self.graph is graph and self.overlay_version == version:
+                self._routing = routing
+        return routing
+
+    def sync_overlays(self, force=False):
+        """Reload the road overlay once ROAD_OVERLAY_POLL_S has passed since the last check, or now
+        with force. Expired rows drop out here, within one poll of their expiry. Until the
+        road_overlays migration is applied, polls back off and the table is reported missing once."""
+        checked = self._overlay_checked
+        if not force and checked is not None and time.monotonic() - checked < self._overlay_interval:
+            return
+        # One thread polls; the others keep routing on the overlay they have
+        if not self._overlay_lock.acquire(blocking=force):
+            return
+        try:
+            if not force and self._overlay_checked is not checked:
+                return
+            self._overlay_checked = time.monotonic()
+            conn = get_db_connection()
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT road_id, factor, closed FROM road_overlays WHERE expires_at > NOW();")
+                rows = cur.fetchall()
+            except psycopg2.Error:
+                # Keep the request's connection usable, e.g. before the road_overlays migration
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+                conn.close()
+            if self._overlays_missing:
+                app.logger.info("Road overlays table found, road overlays enabled")
+                self._overlays_missing = False
+                self._overlay_interval = ROAD_OVERLAY_POLL_S
+            overlay = {str(road_id): float('inf') if closed else float(factor)
+                       for road_id, factor, closed in rows if closed or factor != 1}
+            self._apply_overlay(overlay)
+        except psycopg2.errors.UndefinedTable:
+            if not self._overlays_missing:
+                app.logger.warning("Road overlays disabled until the road_overlays table exists (06-road-overlays.sql)")
+                self._overlays_missing = True
+            self._overlay_interval = min(max(self._overlay_interval * 2, 1.0), ROAD_OVERLAY_MISSING_POLL_S)
+        except Exception as e:
+            app.logger.error(f"Road overlay refresh failed: {str(e)}")
+        finally:
+            self._overlay_lock.release()
+
+    def _apply_overlay(self, overlay):
+        """Route on a new overlay from now on; cached routes survive only if they are still optimal"""
+        with self._lock:
+            graph, previous, previous_version = self.graph, self.overlay, self.overlay_version
+        if overlay == previous:
+            return
+        version = previous_version + 1
+        # Built before the swap so no request waits for the new costs
+        routing = graph.with_road_factors(overlay, version) if overlay else None
+        with self._lock:
+            self.overlay, self.overlay_version = overlay, version
+            self._routing = routing if self.graph is graph else None
+
+        changed = {road_id for road_id in previous.keys() | overlay.keys()
+                   if previous.get(road_id, 1.0) != overlay.get(road_id, 1.0)}
+        app.logger.info(f"Road overlay version {version} applied to {len(overlay)} roads ({len(changed)} changed)")
+        if any(overlay.get(road_id, 1.0) < previous.get(road_id, 1.0) for road_id in changed):
+            # A cheaper road can shorten any route
+            self.route_cache.clear()
+            return
+        # Only costs went up: a cached route that travels no part of a changed road is still the best
+        # one. Views and the plain graph are cached under their overlay version, 0 without an overlay.
+        affected = {graph.road_index(road_id) for road_id in changed} - {None}
+        edge_roads = graph.edge_roads
+        self.route_cache.retag(
+            (graph.version, previous_version if previous else 0), (graph.version, version if overlay else 0),
+            lambda key, shape: shape is None or not affected & {
+                edge_roads[edge] for edge in (key[0], key[2]) + tuple(shape[3] or ())}
+        )
+
+    def shortest_path(self, graph, start, end, algorithm='dijkstra', stats=None, goal=None, profile='shortest'):
+        if algorithm == 'ch':
+            hierarchy = self.hierarchy
+            if profile == 'shortest' and hierarchy is not None and hierarchy.graph is graph:
+                return hierarchy.shortest_path(start, end, stats)
+            # Hierarchy missing or stale after a road edit, or an overlay is active; it only ever
+            # holds plain lengths
+            if stats is not None:
+                stats['fallback'] = 'bidirectional'
+            algorithm = 'bidirectional'
+
+        return graph.shortest_path(start, end, algorithm, stats, goal, profile)
+
+    def dijkstra(self, start, end):
+        return self.find_route(start, end, algorithm='dijkstra')
+
+    def find_route(self, start, end, algorithm='dijkstra', stats=None, profile='shortest'):
+        """Route between two points, each entering the network where it projects onto the nearest road.
+
+        Returns (line_coords, total_distance, road_segments); road_segments starts and ends with the
+        straight user_to_road / road_to_user legs and lists a partial length for the first and last
+        road. Every segment carries its travel time under 'duration'. The route minimises the cost
+        of the given profile. Returns (None, 0, []) if either point is too far from a road or no
+        path exists. A stats dict also receives the searched graph's cost_key.
+        """
+        # Pin one graph for the whole request; a rebuild or overlay change may swap it meanwhile
+        graph = self.routing_graph()
+        if stats is not None:
+            stats['cost_key'] = graph.cost_key()
+        start_snap = graph.snap_to_road(start, profile=profile)
+        end_snap = graph.snap_to_road(end, profile=profile)
+
+        if start_snap is None or end_snap is None:
+            app.logger.warning(f"Couldn't snap to a road: start={start}, end={end}")
+            return None, 0, []
+
+        start_edge, start_fraction, start_coord, start_to_road_distance = start_snap
+        end_edge, end_fraction, end_coord, road_to_end_distance = end_snap
+
+        # Points within about a meter share an entry, like route ids; the cached route is fitted to
+        # the exact points, and searched again in the rare case it does not fit them
+        cache_key = (start_edge, round(start_fraction * graph.weights[start_edge]),
+                     end_edge, round(end_fraction * graph.weights[end_edge]), algorithm, profile,
+                     graph.version, graph.overlay_version)
+        cached, shape = self.route_cache.get(cache_key)
+        pieces = self._route_pieces(graph, start_snap, end_snap, shape, profile) if cached and shape is not None else None
+        if cached and shape is not None and pieces is None:
+            cached = False
+        if stats is not None:
+            stats['cache_hit'] = cached
+        if not cached:
+            shape = self._search_route(graph, start_snap, end_snap, algorithm, stats, profile)
+            self.route_cache.put(cache_key, shape)
+            pieces = self._route_pieces(graph, start_snap, end_snap, shape, profile) if shape is not None else None
+
+        if pieces is None:
+            app.logger.warning(f"No path found: start={start} end={end}")
+            return None, 0, []
+        times = graph.profile_weights(profile)[1]
+        leg_speed = ROUTE_PROFILES[profile].leg_speed
+
+        # Build coordinates and segments
+        line_coords = [start]
+        road_segments = []
+
+        if start_to_road_distance > 0:
+            road_segments.append({
+                'road_id': 'user_to_road',
+                'length': start_to_road_distance,
+                'duration': start_to_road_distance / leg_speed,
+                'type': 'user_segment',
+                'from': start,
+                'to': start_coord
+            })
+            line_coords.append(start_coord)
+
+        route_distance = 0
+        for edge, portion, coord in pieces:
+            length = portion * graph.weights[edge]
+            # A point snapped exactly onto a node leaves an empty piece
+            if length <= 0:
+                continue
+            route_distance += length
+            line_coords.append(coord)
+            road_segments.append({
+                'road_id': graph.road_ids[graph.edge_roads[edge]],
+                'length': length,
+                'duration': portion * times[edge]
+            })
+
+        if road_to_end_distance > 0:
+            road_segments.append({
+                'road_id': 'road_to_user',
+                'length': road_to_end_distance,
+                'duration': road_to_end_distance / leg_speed,
+                'type': 'user_segment',
+                'from': end_coord,
+                'to': end
+            })
+
+        if line_coords[-1] != end:
+            line_coords.append(end)
+
+        total_distance = start_to_road_distance + route_distance + road_to_end_distance
+
+        return line_coords, total_distance, road_segments
+
+    def _search_route(self, graph, start_snap, end_snap, algorithm, stats=None, profile='shortest'):
+        """Search between two snapped points; returns the route's shape or None without a path.
+
+        The shape is (direct_edge, None, None, None) for a route along the one road segment both
+        points lie on, else (None, origin node, destination node, edge slots between them).
+        """
+        start_edge, start_fraction, _, _ = start_snap
+        end_edge, end_fraction, end_coord, _ = end_snap
+        costs = graph.profile_weights(profile)[0]
+
+        # The snapped points split their edges; each piece leads to or from one end node of the edge
+        origins, _ = self._split_edge(graph, start_edge, start_fraction, leaving=True, costs=costs)
+        destinations, _ = self._split_edge(graph, end_edge, end_fraction, leaving=False, costs=costs)
+
+        route_cost, path = self.shortest_path(graph, origins, destinations, algorithm, stats,
+                                              goal=end_coord, profile=profile)
+
+        # Both points on the same road segment: travelling along it may beat leaving it
+        direct_cost, direct_edge, _ = self._direct_distance(graph, start_snap, end_snap, costs)
+        if direct_cost < route_cost:
+            return direct_edge, None, None, None
+        if path is None:
+            return None
+        if path:
+            return None, graph.sources[path[0]], graph.targets[path[-1]], path
+        # The two pieces meet at a node
+        meeting = min(origins.keys() & destinations.keys(), key=lambda node: origins[node] + destinations[node])
+        return None, meeting, meeting, path
+
+    def _route_pieces(self, graph, start_snap, end_snap, shape, profile='shortest'):
+        """(edge, portion of the edge travelled, end_coord) for each edge of a route shape between
+        two snapped points, the first and last partial; None if the points cannot travel it"""
+        direct_edge, origin, destination, path = shape
+        end_coord = end_snap[2]
+        costs = graph.profile_weights(profile)[0]
+        if direct_edge is not None:
+            _, edge, portion = self._direct_distance(graph, start_snap, end_snap, costs)
+            return [(direct_edge, portion, end_coord)] if edge == direct_edge else None
+
+        _, origin_pieces = self._split_edge(graph, start_snap[0], start_snap[1], leaving=True, costs=costs)
+        _, destination_pieces = self._split_edge(graph, end_snap[0], end_snap[1], leaving=False, costs=costs)
+        if origin not in origin_pieces or destination not in destination_pieces:
+            return None
+        pieces = [origin_pieces[origin] + (graph.coord(origin),)]
+        pieces += [(edge, 1.0, graph.coord(graph.targets[edge])) for edge in path]
+        pieces.append(destination_pieces[destination] + (end_coord,))
+        return pieces
+
+    def distance_matrix(self, sources, destinations, max_distance=float('inf'), profile='shortest'):
+        """Road distances (meters) and travel times (seconds) from every source point to every
+        destination point along the route a profile prefers.
+
+        Each point is snapped once; every source then runs a single one-to-many search that stops
+        when all destination nodes are settled or, for distance profiles, past max_distance. Times
+        are summed from the profile's edge travel times like find_route's. Returns (rows, snapped)
+        with (meters, seconds) or None for pairs without a path within max_distance, and snapped
+        flags for sources followed by destinations. Closed roads are avoided.
+        """
+        graph = self.routing_graph()
+        costs, times, _ = graph.profile_weights(profile)
+        route_profile = ROUTE_PROFILES[profile]
+        source_snaps = [graph.snap_to_road(point, profile=profile) for point in sources]
+        destination_snaps = [graph.snap_to_road(point, profile=profile) for point in destinations]
+        arrivals = [self._split_edge(graph, snap[0], snap[1], leaving=False, costs=costs) if snap else ({}, {})
+                    for snap in destination_snaps]
+        target_nodes = set().union(*(arrival for arrival, _ in arrivals))
+
+        def piece_totals(slot, portion):
+            return (portion * graph.weights[slot], portion * times[slot]) if portion > 0 else (0.0, 0.0)
+
+        rows = []
+        for source, source_snap in zip(sources, source_snaps):
+            if source_snap is None:
+                rows.append([None] * len(destinations))
+                continue
+            origins, origin_pieces = self._split_edge(graph, source_snap[0], source_snap[1], leaving=True, costs=costs)
+            # Distance costs never undercount meters, so they can bound the search; legs count too
+            limit = max_distance - source_snap[3] if route_profile.cost == 'distance' else float('inf')
+            previous = {}
+            reached = graph.distances_to(origins, target_nodes, limit, costs, previous)
+            starts = {node: piece_totals(*piece) for node, piece in origin_pieces.items()}
+            meters = self._tree_sums(graph, previous, {node: value[0] for node, value in starts.items()},
+                                     reached, graph.weights)
+            seconds = self._tree_sums(graph, previous, {node: value[1] for node, value in starts.items()},
+                                      reached, times)
+            leg_time = source_snap[3] / route_profile.leg_speed
+
+            row = []
+            for destination, destination_snap, (arrival, arrival_pieces) in zip(destinations, destination_snaps, arrivals):
+                if destination_snap is None:
+                    row.append(None)
+                    continue
+                if destination == source:
+                    row.append((0.0, 0.0))
+                    continue
+                best_cost, best = float('inf'), None
+                for node, cost in arrival.items():
+                    if node in reached and reached[node] + cost < best_cost:
+                        piece_meters, piece_seconds = piece_totals(*arrival_pieces[node])
+                        best_cost, best = reached[node] + cost, (meters[node] + piece_meters, seconds[node] + piece_seconds)
+                direct_cost, direct_edge, direct_portion = self._direct_distance(graph, source_snap, destination_snap, costs)
+                if direct_cost < best_cost:
+                    best_cost, best = direct_cost, piece_totals(direct_edge, direct_portion)
+                if best is None:
+                    row.append(None)
+                    continue
+                total = source_snap[3] + best[0] + destination_snap[3]
+                duration = leg_time + best[1] + destination_snap[3] / route_profile.leg_speed
+                row.append((total, duration) if total <= max_distance else None)
+            rows.append(row)
+
+        return rows, [snap is not None for snap in source_snaps + destination_snaps]
+
+    @staticmethod
+    def _tree_sums(graph, previous, start_values, nodes, values):
+        """Per-edge values summed along the search tree (edge slots in previous) to each of nodes,
+        starting from start_values at the nodes the search started from"""
+        sums = {node: value for node, value in start_values.items() if previous.get(node) == -1}
+        for node in nodes:
+            trail = []
+            while node not in sums:
+                trail.append(node)
+                node = graph.sources[previous[node]]
+            total = sums[node]
+            for node in reversed(trail):
+                total += values[previous[node]]
+                sums[node] = total
+        return sums
+
+    def isochrone(self, point, budgets, by_time=False):
+        """Road network reachable from a point within each budget (ascending): meters, or with
+        by_time seconds summed from the shortest profile's edge travel times like find_route's.
+
+        One search bounded by the largest budget serves every band. Returns None if the point is too
+        far from a road, else a dict with 'nodes' as (lon, lat, distance), 'edges' as (from, to,
+        distance at from, distance at to) covering each reachable road piece, and 'band_points', per
+        budget, the reachable nodes plus the points where roads cross that budget, all in the
+        budget's unit. The road overlay scales distances and times along roads, so a penalised road
+        reaches less far and a closed one not at all.
+        """
+        graph = self.routing_graph()
+        snap = graph.snap_to_road(point)
+        if snap is None:
+            return None
+        edge, fraction, foot, leg = snap
+        limit = budgets[-1]
+        costs, times, _ = graph.profile_weights()
+        if by_time:
+            costs, leg = times, leg / ROUTE_PROFILES['shortest'].leg_speed
+
+        origins, _ = self._split_edge(graph, edge, fraction, leaving=True, costs=costs)
+        reached = graph.distances_to({node: leg + distance for node, distance in origins.items()},
+                                     max_distance=limit, weights=costs)
+
+        # Road pieces as (from, to, distance at from, length): out of the snapped point, then every
+        # edge leaving a reached node
+        pieces = [(foot, graph.coord(graph.targets[slot]), leg, (1 - position) * costs[slot], None)
+                  for slot, position in self._edge_directions(graph, edge, fraction) if costs[slot] < math.inf]
+        for node, distance in reached.items():
+            for slot in range(graph.offsets[node], graph.offsets[node + 1]):
+                if costs[slot] < math.inf:
+                    pieces.append((graph.coord(node), graph.coord(graph.targets[slot]), distance, costs[slot], slot))
+
+        def covered(piece, budget):
+            return max(0.0, min(piece[3], budget - piece[2]))
+
+        def along(piece, length):
+            (x1, y1), (x2, y2), _, total, _ = piece
+            t = length / total if total > 0 else 1.0
+            return (x1 + (x2 - x1) * t, y1 + (y2 - y1) * t)
+
+        edges = []
+        for piece in pieces:
+            length = covered(piece, limit)
+            if length <= 0:
+                continue
+            slot = piece[4]
+            reverse = graph.reverse_edge(slot) if slot is not None else None
+            # A two-way road fully covered from its other end is listed once
+            if reverse is not None and graph.targets[slot] in reached:
+                other = reached[graph.targets[slot]]
+                if other + costs[reverse] <= limit and (length < piece[3] or reverse < slot):
+                    continue
+            edges.append((piece[0], along(piece, length), piece[2], piece[2] + length))
+
+        band_points = []
+        for budget in budgets:
+            points = [foot] if leg <= budget else []
+            points += [graph.coord(node) for node, distance in reached.items() if distance <= budget]
+            points += [along(piece, budget - piece[2]) for piece in pieces if piece[2] < budget < piece[2] + piece[3]]
+            band_points.append(points)
+
+        nodes = [graph.coord(node) + (distance,) for node, distance in reached.items()]
+        return {"nodes": nodes, "edges": edges, "band_points": band_points}
+
+    @classmethod
+    def _direct_distance(cls, graph, start_snap, end_snap, costs=None):
+        """(cost, edge, portion of the edge) travelling straight along a road segment both points lie
+        on, else (inf, None, 0); costs default to the graph's shortest-profile costs"""
+        costs = graph.profile_weights()[0] if costs is None else costs
+        best_cost, best_edge, best_portion = float('inf'), None, 0.0
+        start_positions = dict(cls._edge_directions(graph, start_snap[0], start_snap[1]))
+        for edge, fraction in cls._edge_directions(graph, end_snap[0], end_snap[1]):
+            start_position = start_positions.get(edge)
+            if start_position is not None and start_position <= fraction:
+                portion = fraction - start_position
+                cost = portion * costs[edge] if portion > 0 else 0.0
+                if cost < best_cost:
+                    best_cost, best_edge, best_portion = cost, edge, portion
+        return best_cost, best_edge, best_portion
+
+    @classmethod
+    def _split_edge(cls, graph, edge, fraction, leaving, costs=None):
+        """Nodes reachable from (leaving) or leading to a point on an edge, as ({node: cost},
+        {node: (edge slot of the piece, portion of the slot it covers)}); costs default to the
+        graph's shortest-profile costs"""
+        costs = graph.profile_weights()[0] if costs is None else costs
+        distances, pieces = {}, {}
+        for slot, position in cls._edge_directions(graph, edge, fraction):
+            length = graph.weights[slot]
+            # A point on top of a node may use every edge of that node, one-way or not
+            for node, distance in ((graph.sources[slot], position * length), (graph.targets[slot], (1 - position) * length)):
+                if distance < 1e-6:
+                    distances[node], pieces[node] = 0.0, (slot, 0.0)
+            node, portion = (graph.targets[slot], 1 - position) if leaving else (graph.sources[slot], position)
+            # A closed edge costs inf, and 0 * inf is not 0
+            cost = portion * costs[slot] if portion > 0 else 0.0
+            if cost < distances.get(node, float('inf')):
+                distances[node], pieces[node] = cost, (slot, portion)
+        return distances, pieces
+
+    @staticmethod
+    def _edge_directions(graph, edge, fraction):
+        """(edge, fraction along it) for each direction a point on a road segment can travel"""
+        directions = [(edge, fraction)]
+        reverse = graph.reverse_edge(edge)
+        if reverse is not None:
+            directions.append((reverse, 1 - fraction))
+        return directions
+
+# Names shown for the straight legs between the user's points and the road network
+USER_SEGMENT_NAMES = {
+    'user_to_road': {
+        'burmese': 'စတင်သည့်နေရာမှအနီးဆုံးသတ်မှတ်နေရာသို့',
+        'english': 'From Start Location to Nearest Defined Location'
+    },
+    'road_to_user': {
+        'burmese': 'အနီးဆုံးသတ်မှတ်နေရာမှပြီးဆုံးနေရာသို့',
+        'english': 'From Nearest Defined Location to End Location'
+    }
+}
+
+def build_road_names(road_segments, graph=None):
+    """Describe route segments with road names from the in-memory graph instead of the database"""
+    graph = graph or road_graph.graph
+    road_names = []
+    for segment in road_segments:
+        road_id = str(segment['road_id'])
+
+        if segment['road_id'] in USER_SEGMENT_NAMES:
+            road_names.append({
+                'road_id': road_id,
+                'burmese_name': USER_SEGMENT_NAMES[segment['road_id']]['burmese'],
+                'english_name': USER_SEGMENT_NAMES[segment['road_id']]['english'],
+                'length': f"{segment['length']} meters",
+                'type': 'user_segment'
+            })
+        elif segment['road_id'] == 'unknown_road':
+            road_names.append({
+                'road_id': road_id,
+                'burmese_name': 'အမည်မသိလမ်း',
+                'english_name': 'Unknown Road Segment',
+                'length': f"{segment['length']} meters",
+                'type': 'unknown_segment'
+            })
+        else:
+            road_data = graph.road_metadata(road_id)
+            if road_data:
+                road_names.append({
+                    'road_id': road_id,
+                    'burmese_name': road_data['burmese_name'],
+                    'english_name': road_data['english_name'],
+                    'length': f"{segment['length']} meters"
+                })
+            else:
+                road_names.append({
+                    'road_id': road_id,
+                    'burmese_name': 'အမည်မသိလမ်း',
+                    'english_name': 'Unknown Road',
+                    'length': f"{segment['length']} meters"
+                })
+    return road_names
+
+class LocationIndex:
+    """Process-wide copy of the locations table with a grid index for proximity lookups.
+
+    Admin edits in this worker refresh it immediately; other workers reload it once it is older
+    than ttl_s (0 disables the age check).
+    """
+    def __init__(self, ttl_s=LOCATION_INDEX_TTL_S):
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        # (locations, NodeIndex over them, load time), swapped as a whole
+        self._state = None
+
+    def refresh(self):
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        try:
+            cur.execute(
+                "SELECT id, burmese_name, english_name, address, "
+                "ST_X(geom::geometry) AS lon, ST_Y(geom::geometry) AS lat "
+                "FROM locations;"
+            )
+            locations = [dict(row) for row in cur.fetchall()]
+        finally:
+            cur.close()
+            conn.close()
+
+        index = NodeIndex(array('d', (loc['lon'] for loc in locations)),
+                          array('d', (loc['lat'] for loc in locations)),
+                          range(len(locations)))
+        self._state = (locations, index, time.monotonic())
+        app.logger.info(f"Location index loaded with {len(locations)} locations")
+
+    def _current(self):
+        state = self._state
+        if state is None or (self.ttl_s and time.monotonic() - state[2] > self.ttl_s):
+            with self._lock:
+                # Another thread may have reloaded while this one waited
+                if self._state is state:
+                    self.refresh()
+            state = self._state
+        return state
+
+    def nearest(self, point, max_dist=500, k=1):
+        """Up to k (location, meters) pairs within max_dist of point, nearest first"""
+        locations, index, _ = self._current()
+        return [(locations[i], distance) for i, distance in index.nearest(point, k, max_dist)]
+
+    def within(self, point, radius_m):
+        """Every (location, meters) pair within radius_m of point, nearest first"""
+        locations, index, _ = self._current()
+        return [(locations[i], distance) for i, distance in index.within(point, radius_m)]
+
+    def corridor(self, path_coords, radius_m=STEP_LOCATION_RADIUS_M):
+        """Locations near a route polyline, in one vectorised pass.
+
+        Returns (matches, vertex_along, vertex_covered): matches are (location, meters along the
+        route to its projection) for every location within radius_m of the polyline, in route
+        order; vertex_along holds the distance along the route of each vertex and vertex_covered
+        whether any location is within radius_m of that vertex.
+        """
+        locations, index, _ = self._current()
+        path = np.asarray(path_coords, dtype=np.float64).reshape(-1, 2)
+        # Local equirectangular meters around the route
+        y_scale = index.y_scale
+        x_scale = y_scale * math.cos(math.radians(float(path[:, 1].mean())))
+        x, y = path[:, 0] * x_scale, path[:, 1] * y_scale
+        segment_lengths = np.hypot(np.diff(x), np.diff(y))
+        vertex_along = np.r_[0.0, np.cumsum(segment_lengths)]
+
+        # Only locations inside the route's bounding box grown by the radius can match
+        lon, lat = index.lon, index.lat
+        margin_lon, margin_lat = radius_m / x_scale * 1.01, radius_m / y_scale * 1.01
+        candidates = np.flatnonzero(
+            (lon >= path[:, 0].min() - margin_lon) & (lon <= path[:, 0].max() + margin_lon) &
+            (lat >= path[:, 1].min() - margin_lat) & (lat <= path[:, 1].max() + margin_lat)
+        )
+        if not len(candidates) or len(path) < 2:
+            return [], vertex_along, np.zeros(len(path), dtype=bool)
+
+        # Distance from every candidate to every segment, keeping the closest segment
+        px, py = (lon[candidates] * x_scale)[:, None], (lat[candidates] * y_scale)[:, None]
+        ax, ay, dx, dy = x[:-1], y[:-1], np.diff(x), np.diff(y)
+        length2 = np.where(segment_lengths > 0, segment_lengths ** 2, 1)
+        t = np.clip(((px - ax) * dx + (py - ay) * dy) / length2, 0, 1)
+        distances = np.hypot(ax + t * dx - px, ay + t * dy - py)
+        closest = distances.argmin(axis=1)
+        rows = np.arange(len(candidates))
+        near = distances[rows, closest] <= radius_m
+        along = vertex_along[closest] + t[rows, closest] * segment_lengths[closest]
+
+        order = np.flatnonzero(near)[np.argsort(along[near], kind='stable')]
+        matches = [(locations[candidates[i]], float(along[i])) for i in order]
+
+        # A location within radius_m of a vertex is also within radius_m of the polyline
+        matched = candidates[near]
+        vertex_distances = np.hypot(x[:, None] - lon[matched] * x_scale, y[:, None] - lat[matched] * y_scale)
+        vertex_covered = (vertex_distances <= radius_m).any(axis=1)
+        return matches, vertex_along, vertex_covered
+
+def find_nearest_location(point, max_dist=500):
+    nearest = location_index.nearest(point, max_dist)
+    return nearest[0][0] if nearest else None
+
+# A history row's route line: the shared road route between the user's own points. Rows saved
+# before history kept the user's points have the whole route in the routes row.
+HISTORY_GEOMETRY = (
+    "CASE WHEN h.start_loc IS NULL THEN r.geom::geometry ELSE ST_RemoveRepeatedPoints(ST_MakeLine("
+    "ARRAY[h.start_loc::geometry, r.geom::geometry, h.end_loc::geometry])) END"
+)
+
+def stored_road_segments(cur, item, start_coords, end_coords):
+    """Road segments saved with a history row's route, with the user's own legs.
+
+    Routes saved before segments were stored get them computed once and written back.
+    """
+    if item['shared_route']:
+        return with_user_legs(item['road_segments'], start_coords, safe_extract_coordinates(item, 'road_start'),
+                              safe_extract_coordinates(item, 'road_end'), end_coords)
+    if item['road_segments'] is not None:
+        return item['road_segments']
+    if not (start_coords and end_coords and item['geojson']):
+        return []
+
+    _, _, road_segments = road_graph.dijkstra(start_coords, end_coords)
+    if road_segments:
+        cur.execute(
+            "UPDATE routes SET road_segments = %s WHERE id = %s AND road_segments IS NULL;",
+            (psycopg2.extras.Json(road_segments), item['route_id'])
+        )
+        cur.connection.commit()
+    return road_segments
+
+def location_step(location):
+    return {
+        "burmese_name": location["burmese_name"],
+        "english_name": location["english_name"],
+        "address": location["address"],
+        "longitude": location["lon"],
+        "latitude": location["lat"],
+        "type": "defined_location"
+    }
+
+def build_step_locations(path_coords, close_start_location=None, close_end_location=None):
+    """The start, every location along the route corridor in route order, road points with no
+    location nearby and the end. Entries are de-duplicated by coordinates rounded to 7 decimals."""
+    step_locations = []
+    added_locations = set()
+    if not path_coords:
+        return step_locations
+
+    matches, vertex_along, vertex_covered = location_index.corridor(path_coords)
+
+    # Intermediate vertices and corridor locations, merged by position along the route
+    events = [(vertex_along[i], 0, i) for i in range(1, len(path_coords) - 1)]
+    events += [(along, 1, n) for n, (_, along) in enumerate(matches)]
+    events.sort()
+
+    start = path_coords[0]
+    if close_start_location:
+        step_locations.append(location_step(close_start_location))
+        added_locations.add(f"{close_start_location['lon']:.7f},{close_start_location['lat']:.7f}")
+    else:
+        step_locations.append({
+            "longitude": start[0],
+            "latitude": start[1],
+            "coordinates": f"{start[0]}, {start[1]}",
+            "type": "user_input_start"
+        })
+        added_locations.add(f"{start[0]:.7f},{start[1]:.7f}")
+
+    # The location at the end belongs last, not where the corridor passes it
+    end_location_key = f"{close_end_location['lon']:.7f},{close_end_location['lat']:.7f}" \
+        if close_end_location else None
+
+    for _, is_location, i in events:
+        if is_location:
+            loc = matches[i][0]
+            loc_coord_key = f"{loc['lon']:.7f},{loc['lat']:.7f}"
+            if loc_coord_key not in added_locations and loc_coord_key != end_location_key:
+                step_locations.append(location_step(loc))
+                added_locations.add(loc_coord_key)
+            continue
+
+        coord = path_coords[i]
+        coord_key = f"{coord[0]:.7f},{coord[1]:.7f}"
+        if coord == path_coords[i - 1] or coord_key in added_locations or vertex_covered[i]:
+            continue
+        step_locations.append({
+            "longitude": coord[0],
+            "latitude": coord[1],
+            "coordinates": f"{coord[0]}, {coord[1]}",
+            "type": "road_point"
+        })
+        added_locations.add(coord_key)
+
+    if len(path_coords) > 1:
+        end = path_coords[-1]
+        coord_key = f"{end[0]:.7f},{end[1]:.7f}"
+        if end != path_coords[-2] and coord_key not in added_locations:
+            if close_end_location:
+                if end_location_key not in added_locations:
+                    step_locations.append(location_step(close_end_location))
+                    added_locations.add(end_location_key)
+            else:
+                step_locations.append({
+                    "longitude": end[0],
+                    "latitude": end[1],
+                    "coordinates": f"{end[0]}, {end[1]}",
+                    "type": "user_input_end"
+                })
+                added_locations.add(coord_key)
+
+    return step_locations
+
+# Extended WKB with the SRID, read by ST_GeomFromEWKB without parsing any text
+EWKB_SRID_FLAG = 0x20000000
+EWKB_HEADER = struct.Struct('<BII')
+
+def ewkb_point(point):
+    return EWKB_HEADER.pack(1, 1 | EWKB_SRID_FLAG, 4326) + struct.pack('<2d', *point)
+
+def ewkb_linestring(coords):
+    flat = [value for coord in coords for value in coord]
+    return EWKB_HEADER.pack(1, 2 | EWKB_SRID_FLAG, 4326) + struct.pack(f'<I{len(flat)}d', len(coords), *flat)
+
+# Namespace of shared route ids
+ROUTE_ID_NAMESPACE = uuid.UUID('94c1b5cd-d1c0-4491-b490-1f73c8d6b620')
+# Decimal places of the snapped endpoints in a route id; 5 is about a meter
+ROUTE_ID_DECIMALS = 5
+
+def road_route(path_coords, road_segments):
+    """The part of a find_route result that runs on the road network, shared by every user whose
+    points snap to the same places: (snapped start, snapped end, line coords, road segments)"""
+    legs = {segment['road_id']: segment for segment in road_segments if segment.get('type') == 'user_segment'}
+    segments = [segment for segment in road_segments if segment.get('type') != 'user_segment']
+    first = 1 if 'user_to_road' in legs else 0
+    last = len(path_coords) - 1 if 'road_to_user' in legs else len(path_coords)
+    coords = path_coords[first:last]
+    if len(coords) < 2:
+        # Both points snapped to the same place; a line still needs two points
+        coords = [coords[0], coords[0]] if coords else [path_coords[0], path_coords[0]]
+    return coords[0], coords[-1], coords, segments
+
+def shared_route_id(road_start, road_end, profile, cost_key, coords, road_segments):
+    """Deterministic id of a shared route row, so routes between the same snapped points reuse it.
+
+    The id covers the snapped endpoints, the profile and the graph's cost_key, which is the same in
+    every worker for the same roads and overlay. Without a cost key the stored route itself is
+    hashed instead.
+    """
+    ends = [[round(value, ROUTE_ID_DECIMALS) for value in point] for point in (road_start, road_end)]
+    key = [ends, profile, cost_key] if cost_key is not None else [ends, profile, coords, road_segments]
+    return str(uuid.uuid5(ROUTE_ID_NAMESPACE, json.dumps(key, separators=(',', ':'), sort_keys=True)))
+
+def with_user_legs(road_segments, user_start, road_start, road_end, user_end):
+    """Shared road segments with the straight legs between a user's own points and the road"""
+    segments = list(road_segments)
+    start_leg, end_leg = calculate_distance(user_start, road_start), calculate_distance(road_end, user_end)
+    if start_leg > 0:
+        segments.insert(0, {'road_id': 'user_to_road', 'length': start_leg, 'type': 'user_segment',
+                            'from': user_start, 'to': road_start})
+    if end_leg > 0:
+        segments.append({'road_id': 'road_to_user', 'length': end_leg, 'type': 'user_segment',
+                         'from': road_end, 'to': user_end})
+    return segments
+
+class RouteWriter:
+    """Write-behind queue for planned routes and their history rows.
+
+    plan_route generates both ids itself and returns without waiting; a daemon thread saves
+    queued routes in batches of up to ROUTE_WRITE_BATCH_SIZE, one transaction per batch. When the
+    queue is full the request writes its own route instead, so routes are never dropped. Queued
+    rows are seen by history reads in any worker once their batch commits, not before.
+    Route rows hold only the shared road part under a shared_route_id, so a route saved before
+    only gains a history row; the user's own points and totals go in the history row.
+    """
+    ROUTE_TEMPLATE = ("(%(route_id)s, ST_GeomFromEWKB(%(start_loc)s)::geography, "
+                      "ST_GeomFromEWKB(%(end_loc)s)::geography, %(total_distance_m)s, "
+                      "%(estimated_time_s)s, ST_GeomFromEWKB(%(geom)s)::geography, %(road_segments)s)")
+    HISTORY_TEMPLATE = ("(%(history_id)s, %(user_id)s, %(route_id)s, %(start_name)s, %(end_name)s, "
+                        "%(history_distance_m)s, %(duration_min)s, ST_GeomFromEWKB(%(user_start_loc)s)::geography, "
+                        "ST_GeomFromEWKB(%(user_end_loc)s)::geography)")
+
+    def __init__(self, max_size=ROUTE_WRITE_QUEUE_SIZE, batch_size=ROUTE_WRITE_BATCH_SIZE,
+                 interval_s=ROUTE_WRITE_INTERVAL_S):
+        self.batch_size = batch_size
+        self.interval_s = interval_s
+        self._queue = queue.Queue(max_size)
+        # Serialises batches; flush() holds it so a batch in flight is committed before it returns
+        self._write_lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self.written = 0
+        self.failed = 0
+        self.routes_reused = 0
+        self.inline_writes = 0
+        self.last_error = None
+
+    def submit(self, record):
+        """Queue a route record (see plan_route) for saving; returns 'pending' once queued, or with a
+        full queue 'saved' or 'failed' for the write made on the calling thread"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(record)
+            return 'pending'
+        except queue.Full:
+            with self._stats_lock:
+                self.inline_writes += 1
+            return 'saved' if self._write([record]) else 'failed'
+
+    def _ensure_thread(self):
+        # A forked worker does not inherit the thread, only a copy of the queue
+        if self._thread_pid != os.getpid():
+            with self._stats_lock:
+                if self._thread_pid != os.getpid():
+                    self._thread = threading.Thread(target=self._run, name='route-writer', daemon=True)
+                    self._thread.start()
+                    self._thread_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.interval_s)
+            except queue.Empty:
+                continue
+            self._write(self._drain([first]))
+
+    def _drain(self, batch):
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Save everything queued so far on the calling thread"""
+        with self._write_lock:
+            while not self._queue.empty():
+                self._write(self._drain([]))
+
+    def _write(self, records):
+        """Save records, returning how many were saved"""
+        if not records:
+            return 0
+        with self._write_lock:
+            try:
+                self._insert(records)
+                written, failed = len(records), 0
+            except Exception as e:
+                app.logger.error(f"Error saving {len(records)} routes, retrying one by one: {str(e)}")
+                written = failed = 0
+                # One bad row should not lose the rest of the batch
+                for record in records:
+                    try:
+                        self._insert([record])
+                        written += 1
+                    except Exception as e:
+                        failed += 1
+                        self.last_error = str(e)
+                        app.logger.error(f"Error saving route {record['route_id']}: {str(e)}")
+        with self._stats_lock:
+            self.written += written
+            self.failed += failed
+        return written
+
+    def _insert(self, records):
+        rows = [dict(record,
+                     start_loc=psycopg2.Binary(ewkb_point(record['start_loc'])),
+                     end_loc=psycopg2.Binary(ewkb_point(record['end_loc'])),
+                     user_start_loc=psycopg2.Binary(ewkb_point(record['user_start_loc'])),
+                     user_end_loc=psycopg2.Binary(ewkb_point(record['user_end_loc'])),
+                     geom=psycopg2.Binary(ewkb_linestring(record['path_coords'])),
+                     road_segments=psycopg2.extras.Json(record['road_segments']))
+                for record in records]
+        # Repeats of one route within a batch need a single row
+        routes = list({row['route_id']: row for row in rows}.values())
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            inserted = psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO routes (id, start_loc, end_loc, "
+                "total_distance_m, estimated_time_s, geom, road_segments) VALUES %s "
+                "ON CONFLICT (id) DO NOTHING RETURNING id;",
+                routes, template=self.ROUTE_TEMPLATE, page_size=self.batch_size, fetch=True
+            )
+            psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO user_route_history (history_id, user_id, route_id, "
+                "start_name, end_name, total_distance_m, duration_min, start_loc, end_loc) VALUES %s;",
+                rows, template=self.HISTORY_TEMPLATE, page_size=self.batch_size
+            )
+            conn.commit()
+            with self._stats_lock:
+                self.routes_reused += len(rows) - len(inserted)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max_queued": self._queue.maxsize,
+                "written": self.written,
+                "failed": self.failed,
+                "routes_reused": self.routes_reused,
+                "inline_writes": self.inline_writes,
+                "last_error": self.last_error
+            }
+
+def route_options(data):
+    """(profile, algorithm) named by the optimization and algorithm fields of a route request.
+
+    Raises ValueError with a message for the client on unknown values.
+    """
+    optimization = data.get('optimization', 'shortest')
+    algorithm = data.get('algorithm')
+    # optimization used to name the search algorithm; those values still select it
+    if optimization in ROUTE_ALGORITHMS:
+        optimization, algorithm = 'shortest', algorithm or optimization
+    if optimization not in ROUTE_PROFILES:
+        raise ValueError(f"Invalid optimization, expected one of: {', '.join(ROUTE_PROFILES)}")
+    if algorithm is None:
+        # The contraction hierarchy only holds plain lengths
+        algorithm = 'ch' if GRAPH_CH_ENABLED and optimization == 'shortest' else 'dijkstra'
+    if algorithm not in ROUTE_ALGORITHMS:
+        raise ValueError(f"Invalid algorithm, expected one of: {', '.join(ROUTE_ALGORITHMS)}")
+    return optimization, algorithm
+
+def route_duration(road_segments):
+    """Estimated seconds for a route: the travel times of its segments"""
+    return sum(segment['duration'] for segment in road_segments)
+
+def save_route(user_id, start_point, end_point, path_coords, total_distance, estimated_time, road_segments,
+               start_name, end_name, profile, cost_key):
+    """Queue a planned route and its history row for saving; returns (route_id, history_id,
+    save_status) with the status from RouteWriter.submit, and no ids when saving failed.
+
+    cost_key is the one find_route reported for the search.
+    """
+    road_start, road_end, coords, segments = road_route(path_coords, road_segments)
+    route_id = shared_route_id(road_start, road_end, profile, cost_key, coords, segments)
+    history_id = str(uuid.uuid4())
+    road_distance = sum(segment['length'] for segment in segments)
+    road_time = route_duration(segments)
+
+    # Saved in the background; path_coords are (lon, lat) like every point in the record
+    save_status = route_writer.submit({
+        "route_id": route_id,
+        "history_id": history_id,
+        "user_id": user_id,
+        "start_loc": road_start,
+        "end_loc": road_end,
+        "path_coords": coords,
+        # Both points may snap to the same place; the routes table only takes positive totals
+        "total_distance_m": road_distance if road_distance > 0 else None,
+        "estimated_time_s": road_time if road_time > 0 else None,
+        "road_segments": segments,
+        "user_start_loc": start_point,
+        "user_end_loc": end_point,
+        "history_distance_m": total_distance,
+        "start_name": start_name,
+        "end_name": end_name,
+        "duration_min": estimated_time / 60
+    })
+    if save_status == 'failed':
+        return None, None, save_status
+    return route_id, history_id, save_status
+
+class BatchRouter:
+    """Process pool for POST /routes/batch.
+
+    Route searches are pure Python and hold the GIL, so batches are spread over forked processes
+    that inherit the road graph copy-on-write. A pool serves one graph and road overlay version;
+    the first batch after a road edit or overlay change replaces it. Without fork, or with one process, batches run in the request.
+    A pool that breaks, say because a process was killed, is dropped; the batch finishes in the
+    request and the next one starts a new pool.
+    """
+    def __init__(self, processes=BATCH_PROCESSES, chunk_size=BATCH_CHUNK_SIZE):
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self.processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return None
+        key = (os.getpid(), road_graph.version, road_graph.overlay_version)
+        with self._lock:
+            if self._key != key:
+                if self._executor is not None and self._key[0] == os.getpid():
+                    # Batches still running on the old graph finish before its processes exit
+                    self._executor.shutdown(wait=False)
+                self._executor = ProcessPoolExecutor(
+                    self.processes, mp_context=multiprocessing.get_context('fork'),
+                    initializer=_batch_process_init
+                )
+                self._key = key
+            return self._executor
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = self._key = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, chunks, algorithm, profile):
+        """(executor, {future: chunk}), or (None, None) to run in the request"""
+        for _ in range(2):
+            executor = self._pool()
+            if executor is None:
                 break
-                
-            for neighbor in self.nodes[current]:
-                if neighbor not in unvisited:
-                    continue
-                    
-                edge_key = (current, neighbor)
-                if edge_key in self.edges:
-                    edge_length = self.edges[edge_key]['length']
-                    new_distance = distances[current] + edge_length
-                    
-                    if new_distance < distances[neighbor]:
-                        distances[neighbor] = new_distance
-                        previous_nodes[neighbor] = current
-        
-        if previous_nodes.get(end_node) is None:
-            app.logger.warning(f"No path found: start={start} end={end}")
-            return None, 0, []
-        
-        # Reconstruct path
-        path = []
-        current = end_node
-        while current:
-            path.insert(0, current)
-            current = previous_nodes.get(current)
-        
-        # Build coordinates and segments
-        line_coords = []
-        road_segments = []
-        
-        line_coords.append(start)
-        
-        start_to_first_node_distance = calculate_distance(start, start_node)
-        
-        if start != start_node and start_to_first_node_distance > 0:
-            road_segments.append({
-                'road_id': 'user_to_road',
-                'length': start_to_first_node_distance,
-                'type': 'user_segment',
-                'from': start,
-                'to': start_node
-            })
-        
-        if start != start_node:
-            line_coords.append(start_node)
-        
-        for i in range(len(path) - 1):
-            edge_key = (path[i], path[i+1])
-            if edge_key in self.edges:
-                edge = self.edges[edge_key]
-                line_coords.append(edge['geometry'][1])
-                
-                road_segments.append({
-                    'road_id': edge['id'],
-                    'length': edge['length']
-                })
+            try:
+                return executor, {executor.submit(_batch_route_chunk, chunk, algorithm, profile): chunk
+                                  for chunk in chunks}
+            except BrokenProcessPool:
+                # Broke after an earlier batch; start a new one
+                app.logger.warning("Batch process pool broke, starting a new one")
+                self._discard(executor)
+        return None, None
+
+    def routes(self, pairs, algorithm, profile='shortest'):
+        """Yield (index, (line_coords, total_distance, road_segments), cost_key, error) as searches
+        complete; a pair whose search failed has no route and the error message"""
+        indexed = list(enumerate(pairs))
+        chunks = [indexed[i:i + self.chunk_size] for i in range(0, len(indexed), self.chunk_size)]
+        executor, futures = self._submit(chunks, algorithm, profile)
+        if executor is None:
+            for chunk in chunks:
+                yield from _batch_route_chunk(chunk, algorithm, profile)
+            return
+
+        remaining = dict(futures)
+        try:
+            for future in as_completed(futures):
+                try:
+                    results = future.result()
+                except BrokenProcessPool:
+                    app.logger.warning("Batch process pool broke, finishing the batch in the request")
+                    self._discard(executor)
+                    break
+                except Exception as e:
+                    results = [(index, None, None, str(e)) for index, _ in futures[future]]
+                del remaining[future]
+                yield from results
             else:
-                segment_distance = calculate_distance(path[i], path[i+1])
-                line_coords.append(path[i+1])
-                
-                road_segments.append({
-                    'road_id': 'unknown_road',
-                    'length': segment_distance,
-                    'type': 'unknown_segment',
-                    'from': path[i],
-                    'to': path[i+1]
-                })
-        
-        end_node_to_end_distance = calculate_distance(end_node, end)
-        
-        if end != end_node and end_node_to_end_distance > 0:
-            road_segments.append({
-                'road_id': 'road_to_user',
-                'length': end_node_to_end_distance,
-                'type': 'user_segment',
-                'from': end_node,
-                'to': end
-            })
-        
-        if not line_coords or line_coords[-1] != end:
-            line_coords.append(end)
-        
-        total_distance = start_to_first_node_distance + distances[end_node] + end_node_to_end_distance
-        
-        return line_coords, total_distance, road_segments
+                return
+            for chunk in remaining.values():
+                yield from _batch_route_chunk(chunk, algorithm, profile)
+        finally:
+            # The client went away; drop searches nobody will read
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._key[0] == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._key = None
+
+def _batch_process_init():
+    road_graph.after_fork()
+
+def _batch_route_chunk(chunk, algorithm, profile):
+    results = []
+    for index, (start, end) in chunk:
+        stats = {}
+        try:
+            route = road_graph.find_route(start, end, algorithm, stats, profile=profile)
+        except Exception as e:
+            results.append((index, None, None, str(e)))
+            continue
+        results.append((index, route, stats.get('cost_key'), None))
+    return results
 
 # Initialize road graph
 road_graph = RoadGraph()
+location_index = LocationIndex()
+route_writer = RouteWriter()
+batch_router = BatchRouter()
+atexit.register(batch_router.shutdown)
+# Save whatever is still queued when the worker shuts down cleanly
+atexit.register(route_writer.flush)
+
+@app.before_request
+def sync_road_graph():
+    # Pick up a graph another worker rebuilt; a single counter read when nothing changed
+    road_graph.sync_shared()
+    # Overlays are read from the database at most every ROAD_OVERLAY_POLL_S
+    road_graph.sync_overlays()
 
 # Route handlers
 # @app.after_request
@@ -358,7 +3165,11 @@ def login():
         app.logger.warning(f"Login failed for user: {email}")
 
     if user:
-        access_token = create_access_token(identity=str(user['id']))
+        access_token = create_access_token(
+            identity=str(user['id']),
+            additional_claims={"is_admin": bool(user['is_admin'])}
+        )
+        admin_cache.set(str(user['id']), user['is_admin'])
         
         cur.close()
         conn.close()
@@ -438,18 +3249,25 @@ def plan_route():
     start_lat = data.get('start_lat')
     end_lon = data.get('end_lon')
     end_lat = data.get('end_lat')
-    optimization = data.get('optimization', 'shortest')
     
     if None in (start_lon, start_lat, end_lon, end_lat):
         return jsonify({"is_success": False, "msg": "Missing coordinates"}), 400
 
+    try:
+        optimization, algorithm = route_options(data)
+    except ValueError as e:
+        return jsonify({"is_success": False, "msg": str(e)}), 400
+
     try:
         start_point = (float(start_lon), float(start_lat))
         end_point = (float(end_lon), float(end_lat))
     except ValueError:
         return jsonify({"is_success": False, "msg": "Invalid coordinates"}), 400
     
-    path_coords, total_distance, road_segments = road_graph.dijkstra(start_point, end_point)
+    search_stats = {}
+    path_coords, total_distance, road_segments = road_graph.find_route(
+        start_point, end_point, algorithm=algorithm, stats=search_stats, profile=optimization
+    )
 
     if not path_coords or len(path_coords) < 2:
         return jsonify({
@@ -459,196 +3277,49 @@ def plan_route():
         }), 404
 
     # Process road names and locations
-    road_names = []
+    road_names = build_road_names(road_segments)
     start_location = None
     end_location = None
     step_locations = []
     
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    try:
-        # Process road segments
-        for segment in road_segments:
-            road_id = str(segment['road_id'])
-            
-            if segment['road_id'] in ['user_to_road', 'road_to_user']:
-                name_data = {
-                    'user_to_road': {
-                        'burmese': 'စတင်သည့်နေရာမှအနီးဆုံးသတ်မှတ်နေရာသို့',
-                        'english': 'From Start Location to Nearest Defined Location'
-                    },
-                    'road_to_user': {
-                        'burmese': 'အနီးဆုံးသတ်မှတ်နေရာမှပြီးဆုံးနေရာသို့',
-                        'english': 'From Nearest Defined Location to End Location'
-                    }
-                }
-                road_names.append({
-                    'road_id': road_id,
-                    'burmese_name': name_data[segment['road_id']]['burmese'],
-                    'english_name': name_data[segment['road_id']]['english'],
-                    'length': f"{segment['length']} meters",
-                    'type': 'user_segment'
-                })
-            elif segment['road_id'] == 'unknown_road':
-                road_names.append({
-                    'road_id': road_id,
-                    'burmese_name': 'အမည်မသိလမ်း',
-                    'english_name': 'Unknown Road Segment',
-                    'length': f"{segment['length']} meters",
-                    'type': 'unknown_segment'
-                })
-            else:
-                cur.execute(
-                    "SELECT id, burmese_name, english_name FROM roads WHERE id::text = %s;",
-                    (road_id,)
-                )
-                road_data = cur.fetchone()
-                if road_data:
-                    road_names.append({
-                        'road_id': road_id,
-                        'burmese_name': road_data['burmese_name'],
-                        'english_name': road_data['english_name'],
-                        'length': f"{segment['length']} meters"
-                    })
-                else:
-                    road_names.append({
-                        'road_id': road_id,
-                        'burmese_name': 'အမည်မသိလမ်း',
-                        'english_name': 'Unknown Road',
-                        'length': f"{segment['length']} meters"
-                    })
-
-        # Get all locations for proximity checks
-        cur.execute(
-            "SELECT burmese_name, english_name, address, ST_X(geom::geometry) AS lon, ST_Y(geom::geometry) AS lat "
-            "FROM locations;"
-        )
-        locations = cur.fetchall()
-
-        def find_nearest_location(point, locations, max_dist=500):
-            min_dist = float('inf')
-            nearest = None
-            for loc in locations:
-                dist = calculate_distance(point, (loc['lon'], loc['lat']))
-                if dist < min_dist and dist <= max_dist:
-                    min_dist = dist
-                    nearest = loc
-            return nearest
-            
-        # Find nearest locations
-        nearest_start_location = find_nearest_location(start_point, locations)
-        nearest_end_location = find_nearest_location(end_point, locations)
-        
-        close_start_location = find_nearest_location(start_point, locations, max_dist=50)
-        close_end_location = find_nearest_location(end_point, locations, max_dist=50)
-        
-        # Set start and end locations
-        start_location = {
-            "burmese_name": close_start_location["burmese_name"],
-            "english_name": close_start_location["english_name"],
-            "address": close_start_location["address"],
-            "longitude": close_start_location["lon"],
-            "latitude": close_start_location["lat"],
-            "type": "defined_location"
-        } if close_start_location else {
-            "longitude": start_point[0],
-            "latitude": start_point[1],
-            "coordinates": f"{start_point[0]}, {start_point[1]}",
-            "type": "user_input"
-        }
-        
-        end_location = {
-            "burmese_name": close_end_location["burmese_name"],
-            "english_name": close_end_location["english_name"],
-            "address": close_end_location["address"],
-            "longitude": close_end_location["lon"],
-            "latitude": close_end_location["lat"],
-            "type": "defined_location"
-        } if close_end_location else {
-            "longitude": end_point[0],
-            "latitude": end_point[1],
-            "coordinates": f"{end_point[0]}, {end_point[1]}",
-            "type": "user_input"
-        }
-        
-        # Process step locations
-        added_locations = set()
-        
-        for i, coord in enumerate(path_coords):
-            if i > 0 and coord == path_coords[i-1]:
-                continue
-            
-            coord_key = f"{coord[0]:.7f},{coord[1]:.7f}"
-            if coord_key in added_locations:
-                continue
-                
-            if i == 0:
-                if close_start_location:
-                    step_locations.append({
-                        "burmese_name": close_start_location["burmese_name"],
-                        "english_name": close_start_location["english_name"],
-                        "address": close_start_location["address"],
-                        "longitude": close_start_location["lon"],
-                        "latitude": close_start_location["lat"],
-                        "type": "defined_location"
-                    })
-                    added_locations.add(f"{close_start_location['lon']:.7f},{close_start_location['lat']:.7f}")
-                else:
-                    step_locations.append({
-                        "longitude": coord[0],
-                        "latitude": coord[1],
-                        "coordinates": f"{coord[0]}, {coord[1]}",
-                        "type": "user_input_start"
-                    })
-                    added_locations.add(coord_key)
-            elif i == len(path_coords) - 1:
-                if close_end_location:
-                    close_coord_key = f"{close_end_location['lon']:.7f},{close_end_location['lat']:.7f}"
-                    if close_coord_key not in added_locations:
-                        step_locations.append({
-                            "burmese_name": close_end_location["burmese_name"],
-                            "english_name": close_end_location["english_name"],
-                            "address": close_end_location["address"],
-                            "longitude": close_end_location["lon"],
-                            "latitude": close_end_location["lat"],
-                            "type": "defined_location"
-                        })
-                        added_locations.add(close_coord_key)
-                else:
-                    if coord_key not in added_locations:
-                        step_locations.append({
-                            "longitude": coord[0],
-                            "latitude": coord[1], 
-                            "coordinates": f"{coord[0]}, {coord[1]}",
-                            "type": "user_input_end"
-                        })
-                        added_locations.add(coord_key)
-            else:
-                loc = find_nearest_location(coord, locations)
-                if loc:
-                    loc_coord_key = f"{loc['lon']:.7f},{loc['lat']:.7f}"
-                    if loc_coord_key not in added_locations:
-                        step_locations.append({
-                            "burmese_name": loc["burmese_name"],
-                            "english_name": loc["english_name"],
-                            "address": loc["address"],
-                            "longitude": loc["lon"],
-                            "latitude": loc["lat"],
-                            "type": "defined_location"
-                        })
-                        added_locations.add(loc_coord_key)
-                else:
-                    if coord_key not in added_locations:
-                        step_locations.append({
-                            "longitude": coord[0],
-                            "latitude": coord[1],
-                            "coordinates": f"{coord[0]}, {coord[1]}",
-                            "type": "road_point"
-                        })
-                        added_locations.add(coord_key)
-    finally:
-        cur.close()
-        conn.close()
+    # Find nearest locations
+    nearest_start_location = find_nearest_location(start_point)
+    nearest_end_location = find_nearest_location(end_point)
+    
+    close_start_location = find_nearest_location(start_point, max_dist=50)
+    close_end_location = find_nearest_location(end_point, max_dist=50)
+    
+    # Set start and end locations
+    start_location = {
+        "burmese_name": close_start_location["burmese_name"],
+        "english_name": close_start_location["english_name"],
+        "address": close_start_location["address"],
+        "longitude": close_start_location["lon"],
+        "latitude": close_start_location["lat"],
+        "type": "defined_location"
+    } if close_start_location else {
+        "longitude": start_point[0],
+        "latitude": start_point[1],
+        "coordinates": f"{start_point[0]}, {start_point[1]}",
+        "type": "user_input"
+    }
+    
+    end_location = {
+        "burmese_name": close_end_location["burmese_name"],
+        "english_name": close_end_location["english_name"],
+        "address": close_end_location["address"],
+        "longitude": close_end_location["lon"],
+        "latitude": close_end_location["lat"],
+        "type": "defined_location"
+    } if close_end_location else {
+        "longitude": end_point[0],
+        "latitude": end_point[1],
+        "coordinates": f"{end_point[0]}, {end_point[1]}",
+        "type": "user_input"
+    }
+    
+    # Process step locations
+    step_locations = build_step_locations(path_coords, close_start_location, close_end_location)
 
     # Create GeoJSON route
     geojson_route = {
@@ -660,69 +3331,222 @@ def plan_route():
         }
     }
 
-    # Save route to database
-    conn = get_db_connection()
-    cur = conn.cursor()
+    estimated_time = route_duration(road_segments)
+    route_id, history_id, save_status = save_route(
+        user_id, start_point, end_point, path_coords, total_distance, estimated_time, road_segments,
+        (nearest_start_location['burmese_name'] if nearest_start_location else data.get('start_name', 'Start')),
+        (nearest_end_location['burmese_name'] if nearest_end_location else data.get('end_name', 'End')),
+        optimization, search_stats.get('cost_key')
+    )
+
+    response = {
+        "is_success": True,
+        "route_id": route_id,
+        "history_id": history_id,
+        "save_status": save_status,
+        "distance": total_distance,
+        "estimated_time": estimated_time,
+        "route": geojson_route,
+        "road_names": road_names,
+        "step_locations": step_locations,
+        "start_location": start_location,
+        "end_location": end_location,
+        "optimization": optimization,
+        "algorithm": algorithm,
+        "nodes_expanded": search_stats.get('nodes_expanded', 0),
+        "cache_hit": search_stats.get('cache_hit', False)
+    }
+    return jsonify({"is_success": True, "data": response}), 200
+
+@app.route('/routes/batch', methods=['POST'])
+@jwt_required()
+def plan_route_batch():
+    """Plan many routes at once, streamed back as one JSON object per line in completion order"""
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+    pairs = data.get('pairs')
+    save = bool(data.get('save', False))
+
+    if not pairs:
+        return jsonify({"is_success": False, "msg": "Missing pairs"}), 400
+
+    if not isinstance(pairs, list):
+        return jsonify({"is_success": False, "msg": "pairs must be a list"}), 400
+
+    if len(pairs) > BATCH_MAX_PAIRS:
+        return jsonify({"is_success": False, "msg": f"At most {BATCH_MAX_PAIRS} pairs per batch"}), 400
 
     try:
-        # IMPORTANT: path_coords stores (lon, lat). Do not swap when writing WKT.
-        wkt_coords = ", ".join([f"{lon} {lat}" for lon, lat in path_coords])
-        wkt_linestring = f"LINESTRING({wkt_coords})"
+        optimization, algorithm = route_options(data)
+    except ValueError as e:
+        return jsonify({"is_success": False, "msg": str(e)}), 400
 
-        estimated_time = total_distance / 5.0  # Assuming 5 m/s average speed
+    try:
+        points = [((float(pair['start_lon']), float(pair['start_lat'])),
+                   (float(pair['end_lon']), float(pair['end_lat']))) for pair in pairs]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"is_success": False, "msg": "Invalid coordinates"}), 400
 
-        cur.execute(
-            "INSERT INTO routes (user_id, start_loc, end_loc, "
-            "total_distance_m, estimated_time_s, geom) "
-            "VALUES (%s, ST_GeogFromText(%s), ST_GeogFromText(%s), "
-            "%s, %s, ST_GeogFromText(%s)) "
-            "RETURNING id;",
-            (
-                user_id,
-                f"SRID=4326;POINT({start_lon} {start_lat})",
-                f"SRID=4326;POINT({end_lon} {end_lat})",
-                total_distance,
-                estimated_time,
-                f"SRID=4326;{wkt_linestring}"
+    def batch_line(index, route, cost_key):
+        path_coords, total_distance, road_segments = route
+        if not path_coords or len(path_coords) < 2:
+            return {"index": index, "is_success": False, "msg": "No valid route found between the points"}
+        start_point, end_point = points[index]
+        close_start_location = find_nearest_location(start_point, max_dist=50)
+        close_end_location = find_nearest_location(end_point, max_dist=50)
+        line = {
+            "index": index,
+            "is_success": True,
+            "distance": total_distance,
+            "estimated_time": route_duration(road_segments),
+            "route": {"type": "LineString", "coordinates": [[lon, lat] for lon, lat in path_coords]},
+            "road_names": build_road_names(road_segments),
+            "step_locations": build_step_locations(path_coords, close_start_location, close_end_location)
+        }
+        if save:
+            nearest_start_location = find_nearest_location(start_point)
+            nearest_end_location = find_nearest_location(end_point)
+            line["route_id"], line["history_id"], line["save_status"] = save_route(
+                user_id, start_point, end_point, path_coords, total_distance, line["estimated_time"], road_segments,
+                nearest_start_location['burmese_name'] if nearest_start_location else 'Start',
+                nearest_end_location['burmese_name'] if nearest_end_location else 'End',
+                optimization, cost_key
             )
-        )
-        route_id = cur.fetchone()[0]
+        return line
 
-        cur.execute(
-            "INSERT INTO user_route_history (user_id, route_id, "
-            "start_name, end_name, total_distance_m, duration_min) "
-            "VALUES (%s, %s, %s, %s, %s, %s) RETURNING history_id;",
-            (
-                user_id,
-                route_id,
-                (nearest_start_location['burmese_name'] if nearest_start_location else data.get('start_name', 'Start')),
-                (nearest_end_location['burmese_name'] if nearest_end_location else data.get('end_name', 'End')),
-                total_distance,
-                estimated_time / 60
-            )
-        )
-        history_id = cur.fetchone()[0]
+    def generate():
+        # Headers are sent with the first line, so failures are reported per pair from here on
+        for index, route, cost_key, error in batch_router.routes(points, algorithm, optimization):
+            if error is None:
+                try:
+                    line = batch_line(index, route, cost_key)
+                except Exception as e:
+                    error = str(e)
+            if error is not None:
+                app.logger.error(f"Batch route error: {error}")
+                line = {"index": index, "is_success": False, "msg": "Error planning route", "error": error}
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/routes/matrix', methods=['POST'])
+@jwt_required()
+def route_matrix():
+    """Distances and times between [lon, lat] points; nothing is saved"""
+    data = request.get_json() or {}
+    sources = data.get('sources', data.get('points'))
+    destinations = data.get('destinations', sources)
+
+    if not sources or not destinations:
+        return jsonify({"is_success": False, "msg": "Missing points"}), 400
+
+    if not isinstance(sources, list) or not isinstance(destinations, list):
+        return jsonify({"is_success": False, "msg": "Points must be lists of [lon, lat]"}), 400
+
+    if len(sources) > MATRIX_MAX_POINTS or len(destinations) > MATRIX_MAX_POINTS:
+        return jsonify({"is_success": False, "msg": f"At most {MATRIX_MAX_POINTS} points per side"}), 400
+
+    optimization = data.get('optimization', 'shortest')
+    if optimization not in ROUTE_PROFILES:
+        return jsonify({
+            "is_success": False,
+            "msg": f"Invalid optimization, expected one of: {', '.join(ROUTE_PROFILES)}"
+        }), 400
+
+    try:
+        sources = [(float(lon), float(lat)) for lon, lat in sources]
+        destinations = [(float(lon), float(lat)) for lon, lat in destinations]
+        max_distance = float(data.get('max_distance') or 'inf')
+    except (TypeError, ValueError):
+        return jsonify({"is_success": False, "msg": "Invalid coordinates"}), 400
+
+    rows, snapped = road_graph.distance_matrix(sources, destinations, max_distance, optimization)
+
+    response = {
+        "distances": [[round(pair[0], 1) if pair is not None else None for pair in row] for row in rows],
+        "durations": [[round(pair[1], 1) if pair is not None else None for pair in row] for row in rows],
+        "optimization": optimization,
+        "sources_snapped": snapped[:len(sources)],
+        "destinations_snapped": snapped[len(sources):]
+    }
+    return jsonify({"is_success": True, "data": response}), 200
+
+@app.route('/isochrone', methods=['GET'])
+@jwt_required()
+def isochrone():
+    """Area reachable from lon/lat within each of `distances` (meters) or `minutes`, comma separated;
+    minutes are timed with the same per-road-type travel times as /routes"""
+    lon = request.args.get('lon')
+    lat = request.args.get('lat')
+    distances = request.args.get('distances')
+    minutes = request.args.get('minutes')
+
+    if lon is None or lat is None or not (distances or minutes):
+        return jsonify({"is_success": False, "msg": "Missing lon, lat or distances/minutes"}), 400
+
+    try:
+        point = (float(lon), float(lat))
+        if minutes:
+            budgets = [float(value) for value in minutes.split(',')]
+            limits = [value * 60 for value in budgets]
+            # No road is fast enough to carry a time budget past the distance limit
+            max_limit = ISOCHRONE_MAX_DISTANCE_M / ROUTE_PROFILES['shortest'].top_speed()
+            unit = "duration"
+        else:
+            budgets = [float(value) for value in distances.split(',')]
+            limits = budgets
+            max_limit = ISOCHRONE_MAX_DISTANCE_M
+            unit = "distance"
+        concavity = float(request.args.get('concavity', ISOCHRONE_CONCAVITY))
+    except ValueError:
+        return jsonify({"is_success": False, "msg": "Invalid coordinates or budgets"}), 400
+
+    if min(limits) <= 0 or max(limits) > max_limit:
+        reach = f"{max_limit / 60:.1f} minutes" if minutes else f"{max_limit:.0f} meters"
+        return jsonify({
+            "is_success": False,
+            "msg": f"Budgets must be positive and reach at most {reach}"
+        }), 400
+
+    bands = sorted(zip(limits, budgets))
+    reachable = road_graph.isochrone(point, [limit for limit, _ in bands], by_time=bool(minutes))
+    if reachable is None:
+        return jsonify({"is_success": False, "msg": "No road near the point"}), 404
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        response_bands = []
+        for (limit, budget), points in zip(bands, reachable['band_points']):
+            polygon = None
+            if points:
+                lons, lats = zip(*points)
+                cur.execute(
+                    "SELECT ST_AsGeoJSON(ST_ConcaveHull(ST_Collect(ST_MakePoint(p.lon, p.lat)), %s)) "
+                    "FROM unnest(%s::float8[], %s::float8[]) AS p(lon, lat);",
+                    (concavity, list(lons), list(lats))
+                )
+                polygon = json.loads(cur.fetchone()[0])
+            response_bands.append({
+                "minutes" if minutes else "distance": budget,
+                "seconds" if minutes else "distance_m": limit,
+                "polygon": polygon,
+                "node_count": sum(1 for node in reachable['nodes'] if node[2] <= limit)
+            })
 
-        conn.commit()
-        
         response = {
-            "is_success": True,
-            "route_id": route_id,
-            "history_id": history_id,
-            "distance": total_distance,
-            "estimated_time": estimated_time,
-            "route": geojson_route,
-            "road_names": road_names,
-            "step_locations": step_locations,
-            "start_location": start_location,
-            "end_location": end_location
+            "origin": {"longitude": point[0], "latitude": point[1]},
+            "bands": response_bands,
+            "nodes": [{"coordinates": [lon, lat], unit: value} for lon, lat, value in reachable['nodes']],
+            "edges": [
+                {"coordinates": [list(start), list(end)], unit: [start_value, end_value]}
+                for start, end, start_value, end_value in reachable['edges']
+            ]
         }
         return jsonify({"is_success": True, "data": response}), 200
-
     except Exception as e:
-        conn.rollback()
-        app.logger.error(f"Database error: {str(e)}")
-        return jsonify({"is_success": False, "msg": "Error saving route", "error": str(e)}), 500
+        app.logger.error(f"Isochrone error: {str(e)}")
+        return jsonify({"is_success": False, "msg": "Error building isochrone", "error": str(e)}), 500
     finally:
         cur.close()
         conn.close()
@@ -739,9 +3563,14 @@ def get_history():
         cur.execute(
             "SELECT "
             "h.history_id, h.route_id, h.accessed_at, h.start_name, h.end_name, "
-            "h.total_distance_m, h.duration_min, ST_AsGeoJSON(r.geom::geometry) AS geojson, "
-            "ST_X(r.start_loc::geometry) as start_lon, ST_Y(r.start_loc::geometry) as start_lat, "
-            "ST_X(r.end_loc::geometry) as end_lon, ST_Y(r.end_loc::geometry) as end_lat "
+            "h.total_distance_m, h.duration_min, ST_AsGeoJSON(" + HISTORY_GEOMETRY + ") AS geojson, "
+            "ST_X(COALESCE(h.start_loc, r.start_loc)::geometry) as start_lon, "
+            "ST_Y(COALESCE(h.start_loc, r.start_loc)::geometry) as start_lat, "
+            "ST_X(COALESCE(h.end_loc, r.end_loc)::geometry) as end_lon, "
+            "ST_Y(COALESCE(h.end_loc, r.end_loc)::geometry) as end_lat, "
+            "ST_X(r.start_loc::geometry) as road_start_lon, ST_Y(r.start_loc::geometry) as road_start_lat, "
+            "ST_X(r.end_loc::geometry) as road_end_lon, ST_Y(r.end_loc::geometry) as road_end_lat, "
+            "h.start_loc IS NOT NULL AS shared_route, r.road_segments "
             "FROM user_route_history h "
             "JOIN routes r ON h.route_id = r.id "
             "WHERE h.user_id = %s "
@@ -757,64 +3586,10 @@ def get_history():
             end_coords = safe_extract_coordinates(item, 'end')
             
             road_names = []
-            if start_coords and end_coords and item['geojson']:
-                try:
-                    geojson_data = json.loads(item['geojson'])
-                    if geojson_data and 'coordinates' in geojson_data:
-                        path_coords = [(coord[0], coord[1]) for coord in geojson_data['coordinates']]
-                        _, _, road_segments = road_graph.dijkstra(start_coords, end_coords)
-                        
-                        for segment in road_segments:
-                            road_id = str(segment['road_id'])
-                            
-                            if segment['road_id'] in ['user_to_road', 'road_to_user']:
-                                name_data = {
-                                    'user_to_road': {
-                                        'burmese': 'စတင်သည့်နေရာမှအနီးဆုံးသတ်မှတ်နေရာသို့',
-                                        'english': 'From Start Location to Nearest Defined Location'
-                                    },
-                                    'road_to_user': {
-                                        'burmese': 'အနီးဆုံးသတ်မှတ်နေရာမှပြီးဆုံးနေရာသို့',
-                                        'english': 'From Nearest Defined Location to End Location'
-                                    }
-                                }
-                                road_names.append({
-                                    'road_id': road_id,
-                                    'burmese_name': name_data[segment['road_id']]['burmese'],
-                                    'english_name': name_data[segment['road_id']]['english'],
-                                    'length': f"{segment['length']} meters",
-                                    'type': 'user_segment'
-                                })
-                            elif segment['road_id'] == 'unknown_road':
-                                road_names.append({
-                                    'road_id': road_id,
-                                    'burmese_name': 'အမည်မသိလမ်း',
-                                    'english_name': 'Unknown Road Segment',
-                                    'length': f"{segment['length']} meters",
-                                    'type': 'unknown_segment'
-                                })
-                            else:
-                                cur.execute(
-                                    "SELECT id, burmese_name, english_name FROM roads WHERE id::text = %s;",
-                                    (road_id,)
-                                )
-                                road_data = cur.fetchone()
-                                if road_data:
-                                    road_names.append({
-                                        'road_id': road_id,
-                                        'burmese_name': road_data['burmese_name'],
-                                        'english_name': road_data['english_name'],
-                                        'length': f"{segment['length']} meters"
-                                    })
-                                else:
-                                    road_names.append({
-                                        'road_id': road_id,
-                                        'burmese_name': 'အမည်မသိလမ်း',
-                                        'english_name': 'Unknown Road',
-                                        'length': f"{segment['length']} meters"
-                                    })
-                except Exception as e:
-                    app.logger.error(f"Error processing road segments: {str(e)}")
+            try:
+                road_names = build_road_names(stored_road_segments(cur, item, start_coords, end_coords))
+            except Exception as e:
+                app.logger.error(f"Error processing road segments: {str(e)}")
             
             history_list.append({
                 "id": item['history_id'],
@@ -852,9 +3627,14 @@ def get_history_by_id(history_id):
         cur.execute(
             "SELECT "
             "h.history_id, h.route_id, h.accessed_at, h.start_name, h.end_name, "
-            "h.total_distance_m, h.duration_min, ST_AsGeoJSON(r.geom::geometry) AS geojson, "
-            "ST_X(r.start_loc::geometry) as start_lon, ST_Y(r.start_loc::geometry) as start_lat, "
-            "ST_X(r.end_loc::geometry) as end_lon, ST_Y(r.end_loc::geometry) as end_lat "
+            "h.total_distance_m, h.duration_min, ST_AsGeoJSON(" + HISTORY_GEOMETRY + ") AS geojson, "
+            "ST_X(COALESCE(h.start_loc, r.start_loc)::geometry) as start_lon, "
+            "ST_Y(COALESCE(h.start_loc, r.start_loc)::geometry) as start_lat, "
+            "ST_X(COALESCE(h.end_loc, r.end_loc)::geometry) as end_lon, "
+            "ST_Y(COALESCE(h.end_loc, r.end_loc)::geometry) as end_lat, "
+            "ST_X(r.start_loc::geometry) as road_start_lon, ST_Y(r.start_loc::geometry) as road_start_lat, "
+            "ST_X(r.end_loc::geometry) as road_end_lon, ST_Y(r.end_loc::geometry) as road_end_lat, "
+            "h.start_loc IS NOT NULL AS shared_route, r.road_segments "
             "FROM user_route_history h "
             "JOIN routes r ON h.route_id = r.id "
             "WHERE h.history_id = %s;",
@@ -869,64 +3649,10 @@ def get_history_by_id(history_id):
         end_coords = safe_extract_coordinates(item, 'end')
         
         road_names = []
-        if start_coords and end_coords and item['geojson']:
-            try:
-                geojson_data = json.loads(item['geojson'])
-                if geojson_data and 'coordinates' in geojson_data:
-                    path_coords = [(coord[0], coord[1]) for coord in geojson_data['coordinates']]
-                    _, _, road_segments = road_graph.dijkstra(start_coords, end_coords)
-                    
-                    for segment in road_segments:
-                        road_id = str(segment['road_id'])
-                        
-                        if segment['road_id'] in ['user_to_road', 'road_to_user']:
-                            name_data = {
-                                'user_to_road': {
-                                    'burmese': 'စတင်သည့်နေရာမှအနီးဆုံးသတ်မှတ်နေရာသို့',
-                                    'english': 'From Start Location to Nearest Defined Location'
-                                },
-                                'road_to_user': {
-                                    'burmese': 'အနီးဆုံးသတ်မှတ်နေရာမှပြီးဆုံးနေရာသို့',
-                                    'english': 'From Nearest Defined Location to End Location'
-                                }
-                            }
-                            road_names.append({
-                                'road_id': road_id,
-                                'burmese_name': name_data[segment['road_id']]['burmese'],
-                                'english_name': name_data[segment['road_id']]['english'],
-                                'length': f"{segment['length']} meters",
-                                'type': 'user_segment'
-                            })
-                        elif segment['road_id'] == 'unknown_road':
-                            road_names.append({
-                                'road_id': road_id,
-                                'burmese_name': 'အမည်မသိလမ်း',
-                                'english_name': 'Unknown Road Segment',
-                                'length': f"{segment['length']} meters",
-                                'type': 'unknown_segment'
-                            })
-                        else:
-                            cur.execute(
-                                "SELECT id, burmese_name, english_name FROM roads WHERE id::text = %s;",
-                                (road_id,)
-                            )
-                            road_data = cur.fetchone()
-                            if road_data:
-                                road_names.append({
-                                    'road_id': road_id,
-                                    'burmese_name': road_data['burmese_name'],
-                                    'english_name': road_data['english_name'],
-                                    'length': f"{segment['length']} meters"
-                                })
-                            else:
-                                road_names.append({
-                                    'road_id': road_id,
-                                    'burmese_name': 'အမည်မသိလမ်း',
-                                    'english_name': 'Unknown Road',
-                                    'length': f"{segment['length']} meters"
-                                })
-            except Exception as e:
-                app.logger.error(f"Error processing road segments: {str(e)}")
+        try:
+            road_names = build_road_names(stored_road_segments(cur, item, start_coords, end_coords))
+        except Exception as e:
+            app.logger.error(f"Error processing road segments: {str(e)}")
         # Build locations and step locations similar to plan_route
         path_coords = []
         if item['geojson']:
@@ -953,24 +3679,7 @@ def get_history_by_id(history_id):
         end_location = None
         step_locations = []
 
-        # Fetch all locations for proximity checks
         try:
-            cur.execute(
-                "SELECT burmese_name, english_name, address, ST_X(geom::geometry) AS lon, ST_Y(geom::geometry) AS lat "
-                "FROM locations;"
-            )
-            locations = cur.fetchall()
-
-            def find_nearest_location(point, locations, max_dist=500):
-                min_dist = float('inf')
-                nearest = None
-                for loc in locations:
-                    dist = calculate_distance(point, (loc['lon'], loc['lat']))
-                    if dist < min_dist and dist <= max_dist:
-                        min_dist = dist
-                        nearest = loc
-                return nearest
-
             # Define points
             if start_coords and end_coords:
                 start_point = start_coords
@@ -980,11 +3689,11 @@ def get_history_by_id(history_id):
                 end_point = None
 
             # Find nearest locations
-            nearest_start_location = find_nearest_location(start_point, locations) if start_point else None
-            nearest_end_location = find_nearest_location(end_point, locations) if end_point else None
+            nearest_start_location = find_nearest_location(start_point) if start_point else None
+            nearest_end_location = find_nearest_location(end_point) if end_point else None
 
-            close_start_location = find_nearest_location(start_point, locations, max_dist=50) if start_point else None
-            close_end_location = find_nearest_location(end_point, locations, max_dist=50) if end_point else None
+            close_start_location = find_nearest_location(start_point, max_dist=50) if start_point else None
+            close_end_location = find_nearest_location(end_point, max_dist=50) if end_point else None
 
             # Set start and end locations
             if close_start_location:
@@ -1021,80 +3730,7 @@ def get_history_by_id(history_id):
                     "type": "user_input"
                 }
 
-            # Build step locations from path
-            added_locations = set()
-            for i, coord in enumerate(path_coords):
-                if i > 0 and coord == path_coords[i-1]:
-                    continue
-
-                coord_key = f"{coord[0]:.7f},{coord[1]:.7f}"
-                if coord_key in added_locations:
-                    continue
-
-                if i == 0:
-                    if close_start_location:
-                        step_locations.append({
-                            "burmese_name": close_start_location["burmese_name"],
-                            "english_name": close_start_location["english_name"],
-                            "address": close_start_location["address"],
-                            "longitude": close_start_location["lon"],
-                            "latitude": close_start_location["lat"],
-                            "type": "defined_location"
-                        })
-                        added_locations.add(f"{close_start_location['lon']:.7f},{close_start_location['lat']:.7f}")
-                    else:
-                        step_locations.append({
-                            "longitude": coord[0],
-                            "latitude": coord[1],
-                            "coordinates": f"{coord[0]}, {coord[1]}",
-                            "type": "user_input_start"
-                        })
-                        added_locations.add(coord_key)
-                elif i == len(path_coords) - 1:
-                    if close_end_location:
-                        close_coord_key = f"{close_end_location['lon']:.7f},{close_end_location['lat']:.7f}"
-                        if close_coord_key not in added_locations:
-                            step_locations.append({
-                                "burmese_name": close_end_location["burmese_name"],
-                                "english_name": close_end_location["english_name"],
-                                "address": close_end_location["address"],
-                                "longitude": close_end_location["lon"],
-                                "latitude": close_end_location["lat"],
-                                "type": "defined_location"
-                            })
-                            added_locations.add(close_coord_key)
-                    else:
-                        if coord_key not in added_locations:
-                            step_locations.append({
-                                "longitude": coord[0],
-                                "latitude": coord[1], 
-                                "coordinates": f"{coord[0]}, {coord[1]}",
-                                "type": "user_input_end"
-                            })
-                            added_locations.add(coord_key)
-                else:
-                    loc = find_nearest_location(coord, locations)
-                    if loc:
-                        loc_coord_key = f"{loc['lon']:.7f},{loc['lat']:.7f}"
-                        if loc_coord_key not in added_locations:
-                            step_locations.append({
-                                "burmese_name": loc["burmese_name"],
-                                "english_name": loc["english_name"],
-                                "address": loc["address"],
-                                "longitude": loc["lon"],
-                                "latitude": loc["lat"],
-                                "type": "defined_location"
-                            })
-                            added_locations.add(loc_coord_key)
-                    else:
-                        if coord_key not in added_locations:
-                            step_locations.append({
-                                "longitude": coord[0],
-                                "latitude": coord[1],
-                                "coordinates": f"{coord[0]}, {coord[1]}",
-                                "type": "road_point"
-                            })
-                            added_locations.add(coord_key)
+            step_locations = build_step_locations(path_coords, close_start_location, close_end_location)
         except Exception as e:
             app.logger.error(f"Error building locations for history {history_id}: {str(e)}")
 
@@ -1162,6 +3798,9 @@ def save_location():
         saved_id = cur.fetchone()[0]
         
         conn.commit()
+
+        location_index.refresh()
+
         return jsonify({"is_success": True, "id": saved_id}), 201
     except psycopg2.errors.UniqueViolation:
         return jsonify({"is_success": False, "msg": "Location already exists"}), 400
@@ -1256,6 +3895,8 @@ def create_location():
         if not location:
             return jsonify({"is_success": False, "msg": "Failed to create location, no data returned."}), 500
 
+        location_index.refresh()
+
         return jsonify({
             "is_success": True,
             "id": location['id'],
@@ -1358,6 +3999,9 @@ def update_location(location_id):
             return jsonify({"is_success": False,"msg": "Location not found"}), 404
             
         conn.commit()
+
+        location_index.refresh()
+
         return jsonify({"is_success": True, "msg": "Location updated"}), 200
     except Exception as e:
         conn.rollback()
@@ -1379,6 +4023,9 @@ def delete_location(location_id):
             return jsonify({"is_success": False, "msg": "Location not found"}), 404
 
         conn.commit()
+
+        location_index.refresh()
+
         return jsonify({"is_success": True, "msg": "Location deleted"}), 200
     except psycopg2.errors.ForeignKeyViolation:
         conn.rollback()
@@ -1437,7 +4084,7 @@ def create_road():
         road_id = cur.fetchone()[0]
         conn.commit()
 
-        road_graph.build_graph()
+        road_graph.refresh_road(road_id)
 
         return jsonify({
             "is_success": True,
@@ -1564,8 +4211,8 @@ def update_road(road_id):
 
         conn.commit()
         
-        if 'coordinates' in data:
-            road_graph.build_graph()
+        # Length and direction changes matter to routing as much as geometry does
+        road_graph.refresh_road(road_id)
             
         return jsonify({"is_success": True, "msg": "Road updated"}), 200
     except Exception as e:
@@ -1589,7 +4236,7 @@ def delete_road(road_id):
 
         conn.commit()
         
-        road_graph.build_graph()
+        road_graph.remove_road(road_id_str)
 
         return jsonify({"is_success": True,"msg": "Road deleted"}), 200
     except psycopg2.errors.ForeignKeyViolation:
@@ -1603,6 +4250,109 @@ def delete_road(road_id):
         cur.close()
         conn.close()
 
+@app.route('/admin/road-overlays', methods=['GET'])
+@admin_required
+def get_road_overlays():
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    try:
+        cur.execute(
+            "SELECT o.road_id, r.burmese_name, r.english_name, o.factor, o.closed, o.reason, "
+            "o.expires_at, o.created_by, o.updated_at "
+            "FROM road_overlays o JOIN roads r ON r.id = o.road_id "
+            "WHERE o.expires_at > NOW() ORDER BY o.expires_at;"
+        )
+        overlays = []
+        for row in cur.fetchall():
+            overlay = dict(row)
+            overlay['expires_at'] = overlay['expires_at'].isoformat()
+            overlay['updated_at'] = overlay['updated_at'].isoformat() if overlay['updated_at'] else None
+            overlays.append(overlay)
+
+        return jsonify({
+            "is_success": True,
+            "data": overlays,
+            "applied_version": road_graph.overlay_version
+        }), 200
+    finally:
+        cur.close()
+        conn.close()
+
+@app.route('/admin/roads/<uuid:road_id>/overlay', methods=['PUT'])
+@admin_required
+def set_road_overlay(road_id):
+    data = request.get_json() or {}
+    closed = data.get('closed', False)
+    factor = data.get('factor', 1)
+    expires_in_min = data.get('expires_in_min', 60)
+
+    if not isinstance(closed, bool):
+        return jsonify({"is_success": False, "msg": "closed must be true or false"}), 400
+    if isinstance(factor, bool) or not isinstance(factor, (int, float)) or not 1 <= factor < math.inf:
+        return jsonify({"is_success": False, "msg": "factor must be a number of at least 1"}), 400
+    if not closed and factor == 1:
+        return jsonify({"is_success": False, "msg": "Set a factor above 1 or closed: true"}), 400
+    if isinstance(expires_in_min, bool) or not isinstance(expires_in_min, (int, float)) or not 0 < expires_in_min < math.inf:
+        return jsonify({"is_success": False, "msg": "expires_in_min must be a positive number"}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    try:
+        cur.execute(
+            "INSERT INTO road_overlays (road_id, factor, closed, reason, expires_at, created_by, updated_at) "
+            "VALUES (%s, %s, %s, %s, NOW() + %s * INTERVAL '1 minute', %s, NOW()) "
+            "ON CONFLICT (road_id) DO UPDATE SET factor = EXCLUDED.factor, closed = EXCLUDED.closed, "
+            "reason = EXCLUDED.reason, expires_at = EXCLUDED.expires_at, "
+            "created_by = EXCLUDED.created_by, updated_at = NOW() "
+            "RETURNING expires_at;",
+            (str(road_id), factor, closed, data.get('reason'), expires_in_min, get_jwt_identity())
+        )
+        expires_at = cur.fetchone()['expires_at']
+        conn.commit()
+
+        # This worker routes around the change now; the others pick it up within ROAD_OVERLAY_POLL_S
+        road_graph.sync_overlays(force=True)
+
+        return jsonify({
+            "is_success": True,
+            "msg": "Road overlay set",
+            "data": {
+                "road_id": str(road_id),
+                "factor": factor,
+                "closed": closed,
+                "expires_at": expires_at.isoformat()
+            }
+        }), 200
+    except psycopg2.errors.ForeignKeyViolation:
+        conn.rollback()
+        return jsonify({"is_success": False, "msg": "Road not found"}), 404
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"is_success": False, "msg": str(e)}), 500
+    finally:
+        cur.close()
+        conn.close()
+
+@app.route('/admin/roads/<uuid:road_id>/overlay', methods=['DELETE'])
+@admin_required
+def delete_road_overlay(road_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM road_overlays WHERE road_id = %s RETURNING road_id;", (str(road_id),))
+        deleted = cur.fetchone()
+        if not deleted:
+            return jsonify({"is_success": False, "msg": "Road overlay not found"}), 404
+
+        conn.commit()
+
+        road_graph.sync_overlays(force=True)
+
+        return jsonify({"is_success": True, "msg": "Road overlay removed"}), 200
+    finally:
+        cur.close()
+        conn.close()
+
 @app.route('/admin/users/<uuid:user_id>/make-admin', methods=['POST'])
 @admin_required
 def make_user_admin(user_id):
@@ -1619,6 +4369,9 @@ def make_user_admin(user_id):
             return jsonify({"is_success": False,"msg": "User not found"}), 404
             
         conn.commit()
+        # This worker honours the change now; others once their reading expires, or at once for a
+        # token issued after it
+        admin_cache.set(user_id_str, True)
         return jsonify({"is_success": True,"msg": "User granted admin privileges"}), 200
     finally:
         cur.close()
@@ -1627,7 +4380,18 @@ def make_user_admin(user_id):
 # Health check
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "nodes": len(road_graph.nodes)})
+    return jsonify({
+        "status": "healthy",
+        "nodes": road_graph.graph.node_count,
+        "graph_version": road_graph.version,
+        "memory": road_graph.memory_footprint(),
+        "hierarchy": road_graph.hierarchy_status(),
+        "shared_generation": road_graph.shared_generation,
+        "db_pool": get_db_pool().stats(),
+        "route_cache": road_graph.route_cache.stats(),
+        "road_overlay": {"roads": len(road_graph.overlay), "version": road_graph.overlay_version},
+        "route_writes": route_writer.stats()
+    })
 
 # Error handlers
 @app.errorhandler(404)
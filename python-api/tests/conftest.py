@@ -0,0 +1,175 @@
+import datetime
+import math
+import os
+import random
+import sys
+
+import psycopg2
+import psycopg2.errors
+import pytest
+
+# app.py loads the road graph from the database on import; tests fill a fake database with the
+# roads they need and build their own graphs, and no snapshot is written next to the app
+os.environ['GRAPH_SNAPSHOT_PATH'] = ''
+os.environ['GRAPH_SHARED_MEMORY'] = 'false'
+os.environ['GRAPH_CH_ENABLED'] = 'false'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROAD_TYPES = ('highway', 'local', 'residential', 'service', 'pedestrian')
+
+
+class FakeDatabase:
+    """The roads, road_overlays and locations tables the road graph and location index read.
+
+    Queries are told apart by their text; isochrone hulls come back as an empty polygon and
+    anything else as an empty table. Setting overlays to None makes road_overlays missing, as
+    before its migration.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.roads = {}
+        self.overlays = []
+        self.locations = []
+        self.updated_at = None
+        self.queries = []
+
+    def touch(self):
+        """Move roads.updated_at on, as any edit of the roads table does"""
+        self.updated_at = (self.updated_at or datetime.datetime(2026, 1, 1)) + datetime.timedelta(seconds=1)
+
+    def add_road(self, road_id, coords, is_oneway=False, road_type='local', length_m=None):
+        self.roads[road_id] = {
+            'id': road_id,
+            'wkt': 'LINESTRING(' + ','.join(f'{lon!r} {lat!r}' for lon, lat in coords) + ')',
+            'length_m': length_m,
+            'is_oneway': is_oneway,
+            'burmese_name': f'လမ်း {len(self.roads)}',
+            'english_name': f'Road {len(self.roads)}',
+            'road_type': road_type
+        }
+        self.touch()
+
+    def add_grid(self, size, seed, step=0.001):
+        """size x size grid near Maubin: rows of roads spanning up to four blocks, single-block
+        column roads, mixed road types, some one-way and every block a little longer than its
+        straight line"""
+        rnd = random.Random(seed)
+
+        def point(x, y):
+            return (round(95.64 + step * x, 6), round(16.72 + step * y, 6))
+
+        def lengths(coords):
+            return [math.dist(a, b) * 111320 * rnd.uniform(1.0, 1.3) for a, b in zip(coords, coords[1:])]
+
+        spans = [[point(x, y) for x in range(start, min(start + 5, size))]
+                 for y in range(size) for start in range(0, size - 1, 4)]
+        spans += [[point(x, y), point(x, y + 1)] for x in range(size) for y in range(size - 1)]
+        for coords in spans:
+            self.add_road(f'00000000-0000-0000-0000-{len(self.roads):012d}', coords,
+                          is_oneway=rnd.random() < 0.15, road_type=rnd.choice(ROAD_TYPES),
+                          length_m=lengths(coords))
+
+    def query(self, sql, params=None):
+        self.queries.append(sql)
+        if 'FROM road_overlays WHERE expires_at' in sql:
+            if self.overlays is None:
+                raise psycopg2.errors.UndefinedTable('relation "road_overlays" does not exist')
+            return [tuple(overlay) for overlay in self.overlays]
+        if 'COUNT(*)' in sql and 'FROM roads' in sql:
+            return [(len(self.roads), self.updated_at)]
+        if 'FROM roads WHERE id = %s' in sql:
+            road = self.roads.get(str(params[0]))
+            return [dict(road)] if road else []
+        if 'FROM roads' in sql:
+            return [dict(road) for road in self.roads.values()]
+        if 'FROM locations' in sql:
+            return [dict(location) for location in self.locations]
+        if 'ST_ConcaveHull' in sql:
+            # Stands in for the hull of the band's points
+            return [('{"type": "Polygon", "coordinates": []}',)]
+        return []
+
+
+database = FakeDatabase()
+
+
+class FakeCursor:
+    def execute(self, sql, params=None):
+        self.rows = database.query(sql, params)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class ConnectionInfo:
+    transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    closed = 0
+    info = ConnectionInfo()
+
+    def cursor(self, *args, **kwargs):
+        cursor = FakeCursor()
+        cursor.connection = self
+        return cursor
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+psycopg2.connect = lambda *args, **kwargs: FakeConnection()
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def fake_db():
+    database.reset()
+    yield database
+    database.reset()
+
+
+@pytest.fixture
+def grid_roads(app_module, fake_db):
+    """RoadGraph built from an 8 x 8 grid of roads in the fake database"""
+    fake_db.add_grid(8, seed=7)
+    return app_module.RoadGraph()
+
+
+@pytest.fixture
+def api(app_module, grid_roads, monkeypatch):
+    """Test client routing on grid_roads, sending a plain user's bearer token; batches run in a pool
+    of two processes of their own"""
+    monkeypatch.setitem(app_module.app.config, 'JWT_SECRET_KEY', 'test-secret-' * 4)
+    monkeypatch.setattr(app_module, 'road_graph', grid_roads)
+    monkeypatch.setattr(app_module, 'location_index', app_module.LocationIndex())
+    router = app_module.BatchRouter(processes=2, chunk_size=2)
+    monkeypatch.setattr(app_module, 'batch_router', router)
+    with app_module.app.app_context():
+        token = app_module.create_access_token(identity='00000000-0000-0000-0000-0000000000aa')
+    client = app_module.app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    yield client
+    router.shutdown()
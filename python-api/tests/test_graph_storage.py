@@ -0,0 +1,160 @@
+import random
+from collections import Counter
+
+import pytest
+
+
+def random_points(count, seed):
+    """Points scattered over the 8 x 8 grid of the grid_roads fixture and a little beyond it"""
+    rnd = random.Random(seed)
+    return [(95.64 + rnd.uniform(-0.0005, 0.0075), 16.72 + rnd.uniform(-0.0005, 0.0075)) for _ in range(count)]
+
+
+def edge_set(graph):
+    """Edges as (from, to, length, road id), which unlike node numbers do not depend on how the graph was built"""
+    return Counter((graph.coord(graph.sources[edge]), graph.coord(graph.targets[edge]),
+                    round(graph.weights[edge], 9), graph.road_ids[graph.edge_roads[edge]])
+                   for edge in range(graph.edge_count))
+
+
+def route_totals(road_graph, points, profile='shortest'):
+    """Distance and duration of the route between each two consecutive points, one after the other"""
+    totals = []
+    for start, end in zip(points, points[1:]):
+        _, distance, segments = road_graph.find_route(start, end, profile=profile)
+        totals += [distance, sum(segment['duration'] for segment in segments)]
+    return totals
+
+
+def test_snapshot_round_trip(app_module, grid_roads, tmp_path):
+    path = str(tmp_path / 'graph.snapshot')
+    grid_roads.save_snapshot(path)
+
+    mapped = app_module.RoadGraph()
+    assert mapped.load_snapshot(path, grid_roads.fingerprint)
+    for name in app_module.CompactGraph.ARRAY_NAMES:
+        assert list(getattr(mapped.graph, name)) == list(getattr(grid_roads.graph, name)), name
+    assert mapped.graph.road_ids == grid_roads.graph.road_ids
+    assert mapped.graph.road_info == grid_roads.graph.road_info
+    assert {road_id: (list(nodes), list(lengths), oneway, names)
+            for road_id, (nodes, lengths, oneway, names) in mapped.roads.items()} == \
+           {road_id: (list(nodes), list(lengths), oneway, names)
+            for road_id, (nodes, lengths, oneway, names) in grid_roads.roads.items()}
+
+    for profile in app_module.ROUTE_PROFILES:
+        costs, times, cost_per_meter = mapped.graph.profile_weights(profile)
+        expected = grid_roads.graph.profile_weights(profile)
+        assert list(costs) == list(expected[0]) and list(times) == list(expected[1]), profile
+        assert cost_per_meter == expected[2]
+        # Taken from the snapshot, not computed again
+        assert isinstance(times, memoryview), profile
+
+    points = random_points(12, 1)
+    for profile in ('shortest', 'fastest'):
+        assert route_totals(mapped, points, profile) == pytest.approx(route_totals(grid_roads, points, profile))
+
+
+def test_snapshot_rejected_when_stale(app_module, grid_roads, fake_db, tmp_path):
+    path = str(tmp_path / 'graph.snapshot')
+    grid_roads.save_snapshot(path)
+    fake_db.touch()
+
+    assert not grid_roads.load_snapshot(path, 'another fingerprint')
+    assert not grid_roads.load_snapshot(str(tmp_path / 'missing.snapshot'), grid_roads.fingerprint)
+
+
+def test_snapshot_recomputes_changed_profiles(app_module, grid_roads, tmp_path, monkeypatch):
+    path = str(tmp_path / 'graph.snapshot')
+    grid_roads.save_snapshot(path)
+    expected = list(grid_roads.graph.profile_weights('fastest')[0])
+
+    speeds = dict(app_module.ROUTE_PROFILES['fastest'].speeds, highway=10.0)
+    monkeypatch.setattr(app_module.ROUTE_PROFILES['fastest'], 'speeds', speeds)
+    mapped = app_module.RoadGraph()
+    assert mapped.load_snapshot(path, grid_roads.fingerprint)
+
+    costs = mapped.graph.profile_weights('fastest')[0]
+    assert not isinstance(costs, memoryview)
+    assert list(costs) != expected
+    assert list(costs) == list(app_module.ROUTE_PROFILES['fastest'].edge_weights(mapped.graph)[0])
+
+
+def test_shared_store_spreads_graph_and_edits(app_module, grid_roads, fake_db, tmp_path):
+    store = app_module.SharedGraphStore(str(tmp_path), 'graph')
+    grid_roads.shared = store
+    grid_roads._share()
+    assert store.generation() == grid_roads.shared_generation == 1
+
+    worker = app_module.RoadGraph()
+    worker.shared = app_module.SharedGraphStore(str(tmp_path), 'graph')
+    worker.sync_shared()
+    assert worker.shared_generation == 1
+    assert edge_set(worker.graph) == edge_set(grid_roads.graph)
+    assert isinstance(worker.graph.targets, memoryview)
+    # Profile weights are mapped from the shared file as well, each distinct array stored once
+    for profile in app_module.ROUTE_PROFILES:
+        costs, times, _ = worker.graph.profile_weights(profile)
+        assert isinstance(times, memoryview), profile
+        assert costs is worker.graph.weights or isinstance(costs, memoryview), profile
+        assert list(costs) == list(grid_roads.graph.profile_weights(profile)[0]), profile
+
+    # An edit in one worker reaches the other on its next sync
+    road_id = next(iter(fake_db.roads))
+    fake_db.roads[road_id]['is_oneway'] = not fake_db.roads[road_id]['is_oneway']
+    fake_db.touch()
+    grid_roads.refresh_road(road_id)
+    assert store.generation() == 2
+    worker.sync_shared()
+    assert worker.shared_generation == 2
+    assert worker.fingerprint == grid_roads.fingerprint
+    assert edge_set(worker.graph) == edge_set(grid_roads.graph)
+
+    # Edits made by the attached worker are applied on top of the newest generation
+    del fake_db.roads[road_id]
+    fake_db.touch()
+    worker.remove_road(road_id)
+    grid_roads.sync_shared()
+    assert grid_roads.shared_generation == store.generation() == 3
+    assert road_id not in grid_roads.graph.road_ids
+    assert edge_set(worker.graph) == edge_set(grid_roads.graph)
+
+
+def test_road_deltas_match_full_rebuild(app_module, grid_roads, fake_db):
+    road_ids = list(fake_db.roads)
+    rerouted, flipped, deleted = road_ids[3], road_ids[10], road_ids[20]
+
+    # Geometry, direction and length changes, a deleted road and a new road
+    road = fake_db.roads[rerouted]
+    vertices = road['wkt'][len('LINESTRING('):-1].split(',')
+    road['wkt'] = f"LINESTRING({vertices[0]},95.6415 16.7235,{vertices[-1]})"
+    road['length_m'] = [400.0, 350.0]
+    fake_db.roads[flipped]['is_oneway'] = not fake_db.roads[flipped]['is_oneway']
+    del fake_db.roads[deleted]
+    fake_db.add_road('00000000-0000-0000-0000-999999999999', [(95.64, 16.72), (95.647, 16.727)],
+                     road_type='highway', length_m=[1200.0])
+
+    for road_id in (rerouted, flipped, '00000000-0000-0000-0000-999999999999'):
+        grid_roads.refresh_road(road_id)
+    grid_roads.remove_road(deleted)
+
+    rebuilt = app_module.RoadGraph()
+    assert grid_roads.fingerprint == rebuilt.fingerprint
+    assert grid_roads.graph.road_ids == rebuilt.graph.road_ids
+    assert edge_set(grid_roads.graph) == edge_set(rebuilt.graph)
+    points = random_points(16, 2)
+    for profile in app_module.ROUTE_PROFILES:
+        assert route_totals(grid_roads, points, profile) == pytest.approx(route_totals(rebuilt, points, profile))
+
+
+def test_refresh_of_deleted_road_removes_it(app_module, grid_roads, fake_db):
+    road_id = next(iter(fake_db.roads))
+    version = grid_roads.version
+    del fake_db.roads[road_id]
+    fake_db.touch()
+
+    grid_roads.refresh_road(road_id)
+    assert road_id not in grid_roads.graph.road_ids
+    assert grid_roads.version == version + 1
+    # Nothing left to remove, so the graph is not rebuilt again
+    grid_roads.remove_road(road_id)
+    assert grid_roads.version == version + 1
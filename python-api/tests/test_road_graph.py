@@ -0,0 +1,117 @@
+import math
+import random
+from array import array
+
+import pytest
+
+ALGORITHMS = ('dijkstra', 'astar', 'bidirectional', 'ch')
+
+
+def grid_graph(app, size, seed):
+    """size x size grid of roads near Maubin with some one-way and some missing blocks.
+
+    Every block is at least as long as the straight line between its ends, so the A* heuristic
+    stays admissible.
+    """
+    rnd = random.Random(seed)
+    lon = array('d', (95.64 + 0.001 * (i % size) for i in range(size * size)))
+    lat = array('d', (16.72 + 0.001 * (i // size) for i in range(size * size)))
+    sources, targets, weights, edge_roads, road_ids = array('i'), array('i'), array('d'), array('i'), []
+    for node in range(size * size):
+        x, y = node % size, node // size
+        for neighbor in ([node + 1] if x + 1 < size else []) + ([node + size] if y + 1 < size else []):
+            if rnd.random() < 0.1:
+                continue
+            length = app.haversine_distance((lon[node], lat[node]), (lon[neighbor], lat[neighbor])) * rnd.uniform(1, 1.5)
+            ends = [(node, neighbor), (neighbor, node)]
+            if rnd.random() < 0.2:
+                ends = [rnd.choice(ends)]
+            for source, target in ends:
+                sources.append(source)
+                targets.append(target)
+                weights.append(length)
+                edge_roads.append(len(road_ids))
+            road_ids.append(f'road-{len(road_ids)}')
+    return app.CompactGraph.from_edges(lon, lat, sources, targets, weights, edge_roads, road_ids)
+
+
+def reference_distances(graph, start, weights=None):
+    """O(V^2) Dijkstra straight over the edge list, without a heap or the CSR offsets"""
+    weights = graph.weights if weights is None else weights
+    distances = [math.inf] * graph.node_count
+    distances[start] = 0.0
+    settled = [False] * graph.node_count
+    for _ in range(graph.node_count):
+        current = min((node for node in range(graph.node_count) if not settled[node]),
+                      key=lambda node: distances[node])
+        if distances[current] == math.inf:
+            break
+        settled[current] = True
+        for edge in range(graph.edge_count):
+            if graph.sources[edge] == current:
+                distances[graph.targets[edge]] = min(distances[graph.targets[edge]], distances[current] + weights[edge])
+    return distances
+
+
+def path_cost(graph, path, start, end, weights=None):
+    weights = graph.weights if weights is None else weights
+    node = start
+    for edge in path:
+        assert graph.sources[edge] == node
+        node = graph.targets[edge]
+    assert node == end
+    return sum(weights[edge] for edge in path)
+
+
+def search(graph, hierarchy, algorithm, start, end):
+    if algorithm == 'ch':
+        return hierarchy.shortest_path(start, end)
+    return graph.shortest_path(start, end, algorithm)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_searches_match_reference(app_module, seed):
+    graph = grid_graph(app_module, 9, seed)
+    hierarchy = app_module.ContractionHierarchy(graph)
+    rnd = random.Random(seed)
+    for start in rnd.sample(range(graph.node_count), 8):
+        expected = reference_distances(graph, start)
+        for end in rnd.sample(range(graph.node_count), 12):
+            for algorithm in ALGORITHMS:
+                cost, path = search(graph, hierarchy, algorithm, start, end)
+                if expected[end] == math.inf:
+                    assert path is None and cost == math.inf, (algorithm, start, end)
+                    continue
+                assert cost == pytest.approx(expected[end]), (algorithm, start, end)
+                assert path_cost(graph, path, start, end) == pytest.approx(expected[end]), (algorithm, start, end)
+
+
+def test_closed_roads_are_never_used(app_module):
+    graph = grid_graph(app_module, 9, 4)
+    rnd = random.Random(4)
+    closed = set(rnd.sample(graph.road_ids, 15))
+    view = graph.with_road_factors({road_id: math.inf for road_id in closed}, 1)
+    costs = view.profile_weights()[0]
+    for start in rnd.sample(range(graph.node_count), 5):
+        expected = reference_distances(graph, start, costs)
+        for end in rnd.sample(range(graph.node_count), 10):
+            for algorithm in ('dijkstra', 'astar', 'bidirectional'):
+                cost, path = view.shortest_path(start, end, algorithm)
+                if expected[end] == math.inf:
+                    assert path is None, (algorithm, start, end)
+                    continue
+                assert cost == pytest.approx(expected[end]), (algorithm, start, end)
+                assert not closed & {graph.road_ids[graph.edge_roads[edge]] for edge in path}
+
+
+def test_points_snap_past_closed_roads(app_module):
+    graph = grid_graph(app_module, 9, 5)
+    point = (graph.lon[40] + 0.0001, graph.lat[40] + 0.00002)
+    edge = graph.snap_to_road(point)[0]
+    closed = graph.road_ids[graph.edge_roads[edge]]
+    view = graph.with_road_factors({closed: math.inf}, 1)
+
+    snap = view.snap_to_road(point)
+    assert snap is not None
+    assert graph.road_ids[graph.edge_roads[snap[0]]] != closed
+    assert view.profile_weights()[0][snap[0]] < math.inf
@@ -0,0 +1,129 @@
+import json
+import os
+import random
+
+import pytest
+
+
+def random_points(count, seed):
+    """Points scattered over the 8 x 8 grid of the grid_roads fixture"""
+    rnd = random.Random(seed)
+    return [(95.64 + rnd.uniform(0, 0.007), 16.72 + rnd.uniform(0, 0.007)) for _ in range(count)]
+
+
+def batch_pairs(points):
+    return [{"start_lon": start[0], "start_lat": start[1], "end_lon": end[0], "end_lat": end[1]}
+            for start, end in zip(points, points[1:])]
+
+
+def batch_lines(response):
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return sorted((json.loads(line) for line in response.get_data(as_text=True).splitlines()),
+                  key=lambda line: line['index'])
+
+
+def test_matrix_endpoint(app_module, api, grid_roads):
+    points = random_points(4, 1)
+    response = api.post('/routes/matrix', json={"points": [list(point) for point in points],
+                                                 "optimization": "fastest"})
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    rows, _ = grid_roads.distance_matrix(points, points, profile='fastest')
+    assert data['distances'] == [[round(pair[0], 1) for pair in row] for row in rows]
+    assert data['durations'] == [[round(pair[1], 1) for pair in row] for row in rows]
+    assert data['sources_snapped'] == data['destinations_snapped'] == [True] * 4
+
+
+@pytest.mark.parametrize('body', [
+    {"points": "95.64,16.72"},
+    {"points": {"lon": 95.64, "lat": 16.72}},
+    {"sources": [[95.64, 16.72]], "destinations": 5},
+    {"points": [[95.64]]},
+    {"points": [[95.64, 16.72]], "optimization": "scenic"},
+    {}
+])
+def test_matrix_endpoint_rejects_bad_points(api, body):
+    response = api.post('/routes/matrix', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['is_success'] is False
+
+
+def test_isochrone_endpoint(app_module, api, grid_roads):
+    response = api.get('/isochrone?lon=95.6433&lat=16.7241&distances=700,300')
+    assert response.status_code == 200
+    bands = response.get_json()['data']['bands']
+    assert [band['distance'] for band in bands] == [300.0, 700.0]
+    reachable = grid_roads.isochrone((95.6433, 16.7241), [300.0, 700.0])
+    assert [band['node_count'] for band in bands] == [
+        sum(1 for node in reachable['nodes'] if node[2] <= budget) for budget in (300.0, 700.0)]
+
+    response = api.get('/isochrone?lon=95.6433&lat=16.7241&minutes=1,2')
+    assert response.status_code == 200
+    assert [band['seconds'] for band in response.get_json()['data']['bands']] == [60.0, 120.0]
+
+
+def test_isochrone_minutes_are_capped_by_the_fastest_road(app_module, api):
+    cap = app_module.ISOCHRONE_MAX_DISTANCE_M / app_module.ROUTE_PROFILES['shortest'].top_speed() / 60
+    response = api.get(f'/isochrone?lon=95.6433&lat=16.7241&minutes={cap + 1:.0f}')
+    assert response.status_code == 400
+    assert f"{cap:.1f} minutes" in response.get_json()['msg']
+    assert api.get('/isochrone?lon=95.6433&lat=16.7241&minutes=0').status_code == 400
+    assert api.get('/isochrone?lon=95.6433&lat=16.7241&distances=30000').status_code == 400
+
+
+def test_batch_endpoint_streams_every_route(app_module, api, grid_roads):
+    points = random_points(8, 2)
+    lines = batch_lines(api.post('/routes/batch', json={"pairs": batch_pairs(points)}))
+    assert [line['index'] for line in lines] == list(range(7))
+    for line, start, end in zip(lines, points, points[1:]):
+        assert line['is_success'] is True
+        assert line['distance'] == pytest.approx(grid_roads.find_route(start, end)[1])
+        assert 'route_id' not in line
+
+
+@pytest.mark.parametrize('pairs', ["95.64,16.72", {"start_lon": 95.64}, [{"start_lon": 95.64}], [[95.64, 16.72]]])
+def test_batch_endpoint_rejects_bad_pairs(api, pairs):
+    response = api.post('/routes/batch', json={"pairs": pairs})
+    assert response.status_code == 400
+    assert response.get_json()['is_success'] is False
+
+
+def test_batch_endpoint_reports_failed_pairs(app_module, api, grid_roads, monkeypatch):
+    points = random_points(6, 3)
+    find_route = grid_roads.find_route
+
+    def failing(start, end, *args, **kwargs):
+        if start == points[2]:
+            raise ValueError('search failed')
+        return find_route(start, end, *args, **kwargs)
+
+    monkeypatch.setattr(grid_roads, 'find_route', failing)
+    lines = batch_lines(api.post('/routes/batch', json={"pairs": batch_pairs(points)}))
+    assert [line['index'] for line in lines] == list(range(5))
+    assert lines[2]['is_success'] is False and lines[2]['error'] == 'search failed'
+    assert all(line['is_success'] for line in lines if line['index'] != 2)
+
+
+def test_batch_endpoint_survives_a_killed_process(app_module, api, grid_roads, monkeypatch):
+    points = random_points(10, 4)
+    parent = os.getpid()
+    find_route = grid_roads.find_route
+
+    def dying(start, end, *args, **kwargs):
+        # Only in the pool's processes; the request finishes the batch itself
+        if start == points[5] and os.getpid() != parent:
+            os._exit(1)
+        return find_route(start, end, *args, **kwargs)
+
+    monkeypatch.setattr(grid_roads, 'find_route', dying)
+    lines = batch_lines(api.post('/routes/batch', json={"pairs": batch_pairs(points)}))
+    assert [line['index'] for line in lines] == list(range(9))
+    assert all(line['is_success'] for line in lines)
+    # The broken pool was dropped and the next batch gets a new one
+    assert app_module.batch_router._executor is None
+
+    monkeypatch.setattr(grid_roads, 'find_route', find_route)
+    lines = batch_lines(api.post('/routes/batch', json={"pairs": batch_pairs(points[:4])}))
+    assert [line['is_success'] for line in lines] == [True] * 3
+    assert app_module.batch_router._executor is not None
@@ -0,0 +1,206 @@
+import logging
+import random
+
+import pytest
+
+
+def random_points(count, seed):
+    """Points scattered over the 8 x 8 grid of the grid_roads fixture and a little beyond it"""
+    rnd = random.Random(seed)
+    return [(95.64 + rnd.uniform(-0.0005, 0.0075), 16.72 + rnd.uniform(-0.0005, 0.0075)) for _ in range(count)]
+
+
+def road_ids(segments):
+    return {segment['road_id'] for segment in segments if segment.get('type') != 'user_segment'}
+
+
+def test_route_cache_is_a_bounded_lru_with_ttl(app_module):
+    cache = app_module.RouteCache(max_size=2, ttl_s=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == (True, 1)
+    # b is now the least recently used
+    cache.put('c', 3)
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1) and cache.get('c') == (True, 3)
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1, "hit_rate": 0.75}
+
+    expired = app_module.RouteCache(max_size=2, ttl_s=-1)
+    expired.put('a', 1)
+    assert expired.get('a') == (False, None)
+    assert expired.stats()['size'] == 0
+
+    disabled = app_module.RouteCache(max_size=0)
+    disabled.put('a', 1)
+    assert disabled.get('a') == (False, None)
+
+
+def test_route_cache_retag_keeps_only_chosen_entries(app_module):
+    cache = app_module.RouteCache()
+    cache.put(('kept', 1, 0), 'kept')
+    cache.put(('dropped', 1, 0), 'dropped')
+    cache.put(('older', 0, 0), 'older')
+
+    cache.retag((1, 0), (1, 1), lambda key, value: value == 'kept')
+    assert cache.get(('kept', 1, 1)) == (True, 'kept')
+    assert cache.get(('kept', 1, 0)) == (False, None)
+    assert cache.get(('dropped', 1, 1)) == (False, None)
+    assert cache.get(('older', 0, 0)) == (False, None)
+
+
+def test_cached_routes_match_fresh_searches(app_module, grid_roads):
+    uncached = app_module.RoadGraph()
+    uncached.route_cache = app_module.RouteCache(max_size=0)
+    points = random_points(10, 1)
+    for profile in app_module.ROUTE_PROFILES:
+        for algorithm in ('dijkstra', 'astar', 'bidirectional'):
+            for start, end in zip(points, points[1:]):
+                for _ in range(2):
+                    path, distance, segments = grid_roads.find_route(start, end, algorithm, profile=profile)
+                    expected = uncached.find_route(start, end, algorithm, profile=profile)
+                    assert path == expected[0], (profile, algorithm)
+                    assert distance == pytest.approx(expected[1])
+                    assert segments == expected[2]
+    stats = grid_roads.route_cache.stats()
+    assert stats['hits'] >= stats['misses'] > 0
+
+
+def test_nearby_points_share_cached_routes(app_module, grid_roads, fake_db):
+    start, end = (95.6412, 16.72103), (95.6465, 16.7258)
+    stats = {}
+    route = grid_roads.find_route(start, end, stats=stats)
+    assert route[0] and stats['cache_hit'] is False
+
+    stats = {}
+    assert grid_roads.find_route(start, end, stats=stats) == route
+    assert stats['cache_hit'] is True
+
+    # A few centimetres away the cached route is reused and fitted to the exact point
+    nudged = (start[0] + 2e-7, start[1] + 2e-7)
+    stats = {}
+    path, distance, segments = grid_roads.find_route(nudged, end, stats=stats)
+    assert stats['cache_hit'] is True
+    assert path[0] == nudged
+    grid_roads.route_cache.clear()
+    assert distance == pytest.approx(grid_roads.find_route(nudged, end)[1])
+
+    # Any road edit replaces the graph, and with it every cached route
+    road_id = next(road_id for road_id in fake_db.roads if road_id not in road_ids(segments))
+    fake_db.roads[road_id]['is_oneway'] = not fake_db.roads[road_id]['is_oneway']
+    fake_db.touch()
+    grid_roads.refresh_road(road_id)
+    stats = {}
+    grid_roads.find_route(start, end, stats=stats)
+    assert stats['cache_hit'] is False
+
+
+@pytest.mark.parametrize('profile', ['shortest', 'fastest', 'pedestrian', 'avoid_highway'])
+def test_matrix_matches_find_route(app_module, grid_roads, profile):
+    far = (95.70, 16.80)
+    points = random_points(8, 2) + [far]
+    sources = points[:5]
+    rows, snapped = grid_roads.distance_matrix(sources, points, profile=profile)
+    assert snapped == [True] * 5 + [True] * 8 + [False]
+
+    for source, row in zip(sources, rows):
+        for destination, pair in zip(points, row):
+            if destination == source:
+                assert pair == (0.0, 0.0)
+                continue
+            path, distance, segments = grid_roads.find_route(source, destination, profile=profile)
+            if path is None:
+                assert pair is None
+                continue
+            assert pair == pytest.approx((distance, app_module.route_duration(segments)))
+
+    limited, _ = grid_roads.distance_matrix(sources, points, max_distance=600, profile=profile)
+    for row, limited_row in zip(rows, limited):
+        assert limited_row == [pair if pair is not None and pair[0] <= 600 else None for pair in row]
+
+
+def test_isochrone_matches_find_route(app_module, grid_roads):
+    point = (95.6433, 16.7241)
+    budgets = [300.0, 700.0]
+    result = grid_roads.isochrone(point, budgets)
+    reached = {(lon, lat): distance for lon, lat, distance in result['nodes']}
+    graph = grid_roads.graph
+
+    for node in range(graph.node_count):
+        coord = graph.coord(node)
+        path, distance, _ = grid_roads.find_route(point, coord)
+        if coord in reached:
+            assert reached[coord] == pytest.approx(distance)
+        else:
+            assert path is None or distance > budgets[-1] - 1e-6
+
+    for budget, band in zip(budgets, result['band_points']):
+        band = set(band)
+        assert all(coord in band for coord, distance in reached.items() if distance <= budget)
+    for _, _, start_value, end_value in result['edges']:
+        assert start_value <= end_value <= budgets[-1] + 1e-6
+
+    assert grid_roads.isochrone((96.5, 17.5), budgets) is None
+
+
+def test_timed_isochrone_matches_fastest_routes(app_module, grid_roads):
+    point = (95.6433, 16.7241)
+    result = grid_roads.isochrone(point, [60.0, 150.0], by_time=True)
+    assert result['nodes']
+    for lon, lat, seconds in result['nodes']:
+        path, _, segments = grid_roads.find_route(point, (lon, lat), profile='fastest')
+        assert seconds == pytest.approx(app_module.route_duration(segments))
+        assert seconds <= 150.0
+
+
+def test_overlays_close_roads_and_keep_unaffected_routes(app_module, grid_roads, fake_db):
+    start, end = (95.6412, 16.72103), (95.6465, 16.7258)
+    _, distance, segments = grid_roads.find_route(start, end)
+    used = road_ids(segments)
+
+    # A penalty on a road the route does not touch leaves the cached route valid
+    unrelated = next(road_id for road_id in fake_db.roads if road_id not in used)
+    fake_db.overlays = [(unrelated, 3.0, False)]
+    grid_roads.sync_overlays(force=True)
+    assert grid_roads.overlay_version == 1
+    stats = {}
+    assert grid_roads.find_route(start, end, stats=stats)[1] == pytest.approx(distance)
+    assert stats['cache_hit'] is True
+
+    # Closing a road on the route finds a detour that avoids it
+    closed = sorted(used)[len(used) // 2]
+    fake_db.overlays.append((closed, 1.0, True))
+    grid_roads.sync_overlays(force=True)
+    stats = {}
+    path, detour, detour_segments = grid_roads.find_route(start, end, stats=stats)
+    assert stats['cache_hit'] is False
+    assert path is not None
+    assert closed not in road_ids(detour_segments)
+    assert detour >= distance - 1e-6
+
+    # Once the closure is lifted the original route is found again
+    fake_db.overlays = []
+    grid_roads.sync_overlays(force=True)
+    stats = {}
+    assert grid_roads.find_route(start, end, stats=stats)[1] == pytest.approx(distance)
+    assert stats['cache_hit'] is False
+
+
+def test_overlay_polls_back_off_while_table_is_missing(app_module, grid_roads, fake_db, caplog):
+    fake_db.overlays = None
+    with caplog.at_level(logging.INFO):
+        for _ in range(3):
+            grid_roads.sync_overlays(force=True)
+        assert grid_roads._overlay_interval == min(app_module.ROAD_OVERLAY_POLL_S * 8,
+                                                   app_module.ROAD_OVERLAY_MISSING_POLL_S)
+        # Not due yet, so no query is made
+        queries = len(fake_db.queries)
+        grid_roads.sync_overlays()
+        assert len(fake_db.queries) == queries
+
+        fake_db.overlays = []
+        grid_roads.sync_overlays(force=True)
+    messages = [record.getMessage() for record in caplog.records]
+    assert sum('road_overlays table exists' in message for message in messages) == 1
+    assert not any('Road overlay refresh failed' in message for message in messages)
+    assert any('Road overlays table found' in message for message in messages)
+    assert grid_roads._overlay_interval == app_module.ROAD_OVERLAY_POLL_S
@@ -0,0 +1,118 @@
+import os
+import time
+
+import pytest
+
+
+class Inserts:
+    """Stands in for RouteWriter._insert, recording each batch; records whose route_id is in bad fail"""
+    def __init__(self):
+        self.batches = []
+        self.bad = set()
+
+    def __call__(self, records):
+        if self.bad & {record['route_id'] for record in records}:
+            raise ValueError('violates check constraint')
+        self.batches.append([record['route_id'] for record in records])
+
+
+def record(route_id):
+    return {"route_id": route_id, "history_id": f"history-{route_id}"}
+
+
+@pytest.fixture
+def inserts():
+    return Inserts()
+
+
+@pytest.fixture
+def writer(app_module, inserts):
+    """RouteWriter without its background thread, so tests decide when queued routes are written"""
+    writer = app_module.RouteWriter(max_size=2, batch_size=3)
+    writer._insert = inserts
+    writer._thread_pid = os.getpid()
+    return writer
+
+
+def test_writer_queues_then_writes_inline_when_full(writer, inserts):
+    assert writer.submit(record('a')) == 'pending'
+    assert writer.submit(record('b')) == 'pending'
+    assert inserts.batches == []
+    # The queue is full, so the request writes its own route
+    assert writer.submit(record('c')) == 'saved'
+    assert inserts.batches == [['c']]
+
+    writer.flush()
+    assert inserts.batches == [['c'], ['a', 'b']]
+    assert writer.stats() == {"queued": 0, "max_queued": 2, "written": 3, "failed": 0, "routes_reused": 0,
+                              "inline_writes": 1, "last_error": None}
+
+
+def test_writer_batches_up_to_batch_size(app_module, inserts):
+    writer = app_module.RouteWriter(max_size=10, batch_size=3)
+    writer._insert = inserts
+    writer._thread_pid = os.getpid()
+    for route_id in 'abcdefg':
+        writer.submit(record(route_id))
+    writer.flush()
+    assert inserts.batches == [['a', 'b', 'c'], ['d', 'e', 'f'], ['g']]
+
+
+def test_writer_retries_a_failed_batch_one_by_one(writer, inserts):
+    inserts.bad = {'b'}
+    writer.submit(record('a'))
+    writer.submit(record('b'))
+    writer.flush()
+    assert inserts.batches == [['a']]
+    stats = writer.stats()
+    assert (stats['written'], stats['failed']) == (1, 1)
+    assert stats['last_error'] == 'violates check constraint'
+
+    # An inline write that fails is reported as such
+    writer.submit(record('c'))
+    writer.submit(record('d'))
+    assert writer.submit(record('b')) == 'failed'
+
+
+def test_writer_thread_saves_in_the_background(app_module, inserts):
+    writer = app_module.RouteWriter(max_size=10, batch_size=10, interval_s=0.01)
+    writer._insert = inserts
+    assert writer.submit(record('a')) == 'pending'
+    deadline = time.monotonic() + 5
+    while writer.stats()['written'] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert inserts.batches == [['a']]
+
+
+def test_save_route_shares_route_rows(app_module, grid_roads, writer, inserts, monkeypatch):
+    monkeypatch.setattr(app_module, 'route_writer', writer)
+    start, end = (95.6412, 16.72103), (95.6465, 16.7258)
+    stats = {}
+    path, distance, segments = grid_roads.find_route(start, end, stats=stats)
+    duration = app_module.route_duration(segments)
+
+    saved = [app_module.save_route('user-1', start, end, path, distance, duration, segments,
+                                   'Start', 'End', 'shortest', stats['cost_key'])
+             for _ in range(2)]
+    assert [status for _, _, status in saved] == ['pending', 'pending']
+    # Same road positions, profile and roads: one shared route row, a history row each
+    assert saved[0][0] == saved[1][0]
+    assert saved[0][1] != saved[1][1]
+
+    # Both are still queued, so a third is written inline, and failing it returns no ids
+    inserts.bad = {saved[0][0]}
+    assert app_module.save_route('user-1', start, end, path, distance, duration, segments,
+                                 'Start', 'End', 'shortest', stats['cost_key']) == (None, None, 'failed')
+
+
+def test_plan_route_returns_ids_the_writer_saves(app_module, api, writer, inserts, monkeypatch):
+    monkeypatch.setattr(app_module, 'route_writer', writer)
+    response = api.post('/routes', json={"start_lon": 95.6412, "start_lat": 16.72103,
+                                         "end_lon": 95.6465, "end_lat": 16.7258})
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['save_status'] == 'pending'
+    assert inserts.batches == []
+
+    writer.flush()
+    assert inserts.batches == [[data['route_id']]]
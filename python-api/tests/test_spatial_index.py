@@ -0,0 +1,148 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+
+def scattered(count, seed, spread=0.01):
+    rnd = random.Random(seed)
+    return [(95.64 + rnd.uniform(0, spread), 16.72 + rnd.uniform(0, spread)) for _ in range(count)]
+
+
+def segment_distance(point, a, b):
+    """Meters from point to segment a-b, in an equirectangular projection centred on point"""
+    y_scale = 6371009.0 * math.pi / 180
+    x_scale = y_scale * math.cos(math.radians(point[1]))
+    ax, ay = (a[0] - point[0]) * x_scale, (a[1] - point[1]) * y_scale
+    dx, dy = (b[0] - point[0]) * x_scale - ax, (b[1] - point[1]) * y_scale - ay
+    length2 = dx * dx + dy * dy
+    t = min(1.0, max(0.0, -(ax * dx + ay * dy) / length2)) if length2 else 0.0
+    return math.hypot(ax + t * dx, ay + t * dy)
+
+
+@pytest.mark.parametrize('cell_m', [50, 200, 1000])
+def test_node_index_matches_linear_scan(app_module, cell_m):
+    coords = scattered(300, 1)
+    lon, lat = zip(*coords)
+    # Every other node indexed, as for the nodes of a subset of roads
+    nodes = list(range(0, len(coords), 2))
+    index = app_module.NodeIndex(lon, lat, nodes, cell_m)
+
+    for point in scattered(40, 2, spread=0.014):
+        ranked = sorted((app_module.haversine_distance(point, coords[node]), node) for node in nodes)
+        for k, max_distance in ((1, math.inf), (5, math.inf), (3, 150.0)):
+            expected = [distance for distance, _ in ranked if distance <= max_distance][:k]
+            found = index.nearest(point, k, max_distance)
+            assert [distance for _, distance in found] == pytest.approx(expected)
+            assert all(app_module.haversine_distance(point, coords[node]) == pytest.approx(distance)
+                       for node, distance in found)
+
+        found = index.within(point, 250.0)
+        assert sorted(node for node, _ in found) == sorted(node for distance, node in ranked if distance <= 250.0)
+        assert [distance for _, distance in found] == sorted(distance for _, distance in found)
+
+
+def test_edge_index_matches_linear_scan(app_module, grid_roads):
+    graph = grid_roads.graph
+    index = graph.edge_index()
+    rnd = random.Random(3)
+    usable = np.array([rnd.random() < 0.7 for _ in range(graph.edge_count)])
+
+    for point in scattered(60, 4, spread=0.009):
+        distances = [segment_distance(point, graph.coord(graph.sources[edge]), graph.coord(graph.targets[edge]))
+                     for edge in range(graph.edge_count)]
+        for mask, max_distance in ((None, math.inf), (usable, math.inf), (None, 60.0), (usable, 60.0)):
+            allowed = [distance for edge, distance in enumerate(distances) if mask is None or mask[edge]]
+            best = min(allowed)
+            snap = index.nearest(point, max_distance, mask)
+            if best > max_distance:
+                assert snap is None
+                continue
+            edge, fraction, foot, meters = snap
+            assert mask is None or mask[edge]
+            assert distances[edge] == pytest.approx(best, abs=1e-6)
+            assert meters == pytest.approx(best, abs=0.01)
+            source, target = graph.coord(graph.sources[edge]), graph.coord(graph.targets[edge])
+            assert foot == pytest.approx((source[0] + fraction * (target[0] - source[0]),
+                                          source[1] + fraction * (target[1] - source[1])))
+
+
+@pytest.fixture
+def locations(app_module, fake_db):
+    fake_db.locations = [{
+        'id': f'location-{i}', 'burmese_name': f'နေရာ {i}', 'english_name': f'Place {i}', 'address': None,
+        'lon': lon, 'lat': lat
+    } for i, (lon, lat) in enumerate(scattered(200, 5))]
+    return app_module.LocationIndex(ttl_s=0)
+
+
+def test_location_index_matches_linear_scan(app_module, fake_db, locations, monkeypatch):
+    monkeypatch.setattr(app_module, 'location_index', locations)
+    for point in scattered(30, 6):
+        ranked = sorted((app_module.haversine_distance(point, (location['lon'], location['lat'])), location['id'])
+                        for location in fake_db.locations)
+        nearest = locations.nearest(point, max_dist=500, k=4)
+        assert [distance for _, distance in nearest] == pytest.approx([d for d, _ in ranked if d <= 500][:4])
+        within = locations.within(point, 300)
+        assert sorted(location['id'] for location, _ in within) == sorted(i for d, i in ranked if d <= 300)
+
+        found = app_module.find_nearest_location(point, max_dist=100)
+        if ranked[0][0] <= 100:
+            assert app_module.haversine_distance(point, (found['lon'], found['lat'])) == pytest.approx(ranked[0][0])
+        else:
+            assert found is None
+
+
+def test_location_corridor_matches_linear_scan(app_module, fake_db, locations):
+    path = [(95.641, 16.721), (95.645, 16.722), (95.646, 16.727), (95.649, 16.729), (95.649, 16.729)]
+    radius = 150.0
+    matches, vertex_along, vertex_covered = locations.corridor(path, radius)
+
+    # Same local projection as the corridor: x scaled at the route's mean latitude
+    y_scale = 6371009.0 * math.pi / 180
+    x_scale = y_scale * math.cos(math.radians(sum(lat for _, lat in path) / len(path)))
+    xy = [(lon * x_scale, lat * y_scale) for lon, lat in path]
+    along = [0.0]
+    for (x1, y1), (x2, y2) in zip(xy, xy[1:]):
+        along.append(along[-1] + math.hypot(x2 - x1, y2 - y1))
+    assert list(vertex_along) == pytest.approx(along)
+
+    expected = []
+    for location in fake_db.locations:
+        px, py = location['lon'] * x_scale, location['lat'] * y_scale
+        best = None
+        for i, ((x1, y1), (x2, y2)) in enumerate(zip(xy, xy[1:])):
+            dx, dy = x2 - x1, y2 - y1
+            length2 = dx * dx + dy * dy
+            t = min(1.0, max(0.0, ((px - x1) * dx + (py - y1) * dy) / length2)) if length2 else 0.0
+            distance = math.hypot(x1 + t * dx - px, y1 + t * dy - py)
+            if best is None or distance < best[0]:
+                best = (distance, along[i] + t * math.sqrt(length2))
+        if best[0] <= radius:
+            expected.append((best[1], location['id']))
+    # Locations projecting onto the same point keep their table order
+    expected.sort(key=lambda match: match[0])
+
+    assert [location['id'] for location, _ in matches] == [location_id for _, location_id in expected]
+    assert [meters for _, meters in matches] == pytest.approx([meters for meters, _ in expected])
+    assert list(vertex_covered) == [
+        any(math.hypot(x - location['lon'] * x_scale, y - location['lat'] * y_scale) <= radius
+            for location in fake_db.locations)
+        for x, y in xy
+    ]
+
+
+def test_location_index_reloads_when_stale(app_module, fake_db, locations):
+    assert locations.nearest((95.645, 16.725), max_dist=10000)
+    fake_db.locations = []
+    # ttl_s=0 never reloads by age; an admin edit refreshes explicitly
+    assert locations.nearest((95.645, 16.725), max_dist=10000)
+    locations.refresh()
+    assert locations.nearest((95.645, 16.725), max_dist=10000) == []
+
+    aging = app_module.LocationIndex(ttl_s=1e-9)
+    assert aging.nearest((95.645, 16.725)) == []
+    fake_db.locations = [{'id': 'new', 'burmese_name': 'သစ်', 'english_name': 'New', 'address': None,
+                          'lon': 95.645, 'lat': 16.725}]
+    assert aging.nearest((95.645, 16.725))[0][0]['id'] == 'new'